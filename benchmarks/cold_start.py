@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+服务冷启动基准测试
+
+在全新进程中分别测量:
+- import: 导入 main 模块（创建执行器、环境管理器等单例）的耗时
+- listen: 从启动 uvicorn 到 /health 返回200（开始监听）的耗时
+- ready: 从启动 uvicorn 到 /ready 返回200（启动预热完成）的耗时
+
+用法:
+    python -m benchmarks.cold_start                  # 默认各运行5次
+    python -m benchmarks.cold_start --runs 10 --port 8765
+    python -m benchmarks.cold_start --clear-cache    # 每次运行前清除conda探测缓存
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.common import percentile
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def clear_conda_cache():
+    from sandbox.conda import conda_probe
+    path = conda_probe.store.path
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def measure_import() -> float:
+    """在新进程中导入 main 模块，返回导入耗时（秒）"""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_startup(port: int, endpoint: str, timeout: float = 180.0) -> float:
+    """启动 uvicorn，返回直到 endpoint 返回200的耗时（秒）"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"服务启动失败，退出码 {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{endpoint}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("等待服务启动超时")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": statistics.median(values),
+        "p95": percentile(values, 95),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SimplePySandbox 冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的运行次数")
+    parser.add_argument("--port", type=int, default=8765, help="测量启动耗时时使用的端口")
+    parser.add_argument("--clear-cache", action="store_true", help="每次运行前清除conda探测缓存")
+    parser.add_argument("--skip-startup", action="store_true", help="只测量导入耗时")
+    args = parser.parse_args()
+
+    measurements = {"import": measure_import}
+    if not args.skip_startup:
+        measurements["listen"] = lambda: measure_startup(args.port, "/health")
+        measurements["ready"] = lambda: measure_startup(args.port, "/ready")
+
+    print(f"{'阶段':<10}{'中位数':>12}{'P95':>12}{'最小值':>12}{'最大值':>12}")
+    print("-" * 58)
+    for name, measure in measurements.items():
+        values = []
+        for _ in range(args.runs):
+            if args.clear_cache:
+                clear_conda_cache()
+            values.append(measure())
+        stats = summarize(values)
+        print(
+            f"{name:<10}{stats['median'] * 1e3:>10.1f}ms{stats['p95'] * 1e3:>10.1f}ms"
+            f"{stats['min'] * 1e3:>10.1f}ms{stats['max'] * 1e3:>10.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
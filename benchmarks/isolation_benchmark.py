@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+隔离后端基准测试
+
+通过 CodeExecutor.execute 端到端执行一段最小代码，对比:
+- none: 直接运行子进程
+- namespace: Linux命名空间隔离（unshare + 引导解释器内完成挂载）
+以及两者在启用预热解释器池时的表现，输出每次执行耗时的中位数和P95
+
+用法:
+    python -m benchmarks.isolation_benchmark
+    python -m benchmarks.isolation_benchmark --runs 50 --warm-pool 2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile
+from config.settings import settings
+
+CODE = "print('ok')"
+
+
+async def measure(executor, runs: int) -> List[float]:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await executor.execute(code=CODE, timeout=30)
+        durations.append(time.perf_counter() - start)
+        if not result.success:
+            raise RuntimeError(f"执行失败: {result.error} {result.stderr[-300:]}")
+    return durations
+
+
+async def run(args):
+    from sandbox.executor import code_executor
+    from sandbox.isolation import isolation
+    from sandbox.warm_pool import warm_pool
+
+    backends = ["none"]
+    error = isolation.check()
+    if error:
+        print(f"⚠️ 跳过 namespace: {error}")
+    else:
+        backends.append("namespace")
+
+    pool_sizes = [0] + ([args.warm_pool] if args.warm_pool > 0 else [])
+    baseline = None
+    print(f"{'后端':<12}{'预热池':>8}{'中位数':>12}{'P95':>12}{'相对none':>12}")
+    print("-" * 56)
+    for pool_size in pool_sizes:
+        for backend in backends:
+            settings.ISOLATION_BACKEND = backend
+            settings.WARM_POOL_SIZE = pool_size
+            warm_pool.shutdown()
+            if pool_size:
+                warm_pool.ensure("default", sys.executable)
+                await asyncio.sleep(1.0)
+            await measure(code_executor, 3)
+            durations = await measure(code_executor, args.runs)
+            median = statistics.median(durations)
+            if backend == "none":
+                baseline = median
+            delta = f"{(median - baseline) * 1e3:+.1f}ms"
+            print(
+                f"{backend:<12}{pool_size:>8}{median * 1e3:>10.1f}ms"
+                f"{percentile(durations, 95) * 1e3:>10.1f}ms{delta:>12}"
+            )
+    warm_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SimplePySandbox 隔离后端基准测试")
+    parser.add_argument("--runs", type=int, default=30, help="每种配置的执行次数")
+    parser.add_argument("--warm-pool", type=int, default=2, help="预热池大小，0表示只测冷启动")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+SimplePySandbox 负载测试
+
+可以直接在进程内驱动ASGI应用（无需启动服务），也可以压测一个已运行的服务。
+结果保存为JSON，便于在不同提交之间对比、发现性能回退。
+
+用法:
+    # 进程内ASGI应用，并发8，共200个请求，默认混合负载
+    python -m benchmarks.load_test --concurrency 8 --requests 200
+
+    # 压测本地uvicorn服务，仅CPU密集型负载
+    python -m benchmarks.load_test --url http://localhost:8000 --mix cpu
+
+    # 与基线结果对比，p95/p99或吞吐退化超过10%时返回非零退出码
+    python -m benchmarks.load_test --output new.json --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+# 允许以 python benchmarks/load_test.py 方式运行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile, git_revision
+from benchmarks.workloads import WORKLOADS, MIXES, parse_mix, build_schedule
+
+
+def summarize(latencies: List[float], wall_time: float) -> Dict[str, float]:
+    """汇总延迟分布"""
+    return {
+        "count": len(latencies),
+        "throughput_rps": len(latencies) / wall_time if wall_time > 0 else 0.0,
+        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "min": min(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else 0.0,
+    }
+
+
+@asynccontextmanager
+async def open_client(url: Optional[str], concurrency: int):
+    """创建HTTP客户端，未指定url时直接挂载进程内ASGI应用"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(600.0)
+
+    if url:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+            yield client
+        return
+
+    from main import app
+
+    # ASGITransport不会触发lifespan，这里手动进入以保持与真实服务一致
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", limits=limits, timeout=timeout
+        ) as client:
+            yield client
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float):
+    """轮询 /ready 直到服务完成启动预热和自检，避免这段时间计入测试结果"""
+    deadline = time.perf_counter() + timeout
+    status = None
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get("/ready")
+            status = response.status_code
+            if status == 200:
+                return
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务在 {timeout:g} 秒内没有就绪（/ready: {status}）")
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    schedule: list,
+    concurrency: int,
+    duration: Optional[float] = None
+) -> Dict:
+    """以固定并发执行请求序列，返回原始记录"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in schedule:
+        queue.put_nowait(item)
+
+    records = []
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        index = 0
+        while True:
+            if deadline and time.perf_counter() >= deadline:
+                return
+            try:
+                name, payload = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                if not deadline:
+                    return
+                # 按时长运行时循环使用请求序列
+                name, payload = schedule[index % len(schedule)]
+                index += 1
+
+            start = time.perf_counter()
+            record = {"workload": name, "ok": False, "status": None, "execution_time": None}
+            try:
+                response = await client.post("/execute", json=payload)
+                record["status"] = response.status_code
+                if response.status_code == 200:
+                    result = response.json()
+                    record["ok"] = WORKLOADS[name].check(result)
+                    record["execution_time"] = result.get("execution_time")
+            except httpx.HTTPError as e:
+                record["error"] = str(e)
+            record["latency"] = time.perf_counter() - start
+            records.append(record)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"records": records, "wall_time": time.perf_counter() - start}
+
+
+def build_report(run: Dict, args: argparse.Namespace, mix: Dict[str, int]) -> Dict:
+    """把原始记录整理成可对比的结果"""
+    records = run["records"]
+    wall_time = run["wall_time"]
+
+    workloads = {}
+    for name in mix:
+        subset = [r for r in records if r["workload"] == name]
+        if not subset:
+            continue
+        stats = summarize([r["latency"] for r in subset], wall_time)
+        stats["errors"] = sum(1 for r in subset if not r["ok"])
+        server_times = [r["execution_time"] for r in subset if r["execution_time"] is not None]
+        stats["server_p50"] = percentile(server_times, 50)
+        workloads[name] = stats
+
+    overall = summarize([r["latency"] for r in records], wall_time)
+    overall["errors"] = sum(1 for r in records if not r["ok"])
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "target": args.url or "asgi",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "seed": args.seed,
+            "mix": mix,
+        },
+        "wall_time": wall_time,
+        "overall": overall,
+        "workloads": workloads,
+    }
+
+
+def compare_reports(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    与基线对比，返回退化项描述
+
+    延迟指标变大、吞吐变小超过阈值（百分比）即视为退化
+    """
+    regressions = []
+    sections = [("overall", current["overall"], baseline.get("overall", {}))]
+    for name, stats in current["workloads"].items():
+        sections.append((name, stats, baseline.get("workloads", {}).get(name, {})))
+
+    for name, now, before in sections:
+        for metric in ("p50", "p95", "p99"):
+            old, new = before.get(metric), now.get(metric)
+            if old and new and (new - old) / old * 100 > threshold:
+                regressions.append(f"{name}.{metric}: {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+        old, new = before.get("throughput_rps"), now.get("throughput_rps")
+        if old and new is not None and (old - new) / old * 100 > threshold:
+            regressions.append(f"{name}.throughput_rps: {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def print_report(report: Dict):
+    """打印结果表格"""
+    header = f"{'负载':<14}{'请求数':>8}{'错误':>6}{'RPS':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["workloads"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        print(
+            f"{name:<14}{stats['count']:>8}{stats['errors']:>6}{stats['throughput_rps']:>9.2f}"
+            f"{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}"
+        )
+    print(f"\n总耗时: {report['wall_time']:.2f}秒")
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    mix = parse_mix(args.mix)
+    schedule = build_schedule(mix, args.requests, args.seed)
+
+    async with open_client(args.url, args.concurrency) as client:
+        await wait_until_ready(client, args.ready_timeout)
+        if args.warmup:
+            await run_load(client, build_schedule({"hello_world": 1}, args.warmup, args.seed), args.concurrency)
+        run = await run_load(client, schedule, args.concurrency, args.duration)
+
+    report = build_report(run, args, mix)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️  相对 {args.compare} 退化超过 {args.threshold}%:")
+            for item in regressions:
+                print(f"  {item}")
+            return 1
+        print(f"\n✅ 相对 {args.compare} 无明显退化")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SimplePySandbox 负载测试")
+    parser.add_argument("--url", default=None, help="服务地址，不指定时在进程内运行ASGI应用")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=100, help="请求总数")
+    parser.add_argument("--duration", type=float, default=None, help="按时长运行（秒），优先于请求总数")
+    parser.add_argument("--mix", default="default", help=f"负载配比: {', '.join(MIXES)} 或 name=weight,...")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，保证请求序列可复现")
+    parser.add_argument("--warmup", type=int, default=5, help="正式测试前的预热请求数")
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="等待服务 /ready 返回200的最长时间（秒）")
+    parser.add_argument("--output", default=None, help="结果JSON保存路径")
+    parser.add_argument("--compare", default=None, help="用于对比的基线结果JSON")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定退化的阈值（百分比）")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+执行器热路径微基准测试
+
+覆盖临时目录创建/清理、输入文件准备、输出文件收集、文件名校验、
+代码静态校验以及大响应的序列化与渲染。每次运行的结果追加到历史文件，
+并与上一次结果对比，便于观察这些路径上的改动带来的变化。
+
+用法:
+    python -m benchmarks.micro_benchmarks                 # 运行全部并与上次结果对比
+    python -m benchmarks.micro_benchmarks -k serialize    # 只运行名称包含 serialize 的用例
+    python -m benchmarks.micro_benchmarks --no-save       # 不写入历史文件
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# 允许以 python benchmarks/micro_benchmarks.py 方式运行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import git_revision
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "micro_history.jsonl")
+
+
+class MicroBenchmark:
+    """
+    单个微基准用例
+
+    setup 在用例运行前创建测试数据（未被 -k 选中的用例不会创建），
+    teardown 由 main() 在结束时对所有用例调用，必须能在 setup 未运行时安全调用
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], object],
+        setup: Optional[Callable[[], None]] = None,
+        teardown: Optional[Callable[[], None]] = None
+    ):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.teardown = teardown
+
+    def run(self, rounds: int, min_time: float) -> Dict[str, float]:
+        """
+        运行用例
+
+        先自动确定每轮的调用次数使单轮耗时不少于 min_time，
+        再重复 rounds 轮，统计单次调用耗时
+        """
+        if self.setup:
+            self.setup()
+        timer = timeit.Timer(self.func)
+        number, _ = timer.autorange()
+        while number * self._single(timer) < min_time and number < 1_000_000:
+            number *= 2
+
+        per_call = [t / number for t in timer.repeat(repeat=rounds, number=number)]
+        return {
+            "min": min(per_call),
+            "median": statistics.median(per_call),
+            "mean": statistics.mean(per_call),
+            "stddev": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+            "ops_per_sec": 1.0 / statistics.median(per_call),
+            "rounds": rounds,
+            "number": number,
+        }
+
+    @staticmethod
+    def _single(timer: timeit.Timer) -> float:
+        return timer.timeit(number=1)
+
+
+def build_benchmarks() -> List[MicroBenchmark]:
+    """构造所有用例及其测试数据"""
+    from models.request import ExecuteResponse
+    from sandbox.executor import CodeExecutor
+    from sandbox.security import SecurityPolicy, StaticAnalyzer
+    from sandbox.utils import create_secure_temp_dir, cleanup_temp_dir, validate_filename
+
+    # 微基准只调用内部方法，不需要conda检查
+    executor = CodeExecutor.__new__(CodeExecutor)
+    loop = asyncio.new_event_loop()
+    benchmarks = []
+
+    def temp_dir_roundtrip():
+        cleanup_temp_dir(create_secure_temp_dir())
+
+    benchmarks.append(MicroBenchmark("temp_dir_create_cleanup", temp_dir_roundtrip))
+
+    # 输入文件: 大量小文件 / 少量大文件，测试数据和临时目录在用例运行前才创建
+    payloads = {
+        "small": lambda: {f"small_{i}.txt": base64.b64encode(os.urandom(1024)).decode() for i in range(200)},
+        "large": lambda: {f"large_{i}.bin": base64.b64encode(os.urandom(4 * 1024 * 1024)).decode() for i in range(4)},
+    }
+    fixtures: Dict[str, object] = {}
+
+    def payload(size: str) -> Dict[str, str]:
+        if size not in fixtures:
+            fixtures[size] = payloads[size]()
+        return fixtures[size]
+
+    def temp_dir_setup(name: str, size: str, populate: bool) -> Callable[[], None]:
+        def setup():
+            fixtures[name] = create_secure_temp_dir()
+            fixtures[name + "_files"] = payload(size)
+            if populate:
+                loop.run_until_complete(executor._prepare_input_files(fixtures[name], payload(size)))
+        return setup
+
+    def temp_dir_teardown(name: str) -> Callable[[], None]:
+        def teardown():
+            path = fixtures.pop(name, None)
+            if path:
+                cleanup_temp_dir(path)
+        return teardown
+
+    for name, size in (("200x1KB", "small"), ("4x4MB", "large")):
+        prepare, collect = f"prepare_{size}", f"collect_{size}"
+        benchmarks.append(MicroBenchmark(
+            f"prepare_input_files_{name}",
+            lambda key=prepare: loop.run_until_complete(
+                executor._prepare_input_files(fixtures[key], fixtures[key + "_files"])
+            ),
+            setup=temp_dir_setup(prepare, size, populate=False),
+            teardown=temp_dir_teardown(prepare),
+        ))
+        # 输出文件收集
+        benchmarks.append(MicroBenchmark(
+            f"collect_output_files_{name}",
+            lambda key=collect: loop.run_until_complete(executor._collect_output_files(fixtures[key])),
+            setup=temp_dir_setup(collect, size, populate=True),
+            teardown=temp_dir_teardown(collect),
+        ))
+
+    # 文件名校验
+    filenames = [f"data/report_{i}.csv" for i in range(500)] + ["../etc/passwd", "CON.txt", "a" * 300]
+
+    def validate_many():
+        for name in filenames:
+            validate_filename(name)
+
+    benchmarks.append(MicroBenchmark("validate_filename_x503", validate_many))
+
+    # 代码静态校验（约100k字符）
+    line = "value_{0} = math.sqrt({0}) * random.random()  # 计算\n"
+    large_code = "import math\nimport random\n" + "".join(line.format(i) for i in range(1800))
+    benchmarks.append(MicroBenchmark(
+        f"security_validate_code_{len(large_code) // 1000}k_chars",
+        lambda: SecurityPolicy.validate_code(large_code),
+    ))
+    # 执行路径上的静态分析：相同代码再次提交时命中LRU缓存
+    analyzer = StaticAnalyzer(cache_size=16)
+    benchmarks.append(MicroBenchmark(
+        f"static_analysis_cached_{len(large_code) // 1000}k_chars",
+        lambda: analyzer.analyze(large_code),
+    ))
+
+    # 大响应序列化: 5MB stdout + 5个2MB文件
+    large_response = ExecuteResponse(
+        success=True,
+        stdout="x" * (5 * 1024 * 1024),
+        stderr="",
+        execution_time=1.0,
+        files={f"out_{i}.bin": base64.b64encode(os.urandom(2 * 1024 * 1024)).decode() for i in range(5)},
+    )
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from sandbox.fast_json import FastJSONResponse
+
+    benchmarks.append(MicroBenchmark(
+        "serialize_response_jsonable_encoder",
+        lambda: json.dumps(jsonable_encoder(large_response)),
+    ))
+    benchmarks.append(MicroBenchmark(
+        "serialize_response_model_dump_json",
+        lambda: large_response.model_dump_json(),
+    ))
+
+    # 端到端对比: FastAPI默认路径（response_model校验 + jsonable_encoder + JSONResponse）与 FastJSONResponse
+    response_field = create_response_field(name="Response_execute", type_=ExecuteResponse)
+
+    async def fastapi_default_render():
+        content = await serialize_response(field=response_field, response_content=large_response, is_coroutine=True)
+        return JSONResponse(content).body
+
+    benchmarks.append(MicroBenchmark(
+        "render_response_fastapi_default",
+        lambda: loop.run_until_complete(fastapi_default_render()),
+    ))
+    benchmarks.append(MicroBenchmark(
+        "render_response_fast_json",
+        lambda: FastJSONResponse(large_response).body,
+    ))
+
+    return benchmarks
+
+
+def load_previous(path: str) -> Optional[Dict]:
+    """读取历史文件中最近一次结果"""
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SimplePySandbox 微基准测试")
+    parser.add_argument("-k", dest="keyword", default=None, help="只运行名称包含该关键字的用例")
+    parser.add_argument("--rounds", type=int, default=5, help="每个用例重复的轮数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮最少耗时（秒）")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="结果历史文件（JSON Lines）")
+    parser.add_argument("--compare", default=None, help="用于对比的结果文件，默认对比历史中最近一次")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定退化的阈值（百分比）")
+    parser.add_argument("--no-save", action="store_true", help="不把结果写入历史文件")
+    args = parser.parse_args()
+
+    if args.compare:
+        previous = load_previous(args.compare)
+    else:
+        previous = load_previous(args.history)
+    previous_results = (previous or {}).get("results", {})
+
+    results = {}
+    regressions = []
+    print(f"{'用例':<40}{'中位数':>12}{'最小值':>12}{'ops/s':>12}{'变化':>10}")
+    print("-" * 86)
+    benchmarks = build_benchmarks()
+    try:
+        for bench in benchmarks:
+            if args.keyword and args.keyword not in bench.name:
+                continue
+            stats = bench.run(args.rounds, args.min_time)
+            results[bench.name] = stats
+
+            delta = ""
+            before = previous_results.get(bench.name)
+            if before:
+                change = (stats["median"] - before["median"]) / before["median"] * 100
+                delta = f"{change:+.1f}%"
+                if change > args.threshold:
+                    regressions.append(f"{bench.name}: {before['median'] * 1e3:.3f}ms -> {stats['median'] * 1e3:.3f}ms")
+            print(
+                f"{bench.name:<40}{stats['median'] * 1e3:>10.3f}ms{stats['min'] * 1e3:>10.3f}ms"
+                f"{stats['ops_per_sec']:>12.1f}{delta:>10}"
+            )
+    finally:
+        # 无论用例是否运行、是否中途出错，都清理临时目录
+        for bench in benchmarks:
+            if bench.teardown:
+                bench.teardown()
+
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"\n结果已追加到 {args.history}")
+
+    if regressions:
+        print(f"\n⚠️  中位数退化超过 {args.threshold}%:")
+        for item in regressions:
+            print(f"  {item}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
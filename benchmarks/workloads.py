@@ -0,0 +1,137 @@
+"""
+基准测试负载定义
+每种负载描述一次 /execute 请求以及判定其结果是否符合预期的规则
+"""
+
+import base64
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+
+@dataclass
+class Workload:
+    """单类请求负载"""
+    name: str
+    description: str
+    build_payload: Callable[[random.Random], dict]
+    # 判断响应是否为预期结果（例如超时负载预期返回超时错误）
+    check: Callable[[dict], bool] = field(default=lambda result: result.get("success") is True)
+
+
+def _hello_world(rng: random.Random) -> dict:
+    return {"code": "print('Hello, World!')", "timeout": 10}
+
+
+def _file_heavy(rng: random.Random) -> dict:
+    payload_bytes = rng.randbytes(64 * 1024)
+    files = {
+        f"input_{i}.bin": base64.b64encode(payload_bytes).decode("utf-8")
+        for i in range(16)
+    }
+    code = """
+import os
+import hashlib
+
+digests = []
+for name in sorted(os.listdir('.')):
+    if name.startswith('input_'):
+        with open(name, 'rb') as f:
+            data = f.read()
+        digests.append(hashlib.sha256(data).hexdigest())
+        with open(name.replace('input_', 'output_'), 'wb') as f:
+            f.write(data[::-1])
+print(len(digests))
+"""
+    return {"code": code, "timeout": 20, "files": files}
+
+
+def _import_heavy(rng: random.Random) -> dict:
+    code = """
+import asyncio
+import decimal
+import email.mime.multipart
+import http.client
+import json
+import logging
+import sqlite3
+import statistics
+import unittest
+import xml.etree.ElementTree
+import zipfile
+print('imported')
+"""
+    return {"code": code, "timeout": 20}
+
+
+def _cpu_bound(rng: random.Random) -> dict:
+    n = rng.randint(1_500_000, 2_500_000)
+    code = f"""
+total = 0
+for i in range({n}):
+    total += i * i % 7
+print(total)
+"""
+    return {"code": code, "timeout": 30}
+
+
+def _timeout(rng: random.Random) -> dict:
+    return {"code": "while True:\n    pass\n", "timeout": 1}
+
+
+def _is_timeout(result: dict) -> bool:
+    return result.get("success") is False and "超时" in (result.get("error") or "")
+
+
+WORKLOADS: Dict[str, Workload] = {
+    w.name: w for w in [
+        Workload("hello_world", "最小请求，衡量平台固定开销", _hello_world),
+        Workload("file_heavy", "16个64KB输入文件并生成同样数量的输出文件", _file_heavy),
+        Workload("import_heavy", "导入大量标准库模块", _import_heavy),
+        Workload("cpu_bound", "约0.2-0.5秒的纯Python计算", _cpu_bound),
+        Workload("timeout", "死循环，预期在1秒后超时", _timeout, check=_is_timeout),
+    ]
+}
+
+
+# 预设的混合负载，值为各负载的权重
+MIXES: Dict[str, Dict[str, int]] = {
+    "default": {"hello_world": 50, "file_heavy": 15, "import_heavy": 15, "cpu_bound": 15, "timeout": 5},
+    "hello": {"hello_world": 1},
+    "io": {"file_heavy": 3, "import_heavy": 1},
+    "cpu": {"cpu_bound": 1},
+}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """
+    解析负载配比
+
+    Args:
+        spec: 预设名称（如 default），或 name=weight 的逗号分隔列表
+
+    Returns:
+        Dict[str, int]: 负载名称到权重的映射
+    """
+    if spec in MIXES:
+        return dict(MIXES[spec])
+
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in WORKLOADS:
+            raise ValueError(f"未知负载: {name}，可选: {', '.join(WORKLOADS)}")
+        mix[name] = int(weight) if weight else 1
+    return mix
+
+
+def build_schedule(mix: Dict[str, int], total: int, seed: int) -> List[Tuple[str, dict]]:
+    """按权重生成可复现的请求序列"""
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    schedule = []
+    for name in rng.choices(names, weights=weights, k=total):
+        schedule.append((name, WORKLOADS[name].build_payload(rng)))
+    return schedule
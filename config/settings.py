@@ -25,12 +25,106 @@ class Settings(BaseSettings):
     MAX_CODE_LENGTH: int = 100000
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     
+    # 执行前静态分析: off 不检查 / warn 只记录日志 / enforce 拒绝未通过的代码（HTTP 400）
+    STATIC_ANALYSIS_MODE: str = "off"
+    STATIC_ANALYSIS_CACHE_SIZE: int = 1024  # 分析结果LRU缓存条目数
+    
     # Conda环境设置
     CONDA_BASE_PATH: str = os.path.expanduser("~/miniconda3")
     CONDA_ENVS_PATH: str = os.path.expanduser("~/miniconda3/envs")
     
     # 临时目录
     TEMP_DIR: str = "/tmp/sandbox"
+    
+    # 多工作进程设置
+    WORKERS: int = 1  # API工作进程数，大于1时各进程通过共享状态目录协调
+    SHARED_STATE_DIR: str = ""  # 共享状态目录（JSON存储与文件锁），为空时使用 TEMP_DIR/state
+    
+    # 隔离后端: none 直接运行子进程 / namespace 使用Linux命名空间隔离每次执行
+    ISOLATION_BACKEND: str = "none"
+    ISOLATION_NETWORK: bool = False  # 隔离时是否允许访问网络（False时使用空的网络命名空间）
+    ISOLATION_TMPFS_SIZE: str = "64m"  # 私有 /tmp 与 /dev/shm 的大小
+    ISOLATION_READONLY_PATHS: str = ""  # 额外只读挂载的路径，逗号分隔
+    
+    # 执行结束后终止遗留的后台/守护进程，并把服务进程设为 child subreaper（仅Linux）
+    PROCESS_REAPER_ENABLED: bool = True
+    
+    # 请求合并（single-flight）：内容相同的并发执行只运行一次，请求中的 coalesce 字段可覆盖
+    COALESCE_ENABLED: bool = False
+    COALESCE_MAX_WAITERS: int = 32  # 每个执行最多合并的请求数，超过后单独运行
+    IDEMPOTENCY_TTL: int = 3600  # 带 Idempotency-Key 的执行结果保存时间（秒）
+    
+    # 执行调度：同时执行的任务数达到上限后按预计耗时排队（短作业优先），0表示不限制
+    EXECUTION_SLOTS: int = 0
+    SCHEDULER_AGING: float = 1.0  # 每排队1秒，排序用的预计耗时减少的秒数，防止长作业一直被插队
+    RUNTIME_HISTORY_SIZE: int = 4096  # 按代码哈希记录运行时间的条目数上限
+    
+    # 自适应并发：按主机压力（PSI、负载、可用内存）以AIMD方式调整执行槽数量（仅Linux）
+    ADAPTIVE_CONCURRENCY: bool = False
+    CONCURRENCY_MIN: int = 1
+    CONCURRENCY_MAX: int = 0  # 0表示CPU核数的2倍
+    CONCURRENCY_INTERVAL: float = 1.0  # 调整周期（秒）
+    CONCURRENCY_CPU_PRESSURE: float = 40.0  # CPU some 停顿比例（%）超过时减少执行槽
+    CONCURRENCY_MEMORY_PRESSURE: float = 5.0  # 内存 some 停顿比例（%）
+    CONCURRENCY_IO_PRESSURE: float = 40.0  # IO some 停顿比例（%）
+    CONCURRENCY_MAX_LOAD: float = 1.5  # 每核1分钟负载超过时不再增加
+    CONCURRENCY_MIN_FREE_MEMORY: float = 0.15  # 可用内存比例低于时减少执行槽
+    CONCURRENCY_SHED_FREE_MEMORY: float = 0.05  # 可用内存比例低于时拒绝新的执行（503）
+    
+    # 环境熔断：同一环境连续出现基础设施故障（解释器无法启动等，不含用户代码错误）后快速失败，0表示禁用
+    CIRCUIT_BREAKER_THRESHOLD: int = 3
+    CIRCUIT_BREAKER_PROBE_INTERVAL: float = 30.0  # 探测 degraded 环境的间隔（秒）
+    CIRCUIT_BREAKER_REBUILD: bool = False  # 探测失败时按原安装脚本重建环境
+    
+    # 多租户：按API密钥识别租户，分别限制请求速率、并发执行数和每个时间窗口的CPU时间，为空时不启用
+    TENANTS_FILE: str = ""  # 租户配置JSON文件，修改后自动重新加载
+    
+    # CPU亲和性（仅Linux）：每次执行独占分配的核，保留部分核给API工作进程
+    CPU_AFFINITY_ENABLED: bool = False
+    CPU_RESERVED_CORES: int = 1  # 保留给API工作进程（uvicorn）的核数，沙盒进程不会运行在这些核上
+    CPU_CORES_PER_EXECUTION: int = 1  # 每次执行独占的核数
+    PROCESS_QOS_ENABLED: bool = False  # 按请求头 X-Execution-Priority（high/normal/low）设置沙盒进程的nice与IO优先级
+    
+    # 预热解释器池
+    WARM_POOL_SIZE: int = 0  # 每个环境保持的空闲预热解释器数，0表示禁用
+    WARM_POOL_PRELOAD: str = ""  # 预热时导入的模块，逗号分隔，如 numpy,pandas
+    WARM_POOL_MAX_ENVS: int = 4  # 同时保持预热的环境数上限
+    WARM_POOL_IDLE_TTL: int = 600  # 环境超过该时间（秒）未使用则回收其预热解释器
+    
+    # 启动预热（完成前 /ready 返回503）
+    WARMUP_ENABLED: bool = True  # 是否在启动时执行预热和自检
+    WARMUP_ENVIRONMENTS: int = 3  # 预热最近使用的前N个环境
+    WARMUP_TIMEOUT: float = 120.0  # 等待预热解释器就绪的最长时间（秒），超时后仍标记为就绪
+    
+    # 集群设置: standalone / worker / coordinator
+    NODE_ROLE: str = "standalone"
+    NODE_ID: str = ""  # 工作节点ID，为空时使用 主机名-端口
+    NODE_URL: str = ""  # 工作节点对协调节点可见的地址，如 http://10.0.0.5:8000
+    NODE_CAPACITY: int = 0  # 工作节点可同时执行的任务数，0表示 EXECUTION_SLOTS（未设置时为CPU核数）
+    COORDINATOR_URL: str = ""  # 工作节点上报心跳的协调节点地址
+    CLUSTER_TOKEN: str = ""  # 节点间通信令牌，集群模式下必须设置；心跳、节点列表和注销请求必须携带 X-Cluster-Token
+    HEARTBEAT_INTERVAL: float = 5.0  # 心跳间隔（秒）
+    NODE_TIMEOUT: float = 15.0  # 超过该时间没有心跳的节点不再接收任务
+    DISPATCH_RETRIES: int = 2  # 节点不可达时换节点重试的次数
+    
+    # 输出捕获设置
+    MAX_OUTPUT_SIZE: int = 1024 * 1024  # 每个输出流在内存中保留的最大字节数（头尾各一半）
+    OUTPUT_SPILL_ENABLED: bool = True  # 超出部分是否写入溢出文件
+    MAX_SPILL_SIZE: int = 100 * 1024 * 1024  # 单个溢出文件的最大字节数
+    OUTPUT_SPILL_TTL: int = 3600  # 溢出文件保留时间（秒）
+    
+    # HTTP压缩设置
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # 小于该字节数的响应不压缩
+    GZIP_COMPRESSION_LEVEL: int = 6
+    ZSTD_COMPRESSION_LEVEL: int = 3  # 需要安装 zstandard
+    MAX_REQUEST_BODY_SIZE: int = 64 * 1024 * 1024  # 压缩请求体解压后的最大字节数
+    
+    # 链路追踪设置: none / jsonl / otlp
+    TRACE_EXPORTER: str = "none"
+    TRACE_JSONL_PATH: str = "logs/traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACE_SERVICE_NAME: str = "simplepysandbox"
 
 
 # 创建全局设置实例
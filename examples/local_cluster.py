@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+本地集群示例
+在一台机器上启动一个协调节点和多个工作节点（不同端口），
+发送一批请求观察负载分布，并可模拟工作节点故障验证重试
+
+用法:
+    python examples/local_cluster.py                    # 协调节点8000，工作节点8001-8003
+    python examples/local_cluster.py --workers 4 --requests 40
+    python examples/local_cluster.py --kill-one         # 中途杀掉一个工作节点
+    python examples/local_cluster.py --keep-running     # 演示结束后保持集群运行，Ctrl+C退出
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_DIR = os.path.join(PROJECT_ROOT, "logs", "cluster")
+
+
+def start_node(name: str, port: int, env: dict) -> subprocess.Popen:
+    """以独立进程启动一个节点，日志写入 logs/cluster/<name>.log"""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log = open(os.path.join(LOG_DIR, f"{name}.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_for(predicate, timeout: float, message: str):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if predicate():
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"等待超时: {message}")
+
+
+def run_batch(coordinator: str, count: int, concurrency: int) -> Counter:
+    """并发发送一批请求，返回每个节点处理的请求数"""
+    code = "import time\ntime.sleep(0.2)\nprint('ok')"
+
+    def one(_):
+        response = requests.post(f"{coordinator}/execute", json={"code": code, "timeout": 10}, timeout=60)
+        node = response.headers.get("X-Sandbox-Node", f"HTTP {response.status_code}")
+        return node if response.ok and response.json().get("success") else f"失败({node})"
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return Counter(pool.map(one, range(count)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动本地SimplePySandbox集群")
+    parser.add_argument("--port", type=int, default=8000, help="协调节点端口，工作节点依次使用后续端口")
+    parser.add_argument("--workers", type=int, default=3, help="工作节点数量")
+    parser.add_argument("--capacity", type=int, default=2, help="每个工作节点的并发容量")
+    parser.add_argument("--requests", type=int, default=30, help="演示请求数")
+    parser.add_argument("--concurrency", type=int, default=6, help="演示请求并发数")
+    parser.add_argument("--kill-one", action="store_true", help="第一批请求后杀掉一个工作节点，再发送一批")
+    parser.add_argument("--keep-running", action="store_true", help="演示结束后保持集群运行")
+    args = parser.parse_args()
+
+    coordinator = f"http://127.0.0.1:{args.port}"
+    cluster_env = {"HEARTBEAT_INTERVAL": "1", "NODE_TIMEOUT": "3", "CLUSTER_TOKEN": "local-cluster-demo"}
+    token_headers = {"X-Cluster-Token": cluster_env["CLUSTER_TOKEN"]}
+    processes = {}
+
+    try:
+        print(f"🧭 启动协调节点 {coordinator}")
+        processes["coordinator"] = start_node("coordinator", args.port, {**cluster_env, "NODE_ROLE": "coordinator"})
+        wait_for(lambda: requests.get(f"{coordinator}/health", timeout=1).ok, 60, "协调节点启动")
+
+        for i in range(1, args.workers + 1):
+            port = args.port + i
+            name = f"worker-{port}"
+            print(f"🛠️  启动工作节点 {name}")
+            processes[name] = start_node(name, port, {
+                **cluster_env,
+                "NODE_ROLE": "worker",
+                "NODE_ID": name,
+                "NODE_URL": f"http://127.0.0.1:{port}",
+                "NODE_CAPACITY": str(args.capacity),
+                "COORDINATOR_URL": coordinator,
+            })
+
+        wait_for(
+            lambda: requests.get(f"{coordinator}/cluster/nodes", headers=token_headers, timeout=1).json()["healthy"] == args.workers,
+            120, "所有工作节点注册"
+        )
+        print(f"✅ {args.workers} 个工作节点已注册\n")
+
+        print(f"📨 发送 {args.requests} 个请求（并发 {args.concurrency}）")
+        for node, count in sorted(run_batch(coordinator, args.requests, args.concurrency).items()):
+            print(f"  {node}: {count}")
+
+        if args.kill_one:
+            victim = f"worker-{args.port + 1}"
+            print(f"\n💥 杀掉 {victim}，协调节点尚未感知时的请求会自动换节点重试")
+            processes[victim].send_signal(signal.SIGKILL)
+            processes[victim].wait()
+            for node, count in sorted(run_batch(coordinator, args.requests, args.concurrency).items()):
+                print(f"  {node}: {count}")
+
+        print("\n📋 节点状态:")
+        for node in requests.get(f"{coordinator}/cluster/nodes", headers=token_headers, timeout=5).json()["nodes"]:
+            state = "健康" if node["healthy"] else "不可用"
+            print(f"  {node['node_id']}: {state}, 负载 {node['load']:.2f}, 失败 {node['failures']}")
+            for env, stats in sorted(node["environment_stats"].items()):
+                print(f"    {env}: 预热 {stats['warm']}, 命中率 {stats['hit_rate']:.0%}, 近期执行 {stats['recent']}")
+
+        if args.keep_running:
+            print(f"\n集群运行中，协调节点地址 {coordinator}，日志位于 {LOG_DIR}，按 Ctrl+C 退出")
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,97 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Form, File, UploadFile, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, Response
 from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+import asyncio
+import codecs
+import json
+import time
 import uvicorn
 from datetime import datetime, timezone
 
-from models.request import ExecuteRequest, ExecuteResponse, HealthResponse
+from models.request import (
+    ExecuteRequest, ExecuteResponse, ExecutionEstimate, HealthResponse, ReadinessResponse, ReadinessCheck
+)
 from models.environment import (
     EnvironmentScript, EnvironmentResponse, EnvironmentListResponse,
     ExecuteWithEnvironmentRequest
 )
-from sandbox.executor import CodeExecutor
+from models.cluster import NodeHeartbeat, ClusterNodeListResponse
+from models.tenant import TenantUsage
+from sandbox.executor import code_executor
 from sandbox.environment_manager import environment_manager
+from sandbox.output_capture import output_store
+from sandbox.compression import CompressionMiddleware
+from sandbox.fast_json import FastJSONResponse
+from sandbox.warm_pool import warm_pool
+from sandbox.conda import conda_probe
+from sandbox.reaper import process_reaper
+from sandbox.readiness import readiness
+from sandbox.security import static_analyzer
+from sandbox.metrics import metrics
+from sandbox.cancellation import DEADLINE_HEADER, parse_deadline, record_abandoned, run_until_abandoned
+from sandbox.coalescing import single_flight, coalescing_enabled, execution_key
+from sandbox.idempotency import IDEMPOTENCY_HEADER, idempotency_store
+from sandbox.runtime_history import CALLER_HEADER, runtime_history
+from sandbox.scheduler import execution_scheduler
+from sandbox.concurrency import concurrency_controller
+from sandbox.circuit_breaker import environment_breaker
+from sandbox.affinity import PRIORITY_HEADER, parse_priority
+from sandbox.tenants import tenant_manager, cpu_meter, forwarded_cpu_time
+from sandbox.cluster import (
+    cluster_registry, HeartbeatSender, is_coordinator, is_worker, verify_cluster_token, check_cluster_settings
+)
+from sandbox.tracing import tracer, generate_request_id, set_request_id, reset_request_id
 from config.settings import settings
 
-# 初始化执行器和环境管理器
-executor = CodeExecutor()
+# 执行器和环境管理器均为模块级单例，每个工作进程各一份，共享状态保存在磁盘上
+executor = code_executor
 env_manager = environment_manager
 
 
+async def warm_up(heartbeat: Optional[HeartbeatSender]):
+    """启动预热，完成后再开始向协调节点发送心跳"""
+    await readiness.warm_up(executor, env_manager)
+    if heartbeat is not None and readiness.ready:
+        heartbeat.start()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化
     print("🚀 SimplePySandbox 启动中...")
+    check_cluster_settings()
+    heartbeat = HeartbeatSender(executor, env_manager) if is_worker() else None
+    if is_coordinator():
+        print("🧭 以协调节点模式运行，执行请求将转发到工作节点")
+        startup_task = None
+    else:
+        # 用户代码遗留的孤儿进程会被挂到工作进程下，由 process_reaper 终止和回收
+        process_reaper.enable_subreaper()
+        concurrency_controller.start()
+        environment_breaker.start()
+        if settings.WARMUP_ENABLED:
+            # 预热在后台进行，不阻塞服务开始监听；完成前 /ready 返回503，工作节点在完成后才注册到协调节点
+            startup_task = asyncio.create_task(warm_up(heartbeat))
+        else:
+            readiness.skip()
+            startup_task = asyncio.create_task(conda_probe.probe_in_background())
+            if heartbeat is not None:
+                heartbeat.start()
     yield
     # 关闭时清理
     print("🛑 SimplePySandbox 正在关闭...")
+    if startup_task is not None:
+        startup_task.cancel()
+    if heartbeat is not None:
+        await heartbeat.stop()
+    await concurrency_controller.stop()
+    await environment_breaker.stop()
+    await cluster_registry.aclose()
+    warm_pool.shutdown()
+    tracer.shutdown()
 
 
 app = FastAPI(
@@ -44,7 +110,236 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 添加压缩中间件（响应按Accept-Encoding压缩，请求体支持gzip/zstd）
+app.add_middleware(CompressionMiddleware)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """为每个请求分配请求ID并记录追踪span"""
+    request_id = request.headers.get("x-request-id", "")
+    if not request_id or len(request_id) > 128 or not request_id.isprintable():
+        request_id = generate_request_id()
+    token = set_request_id(request_id)
+    try:
+        with tracer.start_span(
+            f"{request.method} {request.url.path}",
+            {"http.method": request.method, "http.target": request.url.path},
+            traceparent=request.headers.get("traceparent")
+        ) as span:
+            response = await call_next(request)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.status = "ERROR"
+            response.headers["X-Request-ID"] = request_id
+            response.headers["traceparent"] = span.traceparent
+            return response
+    finally:
+        reset_request_id(token)
+
+
+async def validate_execution_limits(code: str, timeout: int):
+    """校验代码长度与超时设置，并按 STATIC_ANALYSIS_MODE 做静态分析，不合法时抛出HTTP 400"""
+    if len(code.strip()) == 0:
+        raise HTTPException(status_code=400, detail="代码不能为空")
+    
+    if len(code) > settings.MAX_CODE_LENGTH:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"代码长度不能超过 {settings.MAX_CODE_LENGTH} 字符"
+        )
+    
+    if timeout > settings.MAX_TIMEOUT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"超时时间不能超过 {settings.MAX_TIMEOUT} 秒"
+        )
+    
+    if settings.STATIC_ANALYSIS_MODE in ("warn", "enforce"):
+        safe, message = await static_analyzer.analyze_async(code)
+        if not safe:
+            if settings.STATIC_ANALYSIS_MODE == "enforce":
+                raise HTTPException(status_code=400, detail=f"代码未通过静态检查: {message}")
+            print(f"⚠️ 代码未通过静态检查（仅警告）: {message}")
+
 
+def forward_headers(http_request: Request, deadline: Optional[float], content_type: Optional[str] = None) -> Dict[str, str]:
+    """
+    转发到工作节点的请求头
+
+    截止时间原样传递，由工作节点在到达时取消执行；调用方标识用于工作节点记录运行时间，
+    执行优先级决定工作节点上沙盒进程的nice与IO优先级
+    """
+    headers = {"Content-Type": content_type} if content_type else {}
+    if deadline is not None:
+        headers[DEADLINE_HEADER] = repr(deadline)
+    for name in (CALLER_HEADER, PRIORITY_HEADER):
+        value = http_request.headers.get(name)
+        if value:
+            headers[name] = value
+    return headers
+
+
+async def forward_execution(
+    path: str,
+    request,
+    environment: Optional[str],
+    http_request: Request,
+    deadline: Optional[float] = None
+):
+    """协调节点模式下把JSON执行请求转发到工作节点"""
+    return await cluster_registry.dispatch(
+        path, environment, request.timeout,
+        content=request.model_dump_json(exclude_none=True),
+        headers=forward_headers(http_request, deadline, "application/json")
+    )
+
+
+async def coalesced(key: str, requested: Optional[bool], operation):
+    """
+    按需通过 single-flight 合并内容相同的并发执行
+
+    Args:
+        key: execution_key() 得到的请求内容哈希
+        requested: 请求中的 coalesce 字段
+        operation: 返回执行协程的函数（本地执行或转发）
+    """
+    if not coalescing_enabled(requested):
+        return await operation()
+    result = await single_flight.run(key, operation)
+    if isinstance(result, Response):
+        # 转发得到的响应对象会被中间件就地修改响应头，每个请求使用各自的副本
+        return Response(content=result.body, status_code=result.status_code, headers=dict(result.headers))
+    return result
+
+
+async def run_execution(
+    http_request: Request,
+    kind: str,
+    params: Dict,
+    files,
+    coalesce: Optional[bool],
+    timeout: float,
+    deadline: Optional[float],
+    operation
+) -> Response:
+    """
+    执行接口的公共流程：租户配额 → 幂等键 → 请求合并 → 本地执行或转发，客户端放弃等待时取消
+
+    Args:
+        http_request: 当前HTTP请求
+        kind: 接口路径，不同接口的请求不会合并
+        params: 影响执行结果的请求参数（不含输入文件）
+        files: 输入文件
+        coalesce: 请求中的 coalesce 字段
+        timeout: 执行超时（秒）
+        deadline: parse_deadline() 的结果
+        operation: 返回执行协程的函数，结果为 ExecuteResponse 或转发得到的响应
+    """
+    key = execution_key(kind, params, files)
+    lease = await asyncio.to_thread(tenant_manager.admit, http_request)
+
+    async def metered():
+        # 合并的请求只有实际执行的一方计入CPU时间；本地执行由执行器计入，转发的执行按工作节点返回的结果计入
+        if lease is None:
+            return await operation()
+        token = cpu_meter.set(lease.charge)
+        try:
+            result = await operation()
+        finally:
+            cpu_meter.reset(token)
+        if isinstance(result, Response):
+            await lease.charge(forwarded_cpu_time(result))
+        return result
+
+    async def respond() -> Response:
+        result = await coalesced(key, coalesce, metered)
+        if isinstance(result, Response):
+            return result
+        # 直接返回响应对象，跳过FastAPI对大响应的二次校验和jsonable_encoder转换
+        return FastJSONResponse(result)
+
+    detached = False
+
+    async def respond_detached() -> Response:
+        # 带幂等键的执行在客户端断开后继续运行，并发名额随执行本身归还，而不是随请求
+        nonlocal detached
+        detached = True
+        try:
+            return await respond()
+        finally:
+            if lease is not None:
+                await lease.release()
+
+    try:
+        idempotency_key = http_request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is not None:
+            response = await run_until_abandoned(
+                lambda: idempotency_store.run(
+                    idempotency_key, key, timeout, respond_detached, scope=lease.tenant if lease is not None else None
+                ),
+                http_request, timeout, deadline
+            )
+        else:
+            response = await run_until_abandoned(respond, http_request, timeout, deadline)
+    finally:
+        # 返回保存的结果或等待进行中的执行时没有启动新的执行，名额由请求自己归还
+        if lease is not None and not detached:
+            await lease.release()
+    if lease is not None:
+        response.headers.update(lease.headers)
+    return response
+
+
+def metered_stream(response: StreamingResponse, lease) -> StreamingResponse:
+    """协调节点转发的流式执行：结束时按最后的 result 事件计入CPU时间并归还并发名额"""
+    body = response.body_iterator
+
+    async def iterate():
+        tail = b""
+        try:
+            async for chunk in body:
+                # 只保留最后一行（可能尚不完整）
+                tail += chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+                newline = tail.rstrip(b"\n").rfind(b"\n")
+                if newline >= 0:
+                    tail = tail[newline + 1:]
+                yield chunk
+            try:
+                event = json.loads(tail)
+            except ValueError:
+                event = {}
+            if event.get("type") == "result":
+                await lease.charge(event["result"].get("cpu_time"))
+        finally:
+            await lease.release()
+
+    response.body_iterator = iterate()
+    response.headers.update(lease.headers)
+    return response
+
+
+def admit_execution(environment: Optional[str]):
+    """本地执行前的准入检查：主机内存不足时卸载负载，环境已熔断时快速失败（均为503）"""
+    concurrency_controller.admit()
+    environment_breaker.check(environment)
+
+
+def json_execution_params(request) -> Dict:
+    """JSON执行请求中影响执行结果的字段"""
+    return request.model_dump(mode="json", exclude={"files", "coalesce"})
+
+
+def execution_error_response(error: Exception) -> ExecuteResponse:
+    """执行过程中出现未预期异常时的响应"""
+    return ExecuteResponse(
+        success=False,
+        stdout="",
+        stderr="",
+        execution_time=0.0,
+        files={},
+        error=f"执行出错: {str(error)}"
+    )
 
 
 @app.get("/", tags=["Root"])
@@ -63,15 +358,48 @@ async def health_check():
     """健康检查端点"""
     return HealthResponse(
         status="healthy",
-        timestamp=datetime.now(timezone.utc)
+        timestamp=datetime.now(timezone.utc),
+        processes=None if is_coordinator() else process_reaper.stats()
     )
 
 
-@app.post("/execute", response_model=ExecuteResponse, tags=["Execution"])
-async def execute_code(request: ExecuteRequest):
+@app.get("/ready", response_model=ReadinessResponse, tags=["Health"])
+async def readiness_check():
+    """
+    就绪检查端点
+
+    启动预热完成前返回503；协调节点在至少有一个健康工作节点时就绪
+    """
+    if is_coordinator():
+        healthy = cluster_registry.list_nodes().healthy
+        status = "ready" if healthy else "starting"
+        checks = {"workers": ReadinessCheck(ok=healthy > 0, detail=f"{healthy} 个健康工作节点")}
+    else:
+        status, checks = readiness.status, readiness.checks
+    response = ReadinessResponse(status=status, checks=checks, timestamp=datetime.now(timezone.utc))
+    return FastJSONResponse(response, status_code=200 if status == "ready" else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+async def metrics_endpoint():
+    """Prometheus格式的运行指标（当前工作进程）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/concurrency", tags=["Health"])
+async def debug_concurrency():
+    """自适应并发控制器的当前状态、最近一次压力采样和最近的调整记录（当前工作进程）"""
+    return concurrency_controller.snapshot()
+
+
+@app.post("/execute", response_model=ExecuteResponse, response_class=FastJSONResponse, tags=["Execution"])
+async def execute_code(request: ExecuteRequest, http_request: Request):
     """
     执行Python代码
     
+    客户端断开连接或到达 X-Request-Deadline（Unix时间戳）时立即终止执行并清理工作目录；
+    带 Idempotency-Key 请求头的重试不会重复执行，而是等待进行中的执行或返回保存的结果
+    
     Args:
         request: 包含代码、超时设置和输入文件的请求
         
@@ -80,42 +408,256 @@ async def execute_code(request: ExecuteRequest):
     """
     try:
         # 验证请求
-        if len(request.code.strip()) == 0:
-            raise HTTPException(status_code=400, detail="代码不能为空")
-        
-        if len(request.code) > settings.MAX_CODE_LENGTH:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"代码长度不能超过 {settings.MAX_CODE_LENGTH} 字符"
-            )
+        await validate_execution_limits(request.code, request.timeout)
+        deadline = parse_deadline(http_request.headers.get(DEADLINE_HEADER))
+        priority = parse_priority(http_request.headers.get(PRIORITY_HEADER))
         
-        if request.timeout > settings.MAX_TIMEOUT:
-            raise HTTPException(
-                status_code=400,
-                detail=f"超时时间不能超过 {settings.MAX_TIMEOUT} 秒"
+        # 协调节点转发到工作节点
+        params = json_execution_params(request)
+        if is_coordinator():
+            operation = lambda: forward_execution("/execute", request, request.environment, http_request, deadline)
+        else:
+            admit_execution(request.environment)
+            operation = lambda: executor.execute(
+                code=request.code,
+                timeout=request.timeout,
+                input_files=request.files or {},
+                environment=request.environment,
+                profile=request.profile,
+                soft_timeout=request.soft_timeout,
+                soft_timeout_signal=request.soft_timeout_signal,
+                caller=http_request.headers.get(CALLER_HEADER),
+                priority=priority
             )
         
         # 执行代码
-        result = await executor.execute(
-            code=request.code,
-            timeout=request.timeout,
-            input_files=request.files or {},
-            environment=request.environment
+        return await run_execution(
+            http_request, "/execute", params, request.files, request.coalesce,
+            request.timeout, deadline, operation
         )
         
-        return result
-        
     except HTTPException:
         raise
     except Exception as e:
-        return ExecuteResponse(
-            success=False,
-            stdout="",
-            stderr="",
-            execution_time=0.0,
-            files={},
-            error=f"执行出错: {str(e)}"
+        return FastJSONResponse(execution_error_response(e))
+
+
+@app.post("/execute/estimate", response_model=ExecutionEstimate, tags=["Execution"])
+async def estimate_execution(request: ExecuteRequest, http_request: Request):
+    """
+    预估执行耗时和排队时间，不执行代码
+    
+    请求体与 /execute 相同。按相同代码与环境的历史耗时预估，没有记录时依次使用
+    X-Caller-ID 对应调用方的平均耗时和全部执行的平均耗时。
+    预计较长的任务可改用 /execute/stream 避免同步请求超时
+    
+    Returns:
+        ExecutionEstimate: 预计耗时、依据和当前队列状态
+    """
+    if is_coordinator():
+        return await forward_execution("/execute/estimate", request, request.environment, http_request)
+    
+    prediction = runtime_history.predict(
+        request.code, request.environment, http_request.headers.get(CALLER_HEADER), request.timeout
+    )
+    return ExecutionEstimate(
+        predicted_seconds=prediction.seconds,
+        source=prediction.source,
+        samples=prediction.samples,
+        estimated_wait_seconds=execution_scheduler.estimate_wait(prediction.seconds),
+        **execution_scheduler.stats()
+    )
+
+
+@app.post("/execute/stream", tags=["Execution"])
+async def execute_code_stream(request: ExecuteRequest, http_request: Request):
+    """
+    执行Python代码并以NDJSON流式返回输出
+    
+    每行一个JSON事件：{"type": "stdout"|"stderr", "data": "..."} 随输出实时推送，
+    最后一行为 {"type": "result", "result": ExecuteResponse}。
+    客户端断开连接或到达 X-Request-Deadline 时立即终止执行
+    
+    Args:
+        request: 与 /execute 相同的执行请求
+        
+    Returns:
+        StreamingResponse: application/x-ndjson 事件流
+    """
+    await validate_execution_limits(request.code, request.timeout)
+    deadline = parse_deadline(http_request.headers.get(DEADLINE_HEADER))
+    priority = parse_priority(http_request.headers.get(PRIORITY_HEADER))
+    
+    # 客户端断开时StreamingResponse取消转发，工作节点随之检测到断开
+    if is_coordinator():
+        lease = await asyncio.to_thread(tenant_manager.admit, http_request)
+        try:
+            response = await cluster_registry.dispatch_stream(
+                "/execute/stream", request.environment, request.timeout,
+                content=request.model_dump_json(exclude_none=True),
+                headers=forward_headers(http_request, deadline, "application/json")
+            )
+        except BaseException:
+            if lease is not None:
+                await lease.release()
+            raise
+        return metered_stream(response, lease) if lease is not None else response
+    
+    admit_execution(request.environment)
+    lease = await asyncio.to_thread(tenant_manager.admit, http_request)
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def on_output(stream: str, data: bytes):
+        # 在执行线程中被调用，转交给事件循环
+        loop.call_soon_threadsafe(events.put_nowait, (stream, data))
+    
+    async def run():
+        if lease is not None:
+            cpu_meter.set(lease.charge)
+        try:
+            result = await executor.execute(
+                code=request.code,
+                timeout=request.timeout,
+                input_files=request.files or {},
+                environment=request.environment,
+                profile=request.profile,
+                soft_timeout=request.soft_timeout,
+                soft_timeout_signal=request.soft_timeout_signal,
+                output_listener=on_output,
+                caller=http_request.headers.get(CALLER_HEADER),
+                priority=priority
+            )
+        except Exception as e:
+            result = execution_error_response(e)
+        await events.put(("result", result))
+    
+    async def stream_events():
+        task = asyncio.create_task(run())
+        started = time.monotonic()
+        decoders = {name: codecs.getincrementaldecoder("utf-8")("replace") for name in ("stdout", "stderr")}
+        try:
+            while True:
+                try:
+                    if deadline is None:
+                        kind, payload = await events.get()
+                    else:
+                        kind, payload = await asyncio.wait_for(events.get(), max(0.0, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    task.cancel()
+                    await asyncio.wait({task})
+                    record_abandoned("deadline", request.timeout, started)
+                    result = ExecuteResponse(
+                        success=False,
+                        stdout="",
+                        stderr="",
+                        execution_time=time.monotonic() - started,
+                        files={},
+                        error=f"已到达请求截止时间（{DEADLINE_HEADER}），执行已取消",
+                        timed_out=True
+                    )
+                    yield '{"type": "result", "result": ' + result.model_dump_json() + "}\n"
+                    break
+                if kind == "result":
+                    yield '{"type": "result", "result": ' + payload.model_dump_json() + "}\n"
+                    break
+                text = decoders[kind].decode(payload)
+                if text:
+                    yield json.dumps({"type": kind, "data": text}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开连接时StreamingResponse会关闭生成器，执行任务被取消后自行终止进程并清理
+            if not task.done():
+                task.cancel()
+                record_abandoned("disconnect", request.timeout, started)
+            if lease is not None:
+                await lease.release()
+    
+    return StreamingResponse(
+        stream_events(), media_type="application/x-ndjson", headers=lease.headers if lease is not None else None
+    )
+
+
+@app.post("/execute/upload", response_model=ExecuteResponse, response_class=FastJSONResponse, tags=["Execution"])
+async def execute_code_upload(
+    http_request: Request,
+    code: str = Form(..., description="要执行的Python代码"),
+    timeout: int = Form(default=30, ge=1, le=300, description="执行超时时间（秒）"),
+    environment: Optional[str] = Form(default=None, description="要使用的环境名称"),
+    files: List[UploadFile] = File(default=[], description="输入文件，以原始字节上传，无需base64编码"),
+    coalesce: Optional[bool] = Form(default=None, description="是否与内容相同的并发请求合并为一次执行")
+):
+    """
+    以multipart/form-data上传输入文件并执行代码
+    
+    适合较大的输入文件，避免base64编码带来的体积膨胀和编解码开销
+    
+    Returns:
+        ExecuteResponse: 执行结果
+    """
+    try:
+        await validate_execution_limits(code, timeout)
+        deadline = parse_deadline(http_request.headers.get(DEADLINE_HEADER))
+        priority = parse_priority(http_request.headers.get(PRIORITY_HEADER))
+        
+        input_files = {}
+        for upload in files:
+            content = await upload.read()
+            if len(content) > settings.MAX_FILE_SIZE:
+                raise HTTPException(status_code=400, detail=f"文件 {upload.filename} 超过大小限制")
+            input_files[upload.filename] = content
+        
+        params = {"code": code, "timeout": timeout, "environment": environment}
+        if is_coordinator():
+            form = {"code": code, "timeout": str(timeout)}
+            if environment:
+                form["environment"] = environment
+            operation = lambda: cluster_registry.dispatch(
+                "/execute/upload", environment, timeout,
+                data=form,
+                files=[("files", (name, content, "application/octet-stream")) for name, content in input_files.items()],
+                headers=forward_headers(http_request, deadline)
+            )
+        else:
+            admit_execution(environment)
+            operation = lambda: executor.execute(
+                code=code,
+                timeout=timeout,
+                input_files=input_files,
+                environment=environment,
+                caller=http_request.headers.get(CALLER_HEADER),
+                priority=priority
+            )
+        
+        return await run_execution(
+            http_request, "/execute/upload", params, input_files, coalesce, timeout, deadline, operation
         )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        return FastJSONResponse(execution_error_response(e))
+
+
+@app.get("/outputs/{output_id}/{stream}", tags=["Execution"])
+async def download_output(output_id: str, stream: str):
+    """
+    下载被截断的完整输出
+    
+    协调节点返回的 output_id 带有执行所在的节点ID，下载请求转发到该节点
+    
+    Args:
+        output_id: 执行结果中返回的 output_id
+        stream: stdout 或 stderr
+        
+    Returns:
+        FileResponse: 完整输出文本
+    """
+    if is_coordinator():
+        return await cluster_registry.fetch_output(output_id, stream)
+    path = output_store.get(output_id, stream)
+    if not path:
+        raise HTTPException(status_code=404, detail=f"输出 '{output_id}/{stream}' 不存在或已过期")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{output_id}-{stream}.log")
 
 
 # 环境管理端点
@@ -132,8 +674,17 @@ async def create_environment(env_script: EnvironmentScript):
         EnvironmentResponse: 创建的环境信息
     """
     try:
+        # 协调节点保存环境定义，并在负载最低的工作节点上后台构建
+        if is_coordinator():
+            cluster_registry.register_environment(env_script)
+            node_id = cluster_registry.request_build(env_script.name)
+            if node_id is None:
+                raise HTTPException(status_code=503, detail="没有可用工作节点，环境定义已保存，将在首次使用时构建")
+            return cluster_registry.environment_view(env_script.name)
         result = await env_manager.create_environment(env_script)
         return result
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -149,7 +700,10 @@ async def list_environments():
         EnvironmentListResponse: 环境列表
     """
     try:
-        environments = env_manager.list_environments()
+        if is_coordinator():
+            environments = cluster_registry.list_environment_views()
+        else:
+            environments = env_manager.list_environments()
         return EnvironmentListResponse(
             environments=environments,
             total=len(environments)
@@ -170,7 +724,10 @@ async def get_environment(environment_name: str):
         EnvironmentResponse: 环境信息
     """
     try:
-        env = env_manager.get_environment(environment_name)
+        if is_coordinator():
+            env = cluster_registry.environment_view(environment_name)
+        else:
+            env = env_manager.get_environment(environment_name)
         if not env:
             raise HTTPException(status_code=404, detail=f"环境 '{environment_name}' 不存在")
         return env
@@ -192,7 +749,10 @@ async def delete_environment(environment_name: str):
         dict: 删除结果
     """
     try:
-        success = await env_manager.delete_environment(environment_name)
+        if is_coordinator():
+            success = await cluster_registry.delete_environment(environment_name)
+        else:
+            success = await env_manager.delete_environment(environment_name)
         if not success:
             raise HTTPException(status_code=404, detail=f"环境 '{environment_name}' 不存在")
         return {"message": f"环境 '{environment_name}' 已删除"}
@@ -202,8 +762,8 @@ async def delete_environment(environment_name: str):
         raise HTTPException(status_code=500, detail=f"删除环境失败: {str(e)}")
 
 
-@app.post("/execute-with-environment", response_model=ExecuteResponse, tags=["代码执行"])
-async def execute_with_environment(request: ExecuteWithEnvironmentRequest):
+@app.post("/execute-with-environment", response_model=ExecuteResponse, response_class=FastJSONResponse, tags=["代码执行"])
+async def execute_with_environment(request: ExecuteWithEnvironmentRequest, http_request: Request):
     """
     使用指定环境执行Python代码
     
@@ -215,20 +775,20 @@ async def execute_with_environment(request: ExecuteWithEnvironmentRequest):
     """
     try:
         # 验证请求
-        if len(request.code.strip()) == 0:
-            raise HTTPException(status_code=400, detail="代码不能为空")
+        await validate_execution_limits(request.code, request.timeout)
+        deadline = parse_deadline(http_request.headers.get(DEADLINE_HEADER))
+        priority = parse_priority(http_request.headers.get(PRIORITY_HEADER))
         
-        if len(request.code) > settings.MAX_CODE_LENGTH:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"代码长度不能超过 {settings.MAX_CODE_LENGTH} 字符"
+        # 协调节点只转发到已就绪该环境的工作节点
+        params = json_execution_params(request)
+        if is_coordinator():
+            return await run_execution(
+                http_request, "/execute-with-environment", params, request.files, request.coalesce,
+                request.timeout, deadline,
+                lambda: forward_execution("/execute-with-environment", request, request.environment, http_request, deadline)
             )
         
-        if request.timeout > settings.MAX_TIMEOUT:
-            raise HTTPException(
-                status_code=400,
-                detail=f"超时时间不能超过 {settings.MAX_TIMEOUT} 秒"
-            )
+        admit_execution(request.environment)
         
         # 检查环境是否存在
         env = env_manager.get_environment(request.environment)
@@ -242,32 +802,88 @@ async def execute_with_environment(request: ExecuteWithEnvironmentRequest):
             )
         
         # 执行代码
-        result = await executor.execute(
-            code=request.code,
-            timeout=request.timeout,
-            input_files=request.files or {},
-            environment=request.environment
+        return await run_execution(
+            http_request, "/execute-with-environment", params, request.files, request.coalesce,
+            request.timeout, deadline,
+            lambda: executor.execute(
+                code=request.code,
+                timeout=request.timeout,
+                input_files=request.files or {},
+                environment=request.environment,
+                profile=request.profile,
+                soft_timeout=request.soft_timeout,
+                soft_timeout_signal=request.soft_timeout_signal,
+                caller=http_request.headers.get(CALLER_HEADER),
+                priority=priority
+            )
         )
         
-        return result
-        
     except HTTPException:
         raise
     except Exception as e:
-        return ExecuteResponse(
-            success=False,
-            stdout="",
-            stderr="",
-            execution_time=0.0,
-            files={},
-            error=f"执行出错: {str(e)}"
-        )
+        return FastJSONResponse(execution_error_response(e))
+
+
+@app.get("/tenants/usage", response_model=TenantUsage, tags=["租户"])
+async def tenant_usage(http_request: Request):
+    """
+    当前API密钥所属租户的配额与用量
+    
+    用量为同一主机上所有工作进程的合计，集群模式下查询协调节点
+    
+    Returns:
+        TenantUsage: 令牌桶、并发和CPU预算的当前状态
+    """
+    identity = tenant_manager.authenticate(http_request)
+    if identity is None:
+        raise HTTPException(status_code=404, detail="未启用多租户（TENANTS_FILE 为空）")
+    return await asyncio.to_thread(tenant_manager.usage, *identity)
+
+
+# 集群端点（仅协调节点）
+
+def require_coordinator():
+    if not is_coordinator():
+        raise HTTPException(status_code=404, detail="当前节点不是协调节点")
+
+
+@app.post("/cluster/heartbeat", tags=["集群"])
+async def cluster_heartbeat(heartbeat: NodeHeartbeat, x_cluster_token: Optional[str] = Header(default=None)):
+    """
+    工作节点心跳
+    
+    上报节点地址、已就绪环境和当前负载，首次心跳即完成注册
+    """
+    require_coordinator()
+    verify_cluster_token(x_cluster_token)
+    cluster_registry.record_heartbeat(heartbeat)
+    return {"status": "ok"}
+
+
+@app.get("/cluster/nodes", response_model=ClusterNodeListResponse, tags=["集群"])
+async def list_cluster_nodes(x_cluster_token: Optional[str] = Header(default=None)):
+    """列出工作节点及其健康状态和负载（需要 X-Cluster-Token）"""
+    require_coordinator()
+    verify_cluster_token(x_cluster_token)
+    return cluster_registry.list_nodes()
+
+
+@app.delete("/cluster/nodes/{node_id}", tags=["集群"])
+async def remove_cluster_node(node_id: str, x_cluster_token: Optional[str] = Header(default=None)):
+    """注销工作节点（工作节点关闭时自动调用）"""
+    require_coordinator()
+    verify_cluster_token(x_cluster_token)
+    if not cluster_registry.remove(node_id):
+        raise HTTPException(status_code=404, detail=f"节点 '{node_id}' 不存在")
+    return {"message": f"节点 '{node_id}' 已注销"}
 
 
 if __name__ == "__main__":
+    # 多工作进程模式下不能使用热重载
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=settings.WORKERS == 1,
+        workers=settings.WORKERS
     )
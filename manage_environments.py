@@ -82,7 +82,8 @@ class EnvironmentManager:
                     status_icon = {
                         "ready": "✅",
                         "building": "🔧",
-                        "failed": "❌"
+                        "failed": "❌",
+                        "degraded": "⚠️"
                     }.get(env["status"], "❓")
                     
                     print(f"   {status_icon} {env['name']}")
@@ -117,7 +118,8 @@ class EnvironmentManager:
                 status_icon = {
                     "ready": "✅",
                     "building": "🔧", 
-                    "failed": "❌"
+                    "failed": "❌",
+                    "degraded": "⚠️"
                 }.get(env["status"], "❓")
                 
                 print(f"   {status_icon} 名称: {env['name']}")
@@ -190,6 +192,9 @@ class EnvironmentManager:
                     elif status == "failed":
                         print(f"❌ 环境构建失败")
                         return False
+                    elif status == "degraded":
+                        print(f"⚠️ 环境已熔断: {env_info.get('error')}")
+                        return False
                     else:
                         elapsed = (retry_count + 1) * 10
                         print(f"⏳ 构建中... ({elapsed}s/{max_minutes * 60}s)")
@@ -0,0 +1,63 @@
+from pydantic import BaseModel, Field, ConfigDict
+from typing import Dict, List, Optional
+
+
+class EnvironmentStats(BaseModel):
+    """节点上单个环境的预热状态"""
+    warm: int = Field(default=0, ge=0, description="空闲的预热解释器数")
+    hit_rate: float = Field(default=0.0, ge=0, le=1, description="近期执行命中预热解释器的比例")
+    recent: int = Field(default=0, ge=0, description="近10分钟内的执行次数")
+
+
+class NodeHeartbeat(BaseModel):
+    """工作节点心跳模型"""
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "node_id": "worker-8001",
+                "url": "http://127.0.0.1:8001",
+                "environments": ["data-science-env"],
+                "building": [],
+                "environment_stats": {
+                    "data-science-env": {"warm": 2, "hit_rate": 0.9, "recent": 42}
+                },
+                "active": 2,
+                "capacity": 8
+            }
+        }
+    )
+
+    node_id: str = Field(..., min_length=1, max_length=128, description="节点ID")
+    url: str = Field(..., description="节点API地址，协调节点通过该地址转发请求")
+    environments: List[str] = Field(default_factory=list, description="节点上已就绪的环境")
+    building: List[str] = Field(default_factory=list, description="节点上正在构建的环境")
+    environment_stats: Dict[str, EnvironmentStats] = Field(
+        default_factory=dict,
+        description="各环境的预热状态，默认环境的键为 default"
+    )
+    active: int = Field(default=0, ge=0, description="正在执行的任务数")
+    capacity: int = Field(default=1, ge=1, description="节点可同时执行的任务数")
+
+
+class ClusterNode(BaseModel):
+    """协调节点视角下的工作节点状态"""
+    node_id: str = Field(..., description="节点ID")
+    url: str = Field(..., description="节点API地址")
+    environments: List[str] = Field(..., description="节点上已就绪的环境")
+    building: List[str] = Field(default_factory=list, description="节点上正在构建的环境")
+    environment_stats: Dict[str, EnvironmentStats] = Field(default_factory=dict, description="各环境的预热状态")
+    active: int = Field(..., description="最近一次心跳上报的执行中任务数")
+    inflight: int = Field(default=0, description="当前协调进程转发到该节点、尚未返回的请求数")
+    capacity: int = Field(..., description="节点可同时执行的任务数")
+    load: float = Field(..., description="负载 = (active + inflight) / capacity")
+    healthy: bool = Field(..., description="心跳未超时且最近没有转发失败")
+    last_heartbeat: float = Field(..., description="最近一次心跳时间（Unix时间戳）")
+    failures: int = Field(default=0, description="连续转发失败次数")
+    last_error: Optional[str] = Field(default=None, description="最近一次转发失败原因")
+
+
+class ClusterNodeListResponse(BaseModel):
+    """工作节点列表响应模型"""
+    nodes: List[ClusterNode] = Field(..., description="工作节点列表")
+    total: int = Field(..., description="节点总数")
+    healthy: int = Field(..., description="健康节点数")
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field, ConfigDict, validator
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, ConfigDict, validator, field_validator, model_validator
+from typing import Optional, List, Dict, Union, Literal
 from enum import Enum
 
+from .request import ProfileOptions, normalize_profile_option, validate_soft_timeout
+
 
 class PackageManager(str, Enum):
     """包管理器类型"""
@@ -94,9 +96,11 @@ class EnvironmentResponse(BaseModel):
     conda_env_name: Optional[str] = Field(default=None, description="Conda环境名称（Conda模式）")
     env_path: Optional[str] = Field(default=None, description="环境路径（Conda模式）")
     python_version: str = Field(..., description="Python版本")
-    status: str = Field(..., description="环境状态: building, ready, failed")
+    status: str = Field(..., description="环境状态: building, ready, failed, degraded（连续基础设施故障被熔断）；集群模式下尚未在任何节点构建时为 pending")
     created_at: str = Field(..., description="创建时间")
     last_used: Optional[str] = Field(default=None, description="最后使用时间")
+    error: Optional[str] = Field(default=None, description="构建失败或被熔断（degraded）的原因")
+    nodes: Optional[List[str]] = Field(default=None, description="已就绪该环境的工作节点（仅协调节点返回）")
 
 
 class ExecuteWithEnvironmentRequest(BaseModel):
@@ -119,6 +123,32 @@ class ExecuteWithEnvironmentRequest(BaseModel):
         default=None,
         description="输入文件，键为文件名，值为base64编码的文件内容"
     )
+    profile: Optional[Union[bool, ProfileOptions]] = Field(
+        default=None,
+        description="性能分析选项，传入 true 使用默认cProfile设置"
+    )
+    soft_timeout: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="软超时（秒），到达后向用户代码发送信号以便保存进度，必须小于timeout"
+    )
+    soft_timeout_signal: Literal["SIGINT", "SIGTERM"] = Field(
+        default="SIGINT",
+        description="软超时信号，SIGINT会在用户代码中触发KeyboardInterrupt"
+    )
+    coalesce: Optional[bool] = Field(
+        default=None,
+        description="是否与内容相同的并发请求合并为一次执行（仅适用于确定性代码），为空时使用服务端 COALESCE_ENABLED"
+    )
+
+    @field_validator("profile", mode="before")
+    @classmethod
+    def normalize_profile(cls, v):
+        return normalize_profile_option(v)
+
+    @model_validator(mode="after")
+    def check_soft_timeout(self):
+        return validate_soft_timeout(self)
 
 
 class EnvironmentListResponse(BaseModel):
@@ -1,6 +1,72 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, Dict
+from pydantic import BaseModel, Field, ConfigDict, field_validator, model_validator
+from typing import Optional, Dict, List, Union, Literal
 from datetime import datetime
+from enum import Enum
+
+
+class ProfileMode(str, Enum):
+    """性能分析模式"""
+    CPROFILE = "cprofile"  # 确定性分析，适合短任务
+    SAMPLING = "sampling"  # 采样分析，适合长任务，开销低
+
+
+class ProfileOptions(BaseModel):
+    """性能分析选项"""
+    mode: ProfileMode = Field(default=ProfileMode.CPROFILE, description="分析模式: cprofile 或 sampling")
+    top_n: int = Field(default=30, ge=1, le=200, description="返回的热点函数数量")
+    sort_by: str = Field(
+        default="cumulative",
+        pattern="^(cumulative|tottime|calls)$",
+        description="cprofile模式下的排序字段: cumulative, tottime, calls"
+    )
+    sample_interval_ms: float = Field(default=5.0, ge=1.0, le=1000.0, description="sampling模式下的采样间隔（毫秒）")
+    import_time: bool = Field(default=True, description="是否通过 -X importtime 统计模块导入耗时")
+
+
+def normalize_profile_option(value):
+    """允许 profile 字段直接传布尔值"""
+    if value is True:
+        return ProfileOptions()
+    if value is False:
+        return None
+    return value
+
+
+def validate_soft_timeout(request):
+    """软超时必须早于硬超时"""
+    if request.soft_timeout is not None and request.soft_timeout >= request.timeout:
+        raise ValueError("soft_timeout 必须小于 timeout")
+    return request
+
+
+class ProfileEntry(BaseModel):
+    """热点函数统计"""
+    function: str = Field(..., description="函数位置，格式为 文件:行号(函数名)")
+    calls: Optional[int] = Field(default=None, description="调用次数（sampling模式下为空）")
+    self_time: float = Field(..., description="函数自身耗时（秒，sampling模式下为估算值）")
+    cumulative_time: float = Field(..., description="累计耗时（秒，sampling模式下为估算值）")
+
+
+class ImportTimeEntry(BaseModel):
+    """模块导入耗时"""
+    module: str = Field(..., description="模块名")
+    self_us: int = Field(..., description="模块自身导入耗时（微秒）")
+    cumulative_us: int = Field(..., description="包含子模块的累计导入耗时（微秒）")
+
+
+class ProfileResult(BaseModel):
+    """性能分析结果"""
+    mode: ProfileMode = Field(..., description="分析模式")
+    total_time: float = Field(..., description="用户代码运行耗时（秒，不含解释器启动）")
+    samples: Optional[int] = Field(default=None, description="采样次数（仅sampling模式）")
+    top_functions: List[ProfileEntry] = Field(default_factory=list, description="热点函数")
+    import_times: List[ImportTimeEntry] = Field(default_factory=list, description="导入耗时最高的模块")
+    import_total_us: Optional[int] = Field(default=None, description="所有顶层模块导入的累计耗时（微秒）")
+    artifacts: Dict[str, str] = Field(
+        default_factory=dict,
+        description="可下载的分析文件（pstats/speedscope/collapsed），值为base64编码"
+    )
+    error: Optional[str] = Field(default=None, description="分析数据收集失败时的错误信息")
 
 
 class ExecuteRequest(BaseModel):
@@ -28,6 +94,32 @@ class ExecuteRequest(BaseModel):
         default=None,
         description="要使用的环境名称，如果为None则使用默认环境"
     )
+    profile: Optional[Union[bool, ProfileOptions]] = Field(
+        default=None,
+        description="性能分析选项，传入 true 使用默认cProfile设置"
+    )
+    soft_timeout: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="软超时（秒），到达后向用户代码发送信号以便保存进度，必须小于timeout"
+    )
+    soft_timeout_signal: Literal["SIGINT", "SIGTERM"] = Field(
+        default="SIGINT",
+        description="软超时信号，SIGINT会在用户代码中触发KeyboardInterrupt"
+    )
+    coalesce: Optional[bool] = Field(
+        default=None,
+        description="是否与内容相同的并发请求合并为一次执行（仅适用于确定性代码），为空时使用服务端 COALESCE_ENABLED"
+    )
+
+    @field_validator("profile", mode="before")
+    @classmethod
+    def normalize_profile(cls, v):
+        return normalize_profile_option(v)
+
+    @model_validator(mode="after")
+    def check_soft_timeout(self):
+        return validate_soft_timeout(self)
 
 
 class ExecuteResponse(BaseModel):
@@ -51,8 +143,43 @@ class ExecuteResponse(BaseModel):
     stdout: str = Field(..., description="标准输出")
     stderr: str = Field(..., description="标准错误输出")
     execution_time: float = Field(..., description="执行时间（秒）")
+    cpu_time: Optional[float] = Field(
+        default=None,
+        description="用户代码实际消耗的CPU时间（秒，用户态+内核态，包括子进程和被清理的遗留进程）"
+    )
     files: Dict[str, str] = Field(..., description="生成的文件，值为base64编码")
     error: Optional[str] = Field(default=None, description="错误信息")
+    timed_out: bool = Field(default=False, description="是否因超时被终止（此时stdout/stderr为终止前的部分输出）")
+    stdout_truncated: bool = Field(default=False, description="标准输出是否因超出限制被截断")
+    stderr_truncated: bool = Field(default=False, description="标准错误输出是否因超出限制被截断")
+    output_id: Optional[str] = Field(
+        default=None,
+        description="输出被截断时的完整输出ID，可通过 GET /outputs/{output_id}/{stdout|stderr} 下载"
+    )
+    profile: Optional[ProfileResult] = Field(default=None, description="性能分析结果（仅在请求profile时返回）")
+
+
+class ExecutionEstimate(BaseModel):
+    """执行耗时预估，客户端据此选择同步执行或流式执行"""
+    predicted_seconds: float = Field(..., description="预计执行耗时（秒）")
+    source: str = Field(
+        ...,
+        description="预估依据: exact（相同代码与环境）/ caller（同一调用方）/ global（全部执行）/ default（没有记录）"
+    )
+    samples: int = Field(..., description="预估依据的执行次数")
+    estimated_wait_seconds: float = Field(..., description="预计在调度队列中的等待时间（秒）")
+    running: int = Field(..., description="正在执行的任务数")
+    queued: int = Field(..., description="排队等待执行槽的任务数")
+    limit: int = Field(..., description="执行槽数量，0表示不限制")
+
+
+class ProcessStats(BaseModel):
+    """遗留进程回收统计"""
+    subreaper: bool = Field(..., description="服务进程是否为 child subreaper")
+    sweeps: int = Field(..., description="执行结束后的清理次数")
+    leaked_processes: int = Field(..., description="执行结束后仍在运行、被强制终止的进程总数")
+    orphans_reaped: int = Field(..., description="回收的孤儿僵尸进程数")
+    strays_killed: int = Field(default=0, description="其中带有已结束执行标记、在之后的清理中被终止的进程数")
 
 
 class HealthResponse(BaseModel):
@@ -61,10 +188,39 @@ class HealthResponse(BaseModel):
         json_schema_extra={
             "example": {
                 "status": "healthy",
-                "timestamp": "2025-05-29T10:00:00Z"
+                "timestamp": "2025-05-29T10:00:00Z",
+                "processes": {"subreaper": True, "sweeps": 120, "leaked_processes": 3, "orphans_reaped": 1, "strays_killed": 0}
             }
         }
     )
     
     status: str = Field(..., description="服务状态")
     timestamp: datetime = Field(..., description="检查时间")
+    processes: Optional[ProcessStats] = Field(default=None, description="遗留进程回收统计")
+
+
+class ReadinessCheck(BaseModel):
+    """单项就绪检查结果"""
+    ok: bool = Field(..., description="检查是否通过")
+    detail: str = Field(default="", description="检查说明或失败原因")
+    duration: float = Field(default=0.0, description="检查耗时（秒）")
+
+
+class ReadinessResponse(BaseModel):
+    """就绪检查响应模型"""
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "status": "ready",
+                "checks": {
+                    "workspace": {"ok": True, "detail": "/tmp/sandbox", "duration": 0.001},
+                    "self_test": {"ok": True, "detail": "", "duration": 0.05}
+                },
+                "timestamp": "2025-05-29T10:00:00Z"
+            }
+        }
+    )
+
+    status: str = Field(..., description="就绪状态: starting, warming, ready, failed")
+    checks: Dict[str, ReadinessCheck] = Field(default_factory=dict, description="各项预热检查结果")
+    timestamp: datetime = Field(..., description="检查时间")
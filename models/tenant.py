@@ -0,0 +1,52 @@
+from pydantic import BaseModel, Field, ConfigDict, model_validator
+from typing import Optional
+
+
+class TenantConfig(BaseModel):
+    """租户配置（TENANTS_FILE 中的一项），各项限制为0表示不限制"""
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "api_key_sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+                "requests_per_second": 5,
+                "burst": 20,
+                "max_concurrent": 4,
+                "cpu_seconds": 3600,
+                "window_seconds": 3600
+            }
+        }
+    )
+
+    api_key: Optional[str] = Field(default=None, min_length=1, description="API密钥明文")
+    api_key_sha256: Optional[str] = Field(
+        default=None,
+        pattern=r"^[0-9a-fA-F]{64}$",
+        description="API密钥的SHA-256（十六进制），避免在配置文件中保存明文"
+    )
+    requests_per_second: float = Field(default=0, ge=0, description="令牌桶每秒补充的请求数")
+    burst: int = Field(default=0, ge=0, description="令牌桶容量，为0时取 requests_per_second 向上取整（至少为1）")
+    max_concurrent: int = Field(default=0, ge=0, description="同时进行的执行数上限")
+    cpu_seconds: float = Field(default=0, ge=0, description="每个时间窗口内的CPU时间预算（秒）")
+    window_seconds: int = Field(default=3600, ge=1, description="CPU预算的时间窗口（秒）")
+
+    @model_validator(mode="after")
+    def check_api_key(self):
+        if not self.api_key and not self.api_key_sha256:
+            raise ValueError("必须配置 api_key 或 api_key_sha256")
+        return self
+
+
+class TenantUsage(BaseModel):
+    """租户当前的配额与用量（同一主机上所有工作进程的合计）"""
+    tenant: str = Field(..., description="租户名称")
+    requests_per_second: float = Field(..., description="令牌桶每秒补充的请求数，0表示不限制")
+    burst: int = Field(..., description="令牌桶容量")
+    tokens: Optional[float] = Field(default=None, description="当前剩余的令牌数，不限制速率时为空")
+    max_concurrent: int = Field(..., description="同时进行的执行数上限，0表示不限制")
+    active: int = Field(..., description="正在进行的执行数")
+    cpu_seconds_limit: float = Field(..., description="每个时间窗口的CPU时间预算（秒），0表示不限制")
+    cpu_seconds_used: float = Field(..., description="当前时间窗口已消耗的CPU时间（秒）")
+    window_seconds: int = Field(..., description="时间窗口长度（秒）")
+    window_reset_seconds: float = Field(..., description="距当前时间窗口结束的秒数")
+    requests: int = Field(..., description="当前时间窗口内被接受的执行请求数")
+    rejected: int = Field(..., description="当前时间窗口内因超出限制被拒绝（429）的请求数")
@@ -0,0 +1,312 @@
+"""
+CPU亲和性与进程QoS（仅Linux）
+多核主机上沙盒进程在各核之间迁移，失去缓存局部性，并与API事件循环争抢CPU：
+- 开启 CPU_AFFINITY_ENABLED 后，前 CPU_RESERVED_CORES 个核保留给API工作进程（uvicorn），沙盒进程不会运行在这些核上
+- 每次执行从其余的核中独占分配 CPU_CORES_PER_EXECUTION 个（sched_setaffinity），优先选择同一NUMA节点内、
+  超线程兄弟也空闲的核；没有空闲的核时在全部非保留核上共享运行，不排队（排队由执行调度负责）
+- 分配记录保存在共享状态中，同一主机上的多个工作进程不会分到同一个核
+- 开启 PROCESS_QOS_ENABLED 后，按请求头 X-Execution-Priority（high/normal/low）设置沙盒进程的 nice 与IO优先级
+nice、IO优先级和CPU亲和性都是线程级属性，设置时会遍历进程树中的所有线程，之后创建的线程和子进程自动继承
+"""
+
+import os
+import glob
+import ctypes
+import platform
+import threading
+from typing import Dict, List, Optional, Set
+
+from fastapi import HTTPException
+
+from config.settings import settings
+from .metrics import metrics
+from .shared_state import shared_state
+
+PRIORITY_HEADER = "X-Execution-Priority"
+DEFAULT_PRIORITY = "normal"
+
+# ioprio_set(2) 的IO调度类
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_SET_SYSCALL = {"x86_64": 251, "aarch64": 30, "riscv64": 30, "i386": 289, "i686": 289}
+
+# 优先级 → (nice, IO调度类, IO优先级)；普通用户只能调高nice，因此最高优先级与服务进程相同
+QOS_CLASSES = {
+    "high": (0, IOPRIO_CLASS_BE, 0),
+    "normal": (5, IOPRIO_CLASS_BE, 4),
+    "low": (15, IOPRIO_CLASS_IDLE, 0),
+}
+
+pinned_executions = metrics.counter(
+    "sandbox_pinned_executions_total",
+    "独占分配到CPU核的执行数"
+)
+shared_executions = metrics.counter(
+    "sandbox_unpinned_executions_total",
+    "没有空闲的核、在共享核上运行的执行数"
+)
+
+
+def parse_priority(value: Optional[str]) -> Optional[str]:
+    """校验 X-Execution-Priority 请求头，不合法时抛出HTTP 400"""
+    if value is None:
+        return None
+    priority = value.strip().lower()
+    if priority not in QOS_CLASSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{PRIORITY_HEADER} 必须是 {' / '.join(QOS_CLASSES)} 之一"
+        )
+    return priority
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """解析 /sys 中的CPU列表，如 0-3,8-11"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def process_threads(pid: int) -> List[int]:
+    """进程及其所有后代进程的线程ID（通过 /proc/<pid>/task/<tid>/children 遍历进程树）"""
+    threads = []
+    pending = [pid]
+    seen: Set[int] = set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            tids = [int(tid) for tid in os.listdir(f"/proc/{current}/task")]
+        except OSError:
+            continue
+        threads.extend(tids)
+        for tid in tids:
+            children = _read(f"/proc/{current}/task/{tid}/children")
+            if children:
+                pending.extend(int(child) for child in children.split())
+    return threads
+
+
+class CpuTopology:
+    """服务进程可用的CPU及其NUMA节点和超线程兄弟"""
+
+    def __init__(self):
+        self.cpus: List[int] = sorted(os.sched_getaffinity(0))
+        self.nodes: Dict[int, int] = {}
+        for path in glob.glob("/sys/devices/system/node/node[0-9]*/cpulist"):
+            node = int(os.path.basename(os.path.dirname(path))[len("node"):])
+            for cpu in parse_cpu_list(_read(path) or ""):
+                self.nodes[cpu] = node
+        self.siblings: Dict[int, List[int]] = {}
+        for cpu in self.cpus:
+            text = _read(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list")
+            self.siblings[cpu] = [s for s in parse_cpu_list(text or "") if s != cpu]
+
+    def node(self, cpu: int) -> int:
+        return self.nodes.get(cpu, 0)
+
+
+class CpuSetAllocator:
+    """
+    按执行独占分配CPU核
+
+    - allocate(): 启动进程前调用，返回分配ID；没有空闲的核或未启用时返回None
+    - pin(): 把进程树绑定到分配的核，未分配时绑定到全部非保留核
+    - release(): 执行结束后归还
+    所有方法都在执行线程中调用
+    """
+
+    def __init__(self):
+        self._topology: Optional[CpuTopology] = None
+        self._reserved: List[int] = []
+        self._shared: List[int] = []
+        self._allocations: Dict[str, List[int]] = {}
+        self._guard = threading.Lock()
+        self._sequence = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CPU_AFFINITY_ENABLED and hasattr(os, "sched_setaffinity") and bool(self.shared)
+
+    @property
+    def shared(self) -> List[int]:
+        """沙盒进程可以使用的核（全部可用核去掉保留给API的核）"""
+        if self._topology is None and settings.CPU_AFFINITY_ENABLED and hasattr(os, "sched_setaffinity"):
+            with self._guard:
+                if self._topology is None:
+                    self._load_topology()
+        return self._shared
+
+    def _load_topology(self):
+        topology = CpuTopology()
+        reserved = max(0, settings.CPU_RESERVED_CORES)
+        self._reserved = topology.cpus[:reserved]
+        self._shared = topology.cpus[reserved:]
+        self._topology = topology
+        if not self._shared:
+            print(f"⚠️ 可用的 {len(topology.cpus)} 个核都保留给了API工作进程，CPU亲和性未启用")
+        else:
+            print(f"✅ 已启用CPU亲和性，保留核 {self._reserved}，沙盒可用 {len(self._shared)} 个核")
+
+    @property
+    def _store(self):
+        return shared_state.store("cpusets")
+
+    def allocate(self) -> Optional[str]:
+        if not self.enabled:
+            return None
+        count = min(max(1, settings.CPU_CORES_PER_EXECUTION), len(self.shared))
+        with self._guard:
+            self._sequence += 1
+            allocation_id = f"{os.getpid()}-{self._sequence}"
+        try:
+            with self._store.update() as data:
+                allocations = data.setdefault("allocations", {})
+                for key, allocation in list(allocations.items()):
+                    if not self._alive(allocation["pid"]):
+                        del allocations[key]
+                busy = {cpu for allocation in allocations.values() for cpu in allocation["cpus"]}
+                cpus = self._choose([cpu for cpu in self.shared if cpu not in busy], busy, count)
+                if cpus:
+                    allocations[allocation_id] = {"pid": os.getpid(), "cpus": cpus}
+        except OSError as e:
+            print(f"⚠️ 分配CPU核失败: {e}")
+            cpus = None
+        if not cpus:
+            shared_executions.inc()
+            return None
+        pinned_executions.inc()
+        with self._guard:
+            self._allocations[allocation_id] = cpus
+        return allocation_id
+
+    def _choose(self, free: List[int], busy: Set[int], count: int) -> Optional[List[int]]:
+        """
+        从空闲的核中选出 count 个：
+        优先放在一个NUMA节点内（空闲核最少但足够的节点，大块留给以后），
+        节点内优先选择超线程兄弟也空闲的核，避免与其他执行共享L1/L2缓存
+        """
+        if len(free) < count:
+            return None
+        topology = self._topology
+        by_node: Dict[int, List[int]] = {}
+        for cpu in free:
+            by_node.setdefault(topology.node(cpu), []).append(cpu)
+        fitting = [cpus for cpus in by_node.values() if len(cpus) >= count]
+        if fitting:
+            candidates = min(fitting, key=len)
+            rank = {}
+        else:
+            # 单个节点放不下时跨节点分配，从空闲核最多的节点开始
+            candidates = free
+            rank = {node: i for i, node in enumerate(sorted(by_node, key=lambda n: -len(by_node[n])))}
+
+        def preference(cpu: int):
+            busy_siblings = sum(s in busy for s in topology.siblings.get(cpu, []))
+            return rank.get(topology.node(cpu), 0), busy_siblings, cpu
+
+        chosen: List[int] = []
+        for cpu in sorted(candidates, key=preference):
+            if len(chosen) == count:
+                break
+            if cpu in chosen:
+                continue
+            chosen.append(cpu)
+            # 同一执行的多个核优先选超线程兄弟，共享缓存
+            for sibling in topology.siblings.get(cpu, []):
+                if len(chosen) < count and sibling in candidates and sibling not in chosen:
+                    chosen.append(sibling)
+        return chosen[:count]
+
+    def pin(self, pid: int, allocation_id: Optional[str]):
+        """把进程树绑定到分配的核；未分配时绑定到全部非保留核，不占用保留给API的核"""
+        if not self.enabled:
+            return
+        with self._guard:
+            cpus = self._allocations.get(allocation_id, self.shared)
+        for tid in process_threads(pid):
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError:
+                # 线程已退出
+                continue
+
+    def release(self, allocation_id: Optional[str]):
+        if allocation_id is None:
+            return
+        with self._guard:
+            self._allocations.pop(allocation_id, None)
+        try:
+            with self._store.update() as data:
+                data.get("allocations", {}).pop(allocation_id, None)
+        except OSError as e:
+            print(f"⚠️ 归还CPU核失败: {e}")
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+class ProcessQoS:
+    """按执行优先级设置沙盒进程树的 nice 与IO优先级"""
+
+    def __init__(self):
+        self._ioprio_set = None
+        self._warned = False
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PROCESS_QOS_ENABLED and hasattr(os, "setpriority")
+
+    def _ioprio(self):
+        if self._ioprio_set is None:
+            syscall_number = IOPRIO_SET_SYSCALL.get(platform.machine())
+            libc = ctypes.CDLL(None, use_errno=True)
+            self._ioprio_set = (lambda tid, value: libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, tid, value)) \
+                if syscall_number is not None else False
+        return self._ioprio_set
+
+    def apply(self, pid: int, priority: Optional[str]):
+        if not self.enabled:
+            return
+        nice, io_class, io_level = QOS_CLASSES[priority or DEFAULT_PRIORITY]
+        ioprio_set = self._ioprio()
+        for tid in process_threads(pid):
+            try:
+                # 只调高：调低nice需要 CAP_SYS_NICE
+                if os.getpriority(os.PRIO_PROCESS, tid) < nice:
+                    os.setpriority(os.PRIO_PROCESS, tid, nice)
+            except OSError:
+                continue
+            if ioprio_set and ioprio_set(tid, (io_class << IOPRIO_CLASS_SHIFT) | io_level) != 0 and not self._warned:
+                self._warned = True
+                print(f"⚠️ 设置IO优先级失败: {os.strerror(ctypes.get_errno())}")
+
+
+# 全局CPU核分配实例
+cpu_allocator = CpuSetAllocator()
+
+# 全局进程QoS实例
+process_qos = ProcessQoS()
@@ -0,0 +1,116 @@
+"""
+执行取消
+客户端放弃等待（断开连接或到达 X-Request-Deadline）后，取消仍在运行的执行：
+执行任务被取消时 CodeExecutor 立即终止进程组并清理工作目录，不再运行到超时为止。
+被放弃的执行及其剩余的超时预算计入 /metrics
+"""
+
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from .metrics import metrics
+
+T = TypeVar("T")
+
+# 客户端放弃等待的时间点（Unix时间戳，秒），协调节点原样转发给工作节点
+DEADLINE_HEADER = "X-Request-Deadline"
+# 客户端断开连接时使用的状态码（nginx的 Client Closed Request），响应不会被读取
+CLIENT_CLOSED_STATUS = 499
+
+abandoned_executions = metrics.counter(
+    "sandbox_executions_abandoned_total",
+    "客户端放弃等待而被取消或拒绝的执行请求数（合并执行仍有其他等待者或请求带幂等键时执行会继续），reason: disconnect / deadline / expired"
+)
+abandoned_budget_seconds = metrics.counter(
+    "sandbox_abandoned_budget_seconds_total",
+    "被取消的执行在取消时剩余的超时预算（秒），即最多节省的执行时间"
+)
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    """
+    解析 X-Request-Deadline
+
+    Returns:
+        Optional[float]: 截止时间（Unix时间戳），未提供时为None
+
+    Raises:
+        HTTPException: 格式不正确（400）或已经过期（504）
+    """
+    if value is None:
+        return None
+    try:
+        deadline = float(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} 必须是Unix时间戳（秒）")
+    if deadline <= time.time():
+        abandoned_executions.inc(reason="expired")
+        raise HTTPException(status_code=504, detail=f"请求已超过截止时间（{DEADLINE_HEADER}），未执行")
+    return deadline
+
+
+def record_abandoned(reason: str, timeout: float, started: float):
+    """记录一次被取消的执行，started 为 time.monotonic() 起点"""
+    budget = max(0.0, timeout - (time.monotonic() - started))
+    abandoned_executions.inc(reason=reason)
+    abandoned_budget_seconds.inc(budget)
+    print(f"🛑 执行已取消（{reason}），剩余超时预算 {budget:.1f}s")
+
+
+async def _wait_for_disconnect(request: Request):
+    # 请求体已被读取，之后收到的消息只会是 http.disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_abandoned(
+    operation: Callable[[], Awaitable[T]],
+    request: Request,
+    timeout: float,
+    deadline: Optional[float] = None
+) -> T:
+    """
+    运行执行操作，客户端断开连接或到达截止时间时取消
+
+    Args:
+        operation: 返回执行协程的函数（本地执行或转发到工作节点）
+        request: 当前HTTP请求，用于检测客户端断开
+        timeout: 执行超时（秒），用于统计节省的执行时间
+        deadline: parse_deadline() 的结果
+
+    Returns:
+        T: operation 的结果
+
+    Raises:
+        HTTPException: 客户端已断开（499）或到达截止时间（504）
+    """
+    started = time.monotonic()
+    task = asyncio.ensure_future(operation())
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    remaining = None if deadline is None else max(0.0, deadline - time.time())
+    try:
+        done, _ = await asyncio.wait({task, watcher}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if task in done:
+        return task.result()
+
+    reason = "disconnect" if watcher in done else "deadline"
+    task.cancel()
+    # 等待执行器终止进程并清理工作目录
+    await asyncio.wait({task})
+    if not task.cancelled():
+        task.exception()
+    record_abandoned(reason, timeout, started)
+    if reason == "disconnect":
+        raise HTTPException(status_code=CLIENT_CLOSED_STATUS, detail="客户端已断开连接，执行已取消")
+    raise HTTPException(status_code=504, detail=f"已到达请求截止时间（{DEADLINE_HEADER}），执行已取消")
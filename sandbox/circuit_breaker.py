@@ -0,0 +1,202 @@
+"""
+环境熔断
+环境的解释器损坏（例如 env_path 下的conda环境被破坏）时，每个请求仍会启动进程、失败并返回笼统的错误，白白占用执行槽：
+- 只统计基础设施故障（解释器无法启动、动态库缺失等），用户代码的报错和超时不计入
+- 同一环境连续 CIRCUIT_BREAKER_THRESHOLD 次基础设施故障后探测解释器，探测也失败才熔断
+  （故障按stderr识别，用户代码可以伪造解释器的报错输出）：注册表中标记为 degraded，
+  所有工作进程对该环境的执行请求直接返回503，集群心跳不再上报该环境
+- 后台每 CIRCUIT_BREAKER_PROBE_INTERVAL 秒探测 degraded 环境，解释器恢复后重新标记为 ready；
+  开启 CIRCUIT_BREAKER_REBUILD 时探测失败会按原安装脚本重建环境
+"""
+
+import re
+import asyncio
+import subprocess
+from typing import Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from config.settings import settings
+from .metrics import metrics
+from .shared_state import shared_state
+from .warm_pool import warm_pool
+
+# 解释器在运行用户代码之前失败的特征输出
+INTERPRETER_FAILURE = re.compile(
+    r"Fatal Python error: (init_|Py_Initialize|_PyConfig|pyinit_|failed to get random)"
+    r"|error while loading shared libraries"
+    r"|Could not find platform (in)?dependent libraries"
+)
+# 探测时运行的代码，能导入标准库并输出即视为解释器可用
+PROBE_CODE = "import encodings, site, json; print('ok')"
+PROBE_TIMEOUT = 30
+
+infrastructure_failures = metrics.counter(
+    "sandbox_environment_infrastructure_failures_total",
+    "环境的基础设施故障次数（解释器无法启动等，不含用户代码错误）"
+)
+breaker_trips = metrics.counter(
+    "sandbox_environment_breaker_trips_total",
+    "环境被熔断的次数"
+)
+breaker_rejections = metrics.counter(
+    "sandbox_environment_breaker_rejections_total",
+    "因环境已熔断而直接拒绝（503）的执行请求数"
+)
+
+
+def is_interpreter_failure(stderr: str) -> bool:
+    """退出码非0的执行是否疑似因为解释器本身无法启动（stderr由用户代码控制，熔断前还要探测确认）"""
+    return bool(INTERPRETER_FAILURE.search(stderr or ""))
+
+
+class EnvironmentBreaker:
+    """
+    按环境统计连续的基础设施故障并熔断
+
+    - record(): 每次执行结束后调用
+    - check(): 执行前调用，环境已熔断时抛出503
+    - start(): 在工作进程启动时开始后台探测
+    熔断状态保存在环境注册表中，所有工作进程共享；连续故障计数只在当前进程内统计
+    """
+
+    def __init__(self):
+        self._failures: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._rebuilds: Set[asyncio.Task] = set()
+        self._confirmations: Dict[str, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CIRCUIT_BREAKER_THRESHOLD > 0
+
+    def record(self, environment: Optional[str], infrastructure_error: bool, detail: str = ""):
+        """
+        记录一次执行的结果
+
+        Args:
+            environment: 环境名称，默认环境（服务自身的解释器）不熔断
+            infrastructure_error: 是否为基础设施故障
+            detail: 故障说明，熔断时写入注册表
+        """
+        if not environment or not self.enabled:
+            return
+        if not infrastructure_error:
+            self._failures.pop(environment, None)
+            return
+        infrastructure_failures.inc(environment=environment)
+        failures = self._failures.get(environment, 0) + 1
+        self._failures[environment] = failures
+        if failures >= settings.CIRCUIT_BREAKER_THRESHOLD and environment not in self._confirmations:
+            self._failures.pop(environment, None)
+            task = asyncio.create_task(self._confirm(environment, failures))
+            self._confirmations[environment] = task
+            task.add_done_callback(lambda _: self._confirmations.pop(environment, None))
+
+    async def _confirm(self, environment: str, failures: int):
+        """达到阈值后在后台探测解释器，探测失败才熔断，成功时说明故障输出来自用户代码"""
+        from .environment_manager import environment_manager
+        info = environment_manager.environments.get(environment) or {}
+        ok, detail = await asyncio.to_thread(self._probe, environment_manager.python_executable(info))
+        if ok:
+            print(f"⚠️ 环境 {environment} 连续 {failures} 次疑似基础设施故障，但解释器探测成功，不熔断")
+            return
+        self._trip(environment, failures, detail)
+
+    def _trip(self, environment: str, failures: int, detail: str):
+        from .environment_manager import environment_manager
+        reason = f"连续 {failures} 次基础设施故障: {detail.strip()[-500:]}"
+        if environment_manager.mark_degraded(environment, reason):
+            breaker_trips.inc(environment=environment)
+            print(f"🔌 环境 {environment} 已熔断，{reason}")
+        # 空闲的预热解释器同样不可用
+        warm_pool.remove(environment)
+
+    def check(self, environment: Optional[str]):
+        """环境已熔断时快速失败，集群中的协调节点收到503后会换节点重试"""
+        if not environment or not self.enabled:
+            return
+        from .environment_manager import environment_manager
+        info = environment_manager.environments.get(environment)
+        if info and info.get("status") == "degraded":
+            breaker_rejections.inc(environment=environment)
+            raise HTTPException(
+                status_code=503,
+                detail=f"环境 '{environment}' 已熔断（degraded）: {info.get('error')}，后台正在定期探测",
+                headers={"Retry-After": str(max(1, int(settings.CIRCUIT_BREAKER_PROBE_INTERVAL)))}
+            )
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in [self._task, *self._rebuilds, *self._confirmations.values()]:
+            if task is not None:
+                task.cancel()
+        if self._task is not None:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.CIRCUIT_BREAKER_PROBE_INTERVAL)
+            try:
+                await self.probe_degraded()
+            except Exception as e:
+                print(f"⚠️ 探测熔断环境失败: {e}")
+
+    async def probe_degraded(self):
+        """探测所有 degraded 环境，同一环境同时只由一个工作进程探测"""
+        from .environment_manager import environment_manager
+        for name, info in environment_manager.environments.items():
+            if info.get("status") != "degraded":
+                continue
+            lock = shared_state.lock(f"breaker-probe-{name}")
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                ok, detail = await asyncio.to_thread(self._probe, environment_manager.python_executable(info))
+                if ok:
+                    if environment_manager.restore_environment(name):
+                        print(f"✅ 环境 {name} 探测成功，已恢复")
+                elif settings.CIRCUIT_BREAKER_REBUILD:
+                    print(f"🔧 环境 {name} 探测失败（{detail}），开始重建")
+                    task = asyncio.create_task(self._rebuild(name))
+                    self._rebuilds.add(task)
+                    task.add_done_callback(self._rebuilds.discard)
+            finally:
+                lock.release()
+
+    @staticmethod
+    def _probe(python_executable: Optional[str]) -> Tuple[bool, str]:
+        """运行一个最小的程序检查解释器是否可用"""
+        if not python_executable:
+            return False, "环境没有解释器路径"
+        try:
+            completed = subprocess.run(
+                [python_executable, "-c", PROBE_CODE],
+                capture_output=True,
+                timeout=PROBE_TIMEOUT,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return False, str(e)
+        if completed.returncode == 0 and completed.stdout.strip() == b"ok":
+            return True, ""
+        return False, completed.stderr.decode("utf-8", "replace").strip()[-500:] or f"退出码 {completed.returncode}"
+
+    async def _rebuild(self, name: str):
+        from .environment_manager import environment_manager
+        try:
+            await environment_manager.rebuild_environment(name)
+            print(f"✅ 环境 {name} 已重建")
+        except Exception as e:
+            print(f"❌ 环境 {name} 重建失败: {e}")
+
+
+# 全局环境熔断实例
+environment_breaker = EnvironmentBreaker()
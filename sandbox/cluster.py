@@ -0,0 +1,655 @@
+"""
+集群模块
+协调节点（NODE_ROLE=coordinator）维护工作节点注册表，根据心跳上报的环境、预热状态和负载，
+把执行请求转发到已就绪该环境、预热最充分且负载最低的工作节点，节点不可达时自动换节点重试；
+环境在所有节点上都未就绪或已就绪节点全部满载时，在空闲节点上后台构建该环境。
+工作节点（NODE_ROLE=worker）定期向协调节点发送心跳
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import secrets
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+from models.cluster import NodeHeartbeat, ClusterNode, ClusterNodeListResponse, EnvironmentStats
+from models.environment import EnvironmentScript, EnvironmentResponse
+from config.settings import settings
+from .shared_state import shared_state
+from .tracing import propagation_env, REQUEST_ID_ENV, TRACEPARENT_ENV
+from .warm_pool import warm_pool
+from .scheduler import execution_scheduler
+
+
+# 转发时附加在响应上的节点标识头
+NODE_HEADER = "X-Sandbox-Node"
+# 转发失败后节点被跳过的时间（秒），收到新心跳后恢复
+FAILURE_BACKOFF = 10.0
+# 这些状态码表示节点暂时无法接收任务，请求尚未执行，可以换节点重试
+RETRYABLE_STATUS_CODES = (429, 503)
+# 放置评分（以负载为单位）：节点没有该环境的空闲预热解释器时的惩罚，以及近期未命中率的权重
+COLD_PENALTY = 0.5
+MISS_PENALTY = 0.25
+# 同一环境在同一节点上重复触发后台构建的最小间隔（秒），避免构建失败的节点被反复调度
+BUILD_COOLDOWN = 300.0
+# 默认环境在预热统计中的键
+DEFAULT_ENV_KEY = "default"
+# 协调节点返回的 output_id 为 "<节点ID>.<工作节点上的output_id>"，下载时据此转发到执行所在的节点
+OUTPUT_ID_SEPARATOR = "."
+
+
+def verify_cluster_token(token: Optional[str]):
+    """校验节点间通信令牌，集群模式下必须配置 CLUSTER_TOKEN（见 check_cluster_settings）"""
+    if not settings.CLUSTER_TOKEN or not secrets.compare_digest(token or "", settings.CLUSTER_TOKEN):
+        raise HTTPException(status_code=401, detail="集群令牌无效")
+
+
+def check_cluster_settings():
+    """
+    集群模式下拒绝在没有 CLUSTER_TOKEN 的情况下启动：否则任何客户端都能注册自己的节点地址，
+    接收其他用户的代码和输入文件，或注销真实的节点
+    """
+    if settings.NODE_ROLE in ("coordinator", "worker") and not settings.CLUSTER_TOKEN:
+        raise RuntimeError(f"NODE_ROLE={settings.NODE_ROLE} 时必须设置 CLUSTER_TOKEN")
+
+
+def _forward_headers() -> Dict[str, str]:
+    """转发请求时携带的追踪头"""
+    env = propagation_env()
+    headers = {}
+    if REQUEST_ID_ENV in env:
+        headers["X-Request-ID"] = env[REQUEST_ID_ENV]
+    if TRACEPARENT_ENV in env:
+        headers["traceparent"] = env[TRACEPARENT_ENV]
+    return headers
+
+
+def _qualify_output_id(body: bytes, node_id: str) -> bytes:
+    """在工作节点返回的执行结果（或流式执行的 result 事件）的 output_id 前加上节点ID"""
+    if b'"output_id"' not in body:
+        return body
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(payload, dict):
+        return body
+    result = payload.get("result") if payload.get("type") == "result" else payload
+    if not isinstance(result, dict) or not isinstance(result.get("output_id"), str):
+        return body
+    result["output_id"] = f"{node_id}{OUTPUT_ID_SEPARATOR}{result['output_id']}"
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+class ClusterRegistry:
+    """
+    工作节点注册表（协调节点使用）
+
+    节点信息保存在共享存储中，协调节点以多工作进程运行时各进程看到同一份注册表；
+    每个进程额外记录自己转发中的请求数，弥补心跳间隔内的负载变化。
+    通过协调节点创建的环境定义同样保存在共享存储中，用于在工作节点上按需构建
+    """
+
+    def __init__(self):
+        self._store = None
+        self._definitions = None
+        self._inflight: Dict[str, int] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._build_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = shared_state.store("cluster_nodes")
+        return self._store
+
+    @property
+    def definitions(self):
+        if self._definitions is None:
+            self._definitions = shared_state.store("cluster_environments")
+        return self._definitions
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100),
+                timeout=httpx.Timeout(settings.MAX_TIMEOUT + 30, connect=3.0),
+            )
+        return self._client
+
+    async def aclose(self):
+        for task in list(self._build_tasks):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def record_heartbeat(self, heartbeat: NodeHeartbeat):
+        """记录心跳，同时清除该节点的转发失败标记"""
+        now = time.time()
+        with self.store.update() as nodes:
+            # 长时间没有心跳的节点（如已下线但未注销）从注册表中移除
+            for node_id in [k for k, v in nodes.items() if now - v["last_heartbeat"] > settings.NODE_TIMEOUT * 10]:
+                del nodes[node_id]
+            previous = nodes.get(heartbeat.node_id, {})
+            if not previous:
+                print(f"🟢 工作节点加入: {heartbeat.node_id} ({heartbeat.url})")
+            nodes[heartbeat.node_id] = {
+                **heartbeat.model_dump(),
+                "url": heartbeat.url.rstrip("/"),
+                "last_heartbeat": now,
+                "failures": 0,
+                "failed_until": 0.0,
+                "last_error": previous.get("last_error"),
+            }
+
+    def remove(self, node_id: str) -> bool:
+        with self.store.update() as nodes:
+            removed = nodes.pop(node_id, None) is not None
+        if removed:
+            print(f"🔴 工作节点退出: {node_id}")
+        return removed
+
+    def mark_failed(self, node_id: str, error: str):
+        """转发失败时暂时跳过该节点"""
+        print(f"⚠️ 转发到工作节点 {node_id} 失败: {error}")
+        with self.store.update() as nodes:
+            node = nodes.get(node_id)
+            if node is not None:
+                node["failures"] = node.get("failures", 0) + 1
+                node["failed_until"] = time.time() + FAILURE_BACKOFF
+                node["last_error"] = error
+
+    def _is_healthy(self, node: Dict[str, Any], now: float) -> bool:
+        return (
+            now - node["last_heartbeat"] <= settings.NODE_TIMEOUT
+            and node.get("failed_until", 0.0) <= now
+        )
+
+    def _load(self, node: Dict[str, Any]) -> float:
+        inflight = self._inflight.get(node["node_id"], 0)
+        return (node.get("active", 0) + inflight) / max(node.get("capacity", 1), 1)
+
+    def list_nodes(self) -> ClusterNodeListResponse:
+        now = time.time()
+        nodes = [
+            ClusterNode(
+                **{k: v for k, v in node.items() if k in ClusterNode.model_fields},
+                inflight=self._inflight.get(node["node_id"], 0),
+                load=self._load(node),
+                healthy=self._is_healthy(node, now),
+            )
+            for node in self.store.read().values()
+        ]
+        return ClusterNodeListResponse(
+            nodes=nodes,
+            total=len(nodes),
+            healthy=sum(1 for node in nodes if node.healthy),
+        )
+
+    def _placement_score(self, node: Dict[str, Any], environment: Optional[str]) -> float:
+        """
+        放置评分，越小越好
+
+        在负载之上叠加冷启动代价：节点没有空闲的预热解释器时加 COLD_PENALTY，
+        近期命中率低时再按未命中率加权，负载相近时优先选择预热充分的节点，
+        负载差距较大时仍然分散到空闲节点
+        """
+        stats = node.get("environment_stats", {}).get(environment or DEFAULT_ENV_KEY)
+        if stats is None:
+            return self._load(node) + COLD_PENALTY + MISS_PENALTY
+        cold = 0.0 if stats.get("warm", 0) > 0 else COLD_PENALTY
+        return self._load(node) + cold + MISS_PENALTY * (1.0 - stats.get("hit_rate", 0.0))
+
+    def pick(self, environment: Optional[str], exclude: Set[str]) -> Optional[Dict[str, Any]]:
+        """选择已就绪该环境、健康且放置评分最低的节点"""
+        now = time.time()
+        candidates = [
+            node for node in self.store.read().values()
+            if node["node_id"] not in exclude
+            and self._is_healthy(node, now)
+            and (environment is None or environment in node.get("environments", []))
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda node: (self._placement_score(node, environment), node.get("failures", 0))
+        )
+
+    def register_environment(self, env_script: EnvironmentScript) -> Dict[str, Any]:
+        """保存环境定义，之后可在任意工作节点上构建"""
+        with self.definitions.update() as definitions:
+            if env_script.name in definitions:
+                raise ValueError(f"环境 '{env_script.name}' 已存在")
+            definition = {
+                **env_script.model_dump(mode="json"),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "build_requests": {},
+            }
+            definitions[env_script.name] = definition
+        return definition
+
+    def remove_environment(self, name: str) -> bool:
+        with self.definitions.update() as definitions:
+            return definitions.pop(name, None) is not None
+
+    def _environment_nodes(self, name: str, now: float) -> Dict[str, List[str]]:
+        """健康节点中已就绪/正在构建该环境的节点"""
+        result = {"ready": [], "building": []}
+        for node in self.store.read().values():
+            if not self._is_healthy(node, now):
+                continue
+            if name in node.get("environments", []):
+                result["ready"].append(node["node_id"])
+            elif name in node.get("building", []):
+                result["building"].append(node["node_id"])
+        return result
+
+    def environment_view(self, name: str) -> Optional[EnvironmentResponse]:
+        """协调节点视角下的环境信息，状态由各工作节点的心跳汇总"""
+        definition = self.definitions.get(name)
+        nodes = self._environment_nodes(name, time.time())
+        if definition is None and not nodes["ready"] and not nodes["building"]:
+            return None
+        definition = definition or {}
+        if nodes["ready"]:
+            status = "ready"
+        elif nodes["building"] or self._requested_build(name, time.time()):
+            status = "building"
+        else:
+            status = "pending"
+        return EnvironmentResponse(
+            name=name,
+            description=definition.get("description", ""),
+            base_image=definition.get("base_image", ""),
+            python_version=definition.get("python_version", ""),
+            status=status,
+            created_at=definition.get("created_at", ""),
+            nodes=nodes["ready"],
+        )
+
+    def list_environment_views(self) -> List[EnvironmentResponse]:
+        names = set(self.definitions.read())
+        for node in self.store.read().values():
+            names.update(node.get("environments", []))
+            names.update(node.get("building", []))
+        views = (self.environment_view(name) for name in sorted(names))
+        return [view for view in views if view is not None]
+
+    def _requested_build(self, name: str, now: float) -> Optional[str]:
+        """最近被调度构建该环境、但心跳尚未上报构建状态的健康节点"""
+        requests = (self.definitions.get(name) or {}).get("build_requests", {})
+        for node_id, requested in sorted(requests.items(), key=lambda item: item[1], reverse=True):
+            node = self.store.get(node_id)
+            if (
+                node is not None
+                and self._is_healthy(node, now)
+                and now - requested <= BUILD_COOLDOWN
+                and node["last_heartbeat"] < requested + settings.HEARTBEAT_INTERVAL
+            ):
+                return node_id
+        return None
+
+    def request_build(self, name: str) -> Optional[str]:
+        """
+        在一个尚未拥有该环境的空闲节点上后台构建环境
+
+        只有通过协调节点创建的环境才有定义可用；同一节点在 BUILD_COOLDOWN 内不会被重复调度
+
+        Returns:
+            Optional[str]: 被调度构建的节点ID，没有可用节点或没有环境定义时返回None
+        """
+        now = time.time()
+        with self.definitions.update() as definitions:
+            definition = definitions.get(name)
+            if definition is None:
+                return None
+            requests = definition.setdefault("build_requests", {})
+            candidates = [
+                node for node in self.store.read().values()
+                if self._is_healthy(node, now)
+                and name not in node.get("environments", [])
+                and name not in node.get("building", [])
+                and now - requests.get(node["node_id"], 0.0) > BUILD_COOLDOWN
+            ]
+            if not candidates:
+                return None
+            node = min(candidates, key=self._load)
+            requests[node["node_id"]] = now
+        script = {k: v for k, v in definition.items() if k in EnvironmentScript.model_fields}
+
+        print(f"🏗️ 在工作节点 {node['node_id']} 上后台构建环境 {name}")
+        task = asyncio.create_task(self._build_on(node, script))
+        self._build_tasks.add(task)
+        task.add_done_callback(self._build_tasks.discard)
+        return node["node_id"]
+
+    async def _build_on(self, node: Dict[str, Any], script: Dict[str, Any]):
+        try:
+            response = await self.client.post(
+                node["url"] + "/environments",
+                json=script,
+                headers=_forward_headers(),
+                timeout=httpx.Timeout(None, connect=3.0),
+            )
+            if response.status_code >= 400:
+                print(f"❌ 工作节点 {node['node_id']} 构建环境 {script['name']} 失败: {response.text[:200]}")
+        except httpx.HTTPError as e:
+            print(f"❌ 工作节点 {node['node_id']} 构建环境 {script['name']} 失败: {type(e).__name__}: {e}")
+
+    async def delete_environment(self, name: str) -> bool:
+        """删除环境定义，并在所有已就绪该环境的节点上删除环境"""
+        removed = self.remove_environment(name)
+        now = time.time()
+        nodes = [node for node in self.store.read().values()
+                 if self._is_healthy(node, now) and name in node.get("environments", [])]
+        for node in nodes:
+            try:
+                await self.client.delete(f"{node['url']}/environments/{name}", headers=_forward_headers())
+            except httpx.HTTPError as e:
+                print(f"⚠️ 在工作节点 {node['node_id']} 上删除环境 {name} 失败: {e}")
+        return removed or bool(nodes)
+
+    def _ensure_placement(self, environment: Optional[str]) -> Optional[str]:
+        """
+        环境在所有健康节点上都未就绪，或已就绪的节点全部满载时，触发后台构建
+
+        Returns:
+            Optional[str]: 正在构建该环境的节点ID（环境尚无就绪节点时用于提示客户端）
+        """
+        if environment is None:
+            return None
+        now = time.time()
+        nodes = self._environment_nodes(environment, now)
+        ready = [self.store.get(node_id) for node_id in nodes["ready"]]
+        saturated = all(self._load(node) >= 1.0 for node in ready if node)
+        if ready and not saturated:
+            return None
+        if nodes["building"]:
+            return nodes["building"][0]
+        return self._requested_build(environment, now) or self.request_build(environment)
+
+    def _no_node_error(
+        self,
+        environment: Optional[str],
+        last_error: Optional[str],
+        building: Optional[str] = None
+    ) -> HTTPException:
+        if last_error:
+            return HTTPException(status_code=502, detail=f"所有候选工作节点均转发失败，最后错误: {last_error}")
+        if building:
+            return HTTPException(
+                status_code=503,
+                detail=f"环境 '{environment}' 正在工作节点 {building} 上构建，请稍后重试",
+                headers={"Retry-After": str(int(max(settings.HEARTBEAT_INTERVAL, 30)))},
+            )
+        target = f"已就绪环境 '{environment}' 的" if environment else ""
+        return HTTPException(
+            status_code=503,
+            detail=f"没有{target}可用工作节点",
+            headers={"Retry-After": str(int(settings.HEARTBEAT_INTERVAL))},
+        )
+
+    async def dispatch(
+        self,
+        path: str,
+        environment: Optional[str],
+        timeout: float,
+        **request_kwargs
+    ) -> Response:
+        """
+        转发执行请求
+
+        仅在连接失败或节点返回429/503时换节点重试，这两种情况下请求没有被执行；
+        读取超时等请求可能已被执行的错误不会重试，避免重复执行用户代码
+
+        Args:
+            path: 工作节点上的接口路径
+            environment: 请求的环境，None表示默认环境（所有节点都可以执行）
+            timeout: 代码执行超时（秒）
+            **request_kwargs: 透传给 httpx 的请求参数（content/headers/data/files）
+
+        Returns:
+            Response: 工作节点的原始响应
+        """
+        tried: Set[str] = set()
+        last_error = None
+        headers = {**request_kwargs.pop("headers", {}), **_forward_headers()}
+        building = self._ensure_placement(environment)
+
+        for _ in range(settings.DISPATCH_RETRIES + 1):
+            node = self.pick(environment, tried)
+            if node is None:
+                break
+            node_id = node["node_id"]
+            tried.add(node_id)
+
+            self._inflight[node_id] = self._inflight.get(node_id, 0) + 1
+            try:
+                response = await self.client.post(
+                    node["url"] + path,
+                    headers=headers,
+                    timeout=httpx.Timeout(timeout + 30, connect=3.0),
+                    **request_kwargs
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                last_error = f"{node_id}: {type(e).__name__}"
+                self.mark_failed(node_id, last_error)
+                continue
+            except httpx.HTTPError as e:
+                raise HTTPException(status_code=502, detail=f"工作节点 {node_id} 请求失败: {type(e).__name__}: {e}")
+            finally:
+                self._inflight[node_id] -= 1
+
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                last_error = f"{node_id}: HTTP {response.status_code}"
+                continue
+
+            return Response(
+                content=_qualify_output_id(response.content, node_id),
+                status_code=response.status_code,
+                media_type=response.headers.get("content-type"),
+                headers={NODE_HEADER: node_id},
+            )
+
+        raise self._no_node_error(environment, last_error, building)
+
+    async def dispatch_stream(
+        self,
+        path: str,
+        environment: Optional[str],
+        timeout: float,
+        **request_kwargs
+    ) -> StreamingResponse:
+        """转发流式执行请求，只在建立连接前重试"""
+        tried: Set[str] = set()
+        last_error = None
+        headers = {**request_kwargs.pop("headers", {}), **_forward_headers()}
+        building = self._ensure_placement(environment)
+
+        for _ in range(settings.DISPATCH_RETRIES + 1):
+            node = self.pick(environment, tried)
+            if node is None:
+                break
+            node_id = node["node_id"]
+            tried.add(node_id)
+
+            request = self.client.build_request(
+                "POST", node["url"] + path,
+                headers=headers,
+                timeout=httpx.Timeout(timeout + 30, connect=3.0),
+                **request_kwargs
+            )
+            self._inflight[node_id] = self._inflight.get(node_id, 0) + 1
+            try:
+                response = await self.client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                self._inflight[node_id] -= 1
+                last_error = f"{node_id}: {type(e).__name__}"
+                self.mark_failed(node_id, last_error)
+                continue
+            except httpx.HTTPError as e:
+                self._inflight[node_id] -= 1
+                raise HTTPException(status_code=502, detail=f"工作节点 {node_id} 请求失败: {type(e).__name__}: {e}")
+
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                await response.aclose()
+                self._inflight[node_id] -= 1
+                last_error = f"{node_id}: HTTP {response.status_code}"
+                continue
+
+            return StreamingResponse(
+                self._relay(response, node_id),
+                status_code=response.status_code,
+                media_type=response.headers.get("content-type"),
+                headers={NODE_HEADER: node_id},
+            )
+
+        raise self._no_node_error(environment, last_error, building)
+
+    async def _relay(self, response: httpx.Response, node_id: str) -> AsyncIterator[bytes]:
+        """逐行转发 NDJSON 事件流，result 事件中的 output_id 加上节点ID"""
+        try:
+            async for line in response.aiter_lines():
+                yield _qualify_output_id(line.encode("utf-8"), node_id) + b"\n"
+        finally:
+            await response.aclose()
+            self._inflight[node_id] -= 1
+
+    async def fetch_output(self, output_id: str, stream: str) -> StreamingResponse:
+        """
+        从执行所在的工作节点下载被截断的完整输出
+
+        Args:
+            output_id: 协调节点返回的 output_id（"<节点ID>.<工作节点上的output_id>"）
+            stream: stdout 或 stderr
+        """
+        node_id, separator, worker_output_id = output_id.rpartition(OUTPUT_ID_SEPARATOR)
+        node = self.store.read().get(node_id) if separator and worker_output_id.isalnum() else None
+        if node is None:
+            raise HTTPException(status_code=404, detail=f"输出 '{output_id}/{stream}' 不存在或所在的工作节点已下线")
+        request = self.client.build_request(
+            "GET", f"{node['url']}/outputs/{worker_output_id}/{stream}",
+            headers=_forward_headers(),
+            timeout=httpx.Timeout(60.0, connect=3.0),
+        )
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"工作节点 {node_id} 请求失败: {type(e).__name__}: {e}")
+        headers = {NODE_HEADER: node_id}
+        if "content-disposition" in response.headers:
+            headers["Content-Disposition"] = response.headers["content-disposition"]
+        return StreamingResponse(
+            self._download(response),
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type"),
+            headers=headers,
+        )
+
+    @staticmethod
+    async def _download(response: httpx.Response) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in response.aiter_bytes():
+                yield chunk
+        finally:
+            await response.aclose()
+
+
+class HeartbeatSender:
+    """工作节点心跳任务，定期向协调节点上报可用环境、预热状态和当前负载"""
+
+    def __init__(self, executor, env_manager):
+        self.executor = executor
+        self.env_manager = env_manager
+        self._task: Optional[asyncio.Task] = None
+        self.node_id = settings.NODE_ID or self._default_node_id()
+        self.capacity = settings.NODE_CAPACITY or settings.EXECUTION_SLOTS or os.cpu_count() or 1
+
+    @staticmethod
+    def _default_node_id() -> str:
+        port = urlparse(settings.NODE_URL).port
+        return f"{socket.gethostname()}-{port}" if port else socket.gethostname()
+
+    def heartbeat(self) -> NodeHeartbeat:
+        environments = self.env_manager.list_environments()
+        return NodeHeartbeat(
+            node_id=self.node_id,
+            url=settings.NODE_URL,
+            environments=[env.name for env in environments if env.status == "ready"],
+            building=[env.name for env in environments if env.status == "building"],
+            environment_stats={key: EnvironmentStats(**stats) for key, stats in warm_pool.stats().items()},
+            active=self.executor.active_executions,
+            # 自适应并发开启时上报当前的执行槽数量
+            capacity=self.capacity if settings.NODE_CAPACITY else (execution_scheduler.limit or self.capacity),
+        )
+
+    def start(self):
+        if not settings.COORDINATOR_URL or not settings.NODE_URL:
+            print("⚠️ 工作节点模式需要设置 COORDINATOR_URL 和 NODE_URL，心跳未启动")
+            return
+        self._task = asyncio.create_task(self._run())
+        print(f"💓 工作节点 {self.node_id} 开始向 {settings.COORDINATOR_URL} 发送心跳")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        # 主动注销，协调节点无需等待心跳超时
+        try:
+            async with httpx.AsyncClient(timeout=3.0) as client:
+                await client.delete(
+                    f"{settings.COORDINATOR_URL.rstrip('/')}/cluster/nodes/{self.node_id}",
+                    headers=self._headers(),
+                )
+        except httpx.HTTPError:
+            pass
+
+    def _headers(self) -> Dict[str, str]:
+        return {"X-Cluster-Token": settings.CLUSTER_TOKEN} if settings.CLUSTER_TOKEN else {}
+
+    async def _run(self):
+        url = f"{settings.COORDINATOR_URL.rstrip('/')}/cluster/heartbeat"
+        failing = False
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                try:
+                    response = await client.post(
+                        url, content=self.heartbeat().model_dump_json(),
+                        headers={"Content-Type": "application/json", **self._headers()},
+                    )
+                    response.raise_for_status()
+                    if failing:
+                        print("✅ 心跳恢复")
+                    failing = False
+                except Exception as e:
+                    if not failing:
+                        print(f"❌ 发送心跳失败: {e}")
+                    failing = True
+                await asyncio.sleep(settings.HEARTBEAT_INTERVAL)
+
+
+def is_coordinator() -> bool:
+    return settings.NODE_ROLE == "coordinator"
+
+
+def is_worker() -> bool:
+    return settings.NODE_ROLE == "worker"
+
+
+# 全局节点注册表实例（仅协调节点使用）
+cluster_registry = ClusterRegistry()
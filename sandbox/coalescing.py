@@ -0,0 +1,132 @@
+"""
+请求合并（single-flight）
+多个智能体副本同时提交相同的确定性代码时，只运行一次：内容哈希相同的并发请求挂到同一个
+进行中的执行上，全部拿到同一个 ExecuteResponse。执行结束即从表中移除，不缓存结果。
+合并只在当前工作进程内进行；协调节点在转发前同样合并，避免相同请求被分散到不同工作节点
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, TypeVar, Union
+
+from config.settings import settings
+from .metrics import metrics
+
+T = TypeVar("T")
+
+coalesced_requests = metrics.counter(
+    "sandbox_coalesced_requests_total",
+    "挂到进行中的相同执行上、没有单独运行的请求数"
+)
+coalesce_saved_seconds = metrics.counter(
+    "sandbox_coalesce_saved_seconds_total",
+    "合并节省的执行时间（秒），共用同一次执行的每个额外请求计一次完整执行的耗时"
+)
+coalesce_overflow = metrics.counter(
+    "sandbox_coalesce_overflow_total",
+    "相同执行的等待者达到 COALESCE_MAX_WAITERS 后单独运行的请求数"
+)
+
+
+def coalescing_enabled(requested: Optional[bool]) -> bool:
+    """请求中的 coalesce 字段优先，未指定时使用 COALESCE_ENABLED"""
+    return settings.COALESCE_ENABLED if requested is None else requested
+
+
+def execution_key(kind: str, params: Dict[str, Any], files: Optional[Mapping[str, Union[str, bytes]]] = None) -> str:
+    """
+    计算执行请求的内容哈希
+
+    Args:
+        kind: 接口类型，不同接口的请求不会合并
+        params: 影响执行结果的参数（代码、超时、环境、性能分析选项等）
+        files: 输入文件，与顺序无关
+
+    Returns:
+        str: SHA-256十六进制摘要
+    """
+    digest = hashlib.sha256(json.dumps([kind, params], sort_keys=True, default=str).encode("utf-8"))
+    for name in sorted(files or {}):
+        content = files[name]
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        digest.update(name.encode("utf-8") + b"\0" + len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class _Flight:
+    """一次进行中的执行"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.started = time.monotonic()
+        self.waiters = 1
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    进行中执行的合并表
+
+    每个请求通过 asyncio.shield 等待共享的执行任务，单个请求被取消（客户端断开、到达截止时间）
+    只会让它自己退出；最后一个等待者退出时才取消执行，由执行器终止进程并清理工作目录
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    @property
+    def inflight(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: str, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行 operation，已有相同 key 的执行在进行时改为等待它的结果
+
+        Args:
+            key: execution_key() 的结果
+            operation: 返回执行协程的函数
+
+        Returns:
+            T: operation 的结果（合并的请求之间共享同一个对象）
+        """
+        flight = self._flights.get(key)
+        if flight is not None and flight.followers < settings.COALESCE_MAX_WAITERS:
+            flight.waiters += 1
+            flight.followers += 1
+            coalesced_requests.inc()
+        else:
+            if flight is not None:
+                coalesce_overflow.inc()
+            flight = _Flight(asyncio.ensure_future(operation()))
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._finish(key, flight))
+            self._flights.setdefault(key, flight)
+
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                await asyncio.wait({flight.task})
+            raise
+
+    def _finish(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.cancelled() or flight.task.exception() is not None:
+            return
+        # 结束时仍在等待的请求共用了一次执行，其余每个都省去了一次完整执行
+        if flight.waiters > 1:
+            coalesce_saved_seconds.inc((flight.waiters - 1) * (time.monotonic() - flight.started))
+
+
+# 全局请求合并实例
+single_flight = SingleFlight()
+
+metrics.gauge(
+    "sandbox_coalesce_inflight", "可供合并的进行中执行数",
+    lambda: {(): single_flight.inflight}
+)
@@ -0,0 +1,298 @@
+"""
+HTTP压缩模块
+按 Accept-Encoding 协商压缩响应（zstd/gzip），并解压 Content-Encoding 为 gzip/zstd 的请求体。
+小于阈值的响应不压缩，避免为hello world级别的回复付出压缩开销
+"""
+
+import json
+import zlib
+from typing import Dict, List, Optional
+
+from config.settings import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+
+def supported_encodings() -> List[str]:
+    """服务端支持的编码，按优先级排序"""
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 编码 -> q值"""
+    accepted = {}
+    for item in header.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        name = parts[0].lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    选择响应编码
+
+    q值相同时按服务端优先级（zstd优先于gzip）选择，不接受任何支持的编码时返回None
+    """
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    """统一gzip与zstd的增量压缩接口"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=settings.ZSTD_COMPRESSION_LEVEL).compressobj()
+        else:
+            self._obj = zlib.compressobj(settings.GZIP_COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """压缩一段数据；flush为True时立即输出已压缩的块，用于流式响应"""
+        out = self._obj.compress(data)
+        if flush:
+            if self.encoding == "zstd":
+                out += self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            else:
+                out += self._obj.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        return self._obj.flush()
+
+
+class DecompressionError(ValueError):
+    """请求体解压失败或解压后超过大小限制"""
+
+
+class UnsupportedEncodingError(DecompressionError):
+    """请求使用了服务端不支持的Content-Encoding"""
+
+
+def decompress_body(body: bytes, encoding: str, max_size: int) -> bytes:
+    """
+    解压请求体
+
+    Args:
+        body: 压缩后的请求体
+        encoding: gzip 或 zstd
+        max_size: 解压后允许的最大字节数，防止压缩炸弹
+
+    Returns:
+        bytes: 解压后的数据
+    """
+    try:
+        if encoding == "gzip":
+            obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = obj.decompress(body, max_size + 1)
+            if obj.unconsumed_tail:
+                data += b"x"  # 仍有未解压数据，必然超限
+            elif not obj.eof:
+                raise DecompressionError("gzip数据不完整")
+        else:
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                data = reader.read(max_size + 1)
+    except (zlib.error, EOFError) as e:
+        raise DecompressionError(f"无法解压请求体: {e}")
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise DecompressionError(f"无法解压请求体: {e}")
+        raise
+
+    if len(data) > max_size:
+        raise DecompressionError(f"解压后的请求体超过限制 ({max_size} 字节)")
+    return data
+
+
+class CompressionMiddleware:
+    """
+    ASGI压缩中间件
+
+    - 请求：Content-Encoding 为 gzip/zstd 时先解压，下游看到的是普通请求体
+    - 响应：客户端接受且内容可压缩、大小不低于 COMPRESSION_MIN_SIZE 时压缩；
+      流式响应（NDJSON、文件下载）逐块压缩并立即刷新，不增加首字节延迟
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else settings.COMPRESSION_MIN_SIZE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = _headers(scope)
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            try:
+                scope, receive = await self._decompress_request(scope, receive, content_encoding)
+            except UnsupportedEncodingError as e:
+                await _send_error(send, 415, str(e))
+                return
+            except DecompressionError as e:
+                await _send_error(send, 400, str(e))
+                return
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size))
+
+    async def _decompress_request(self, scope, receive, encoding: str):
+        if encoding not in supported_encodings():
+            raise UnsupportedEncodingError(f"不支持的Content-Encoding: {encoding}")
+
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > settings.MAX_REQUEST_BODY_SIZE:
+                raise DecompressionError(f"请求体超过限制 ({settings.MAX_REQUEST_BODY_SIZE} 字节)")
+            more_body = message.get("more_body", False)
+
+        body = decompress_body(b"".join(chunks), encoding, settings.MAX_REQUEST_BODY_SIZE)
+
+        raw_headers = [
+            (k, v) for k, v in scope["headers"]
+            if k not in (b"content-encoding", b"content-length")
+        ]
+        raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        scope = dict(scope, headers=raw_headers)
+
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return scope, replay
+
+
+class _CompressingSender:
+    """包装send，推迟发送响应头直到能判断是否压缩"""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not self._should_compress(body, more_body):
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.compressor = _Compressor(self.encoding)
+            await self.send(self._compressed_start())
+            if not more_body:
+                await self.send({
+                    "type": "http.response.body",
+                    "body": self.compressor.compress(body) + self.compressor.finish(),
+                })
+                return
+
+        if more_body:
+            data = self.compressor.compress(body, flush=True)
+        else:
+            data = self.compressor.compress(body) + self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _should_compress(self, body: bytes, more_body: bool) -> bool:
+        headers = _headers(self.start_message)
+        if "content-encoding" in headers:
+            return False
+        if not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            return False
+        if more_body:
+            # 流式响应：有Content-Length时按其判断，否则（如NDJSON）总是压缩
+            length = headers.get("content-length")
+            return length is None or int(length) >= self.minimum_size
+        return len(body) >= self.minimum_size
+
+    def _compressed_start(self):
+        raw_headers = []
+        vary = [b"Accept-Encoding"]
+        for k, v in self.start_message.get("headers", []):
+            name = k.lower()
+            if name == b"vary":
+                vary.insert(0, v)
+            elif name not in (b"content-length", b"accept-ranges"):
+                raw_headers.append((k, v))
+        raw_headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        raw_headers.append((b"vary", b", ".join(vary)))
+        return dict(self.start_message, headers=raw_headers)
+
+
+def _headers(scope_or_message) -> Dict[str, str]:
+    return {
+        k.decode("latin-1").lower(): v.decode("latin-1")
+        for k, v in scope_or_message.get("headers", [])
+    }
+
+
+async def _send_error(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,263 @@
+"""
+自适应并发
+按主机压力调整执行槽数量（execution_scheduler.limit），取代固定的 EXECUTION_SLOTS：
+- 每个周期读取 Linux PSI（/proc/pressure/{cpu,memory,io}）、1分钟负载和可用内存
+- PSI 按两次采样之间 total 的增量计算本周期的停顿比例，比 avg10 反应更快
+- 任一压力超过阈值或可用内存不足时乘性减少（AIMD），执行槽用满且没有压力时加1
+- 可用内存低于 CONCURRENCY_SHED_FREE_MEMORY 时降到最小值并拒绝新的执行（503），
+  赶在内核 OOM killer 之前卸载负载
+调整记录通过 GET /debug/concurrency 查看
+"""
+
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config.settings import settings
+from .metrics import metrics
+from .scheduler import execution_scheduler
+
+# 执行槽用满时每个周期增加的数量
+ADDITIVE_STEP = 1
+# 出现压力时执行槽数量乘以的系数
+DECREASE_FACTOR = 0.7
+# /debug/concurrency 保留的调整记录数
+DECISION_HISTORY = 100
+
+shed_executions = metrics.counter(
+    "sandbox_shed_executions_total",
+    "可用内存不足时被拒绝（503）的执行请求数"
+)
+
+
+def _read_psi(resource: str) -> Optional[Dict[str, int]]:
+    """读取 /proc/pressure/<resource> 的累计停顿时间（微秒），{"some": total, "full": total}"""
+    try:
+        with open(f"/proc/pressure/{resource}", "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    totals = {}
+    for line in lines:
+        kind, *fields = line.split()
+        for field in fields:
+            if field.startswith("total="):
+                totals[kind] = int(field[len("total="):])
+    return totals
+
+
+def _read_free_memory() -> Optional[float]:
+    """可用内存占总内存的比例（MemAvailable / MemTotal）"""
+    values = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                if name in ("MemTotal", "MemAvailable"):
+                    values[name] = int(value.split()[0])
+    except (OSError, ValueError):
+        return None
+    if not values.get("MemTotal") or "MemAvailable" not in values:
+        return None
+    return values["MemAvailable"] / values["MemTotal"]
+
+
+class PressureSampler:
+    """采样主机压力，PSI 为上次采样以来的停顿时间占比（%）"""
+
+    def __init__(self):
+        self._previous: Dict[str, Dict[str, int]] = {}
+        self._previous_time = 0.0
+        self.cpus = os.cpu_count() or 1
+
+    @property
+    def available(self) -> bool:
+        return _read_free_memory() is not None or _read_psi("cpu") is not None
+
+    def sample(self) -> Dict[str, Optional[float]]:
+        now = time.monotonic()
+        elapsed_us = (now - self._previous_time) * 1_000_000
+        sample: Dict[str, Optional[float]] = {}
+        for resource in ("cpu", "memory", "io"):
+            totals = _read_psi(resource)
+            previous = self._previous.get(resource)
+            for kind in ("some", "full"):
+                name = f"{resource}_{kind}"
+                if totals is None or previous is None or kind not in totals or elapsed_us <= 0:
+                    sample[name] = None
+                else:
+                    sample[name] = min(100.0, (totals[kind] - previous.get(kind, 0)) * 100.0 / elapsed_us)
+            if totals is not None:
+                self._previous[resource] = totals
+        self._previous_time = now
+        try:
+            sample["load_per_cpu"] = os.getloadavg()[0] / self.cpus
+        except OSError:
+            sample["load_per_cpu"] = None
+        sample["free_memory"] = _read_free_memory()
+        return sample
+
+
+class ConcurrencyController:
+    """
+    AIMD 并发控制器
+
+    - start(): 在工作进程启动时开始周期调整（ADAPTIVE_CONCURRENCY 开启时）
+    - admit(): 执行前调用，卸载负载期间抛出503
+    - snapshot(): 当前状态与最近的调整记录
+    """
+
+    def __init__(self):
+        self.sampler = PressureSampler()
+        self.shedding = False
+        self.last_sample: Dict[str, Optional[float]] = {}
+        self.decisions: Deque[Dict[str, Any]] = deque(maxlen=DECISION_HISTORY)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ADAPTIVE_CONCURRENCY
+
+    @property
+    def minimum(self) -> int:
+        return max(1, settings.CONCURRENCY_MIN)
+
+    @property
+    def maximum(self) -> int:
+        return max(self.minimum, settings.CONCURRENCY_MAX or 2 * self.sampler.cpus)
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        if not self.sampler.available:
+            print("⚠️ 无法读取 /proc/pressure 和 /proc/meminfo，自适应并发未启用")
+            return
+        initial = min(max(settings.EXECUTION_SLOTS or self.sampler.cpus, self.minimum), self.maximum)
+        execution_scheduler.set_limit(initial)
+        # 第一次采样只建立PSI基线
+        self.last_sample = self.sampler.sample()
+        self._task = asyncio.create_task(self._run())
+        print(f"✅ 已启用自适应并发，初始执行槽 {initial}（{self.minimum}-{self.maximum}）")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.CONCURRENCY_INTERVAL)
+            try:
+                self.adjust(self.sampler.sample())
+            except Exception as e:
+                print(f"⚠️ 自适应并发调整失败: {e}")
+
+    def _pressures(self, sample: Dict[str, Optional[float]]) -> List[str]:
+        """超过阈值的压力信号"""
+        reasons = []
+        limits = (
+            ("cpu_some", settings.CONCURRENCY_CPU_PRESSURE, "CPU压力"),
+            ("memory_some", settings.CONCURRENCY_MEMORY_PRESSURE, "内存压力"),
+            ("io_some", settings.CONCURRENCY_IO_PRESSURE, "IO压力"),
+        )
+        for name, threshold, label in limits:
+            value = sample.get(name)
+            if value is not None and value > threshold:
+                reasons.append(f"{label} {value:.1f}% > {threshold:g}%")
+        free = sample.get("free_memory")
+        if free is not None and free < settings.CONCURRENCY_MIN_FREE_MEMORY:
+            reasons.append(f"可用内存 {free:.1%} < {settings.CONCURRENCY_MIN_FREE_MEMORY:.0%}")
+        return reasons
+
+    def adjust(self, sample: Dict[str, Optional[float]]) -> Dict[str, Any]:
+        """根据一次采样调整执行槽数量，返回本次的决定"""
+        self.last_sample = sample
+        limit = execution_scheduler.limit
+        free = sample.get("free_memory")
+        shedding = free is not None and free < settings.CONCURRENCY_SHED_FREE_MEMORY
+        reasons = self._pressures(sample)
+        load = sample.get("load_per_cpu")
+
+        if shedding:
+            action, new_limit = "shed", self.minimum
+            reasons = [f"可用内存 {free:.1%} < {settings.CONCURRENCY_SHED_FREE_MEMORY:.0%}"]
+        elif reasons:
+            action, new_limit = "decrease", max(self.minimum, int(limit * DECREASE_FACTOR))
+        elif load is not None and load > settings.CONCURRENCY_MAX_LOAD:
+            action, new_limit = "hold", limit
+            reasons = [f"每核负载 {load:.2f} > {settings.CONCURRENCY_MAX_LOAD:g}"]
+        elif execution_scheduler.queued or execution_scheduler.running >= limit:
+            action, new_limit = "increase", min(self.maximum, limit + ADDITIVE_STEP)
+        else:
+            action, new_limit = "hold", limit
+
+        decision = {
+            "time": time.time(),
+            "action": action,
+            "limit": new_limit,
+            "previous_limit": limit,
+            "running": execution_scheduler.running,
+            "queued": execution_scheduler.queued,
+            "reasons": reasons,
+        }
+        if new_limit != limit or shedding != self.shedding:
+            self.decisions.append(decision)
+            if action in ("shed", "decrease") and new_limit != limit:
+                print(f"📉 执行槽 {limit} → {new_limit}：{'；'.join(reasons)}")
+            if shedding and not self.shedding:
+                print(f"🚨 可用内存 {free:.1%}，暂停接收新的执行")
+            elif self.shedding and not shedding:
+                print("✅ 可用内存已恢复，重新接收执行")
+        self.shedding = shedding
+        if new_limit != limit:
+            execution_scheduler.set_limit(new_limit)
+        return decision
+
+    def admit(self):
+        """卸载负载期间拒绝新的执行，集群中的协调节点收到503后会换节点重试"""
+        if self.shedding:
+            shed_executions.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="主机可用内存不足，暂时不接收新的执行",
+                headers={"Retry-After": str(max(1, int(settings.CONCURRENCY_INTERVAL * 5)))}
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._task is not None,
+            "shedding": self.shedding,
+            "limit": execution_scheduler.limit,
+            "min": self.minimum,
+            "max": self.maximum,
+            "running": execution_scheduler.running,
+            "queued": execution_scheduler.queued,
+            "thresholds": {
+                "cpu_pressure": settings.CONCURRENCY_CPU_PRESSURE,
+                "memory_pressure": settings.CONCURRENCY_MEMORY_PRESSURE,
+                "io_pressure": settings.CONCURRENCY_IO_PRESSURE,
+                "max_load_per_cpu": settings.CONCURRENCY_MAX_LOAD,
+                "min_free_memory": settings.CONCURRENCY_MIN_FREE_MEMORY,
+                "shed_free_memory": settings.CONCURRENCY_SHED_FREE_MEMORY,
+            },
+            "sample": self.last_sample,
+            "decisions": list(reversed(self.decisions)),
+        }
+
+
+# 全局自适应并发控制器实例
+concurrency_controller = ConcurrencyController()
+
+metrics.gauge(
+    "sandbox_concurrency_limit", "当前的执行槽数量，0表示不限制",
+    lambda: {(): execution_scheduler.limit}
+)
@@ -0,0 +1,141 @@
+"""
+Conda探测模块
+conda --version / conda info --json 每次调用需要数百毫秒到数秒，不在导入时执行；
+首次使用时（或由 lifespan 在后台）探测一次，结果缓存在内存和共享状态目录中，
+以conda可执行文件和 .condarc 的路径、mtime为键，conda升级、更换或配置变化后自动重新探测
+"""
+
+import os
+import json
+import shutil
+import asyncio
+import threading
+import subprocess
+from typing import Dict, Optional
+
+from .shared_state import shared_state
+
+
+class CondaProbe:
+    """conda可用性与基本信息的惰性探测"""
+
+    def __init__(self):
+        self._info: Optional[Dict] = None
+        self._error: Optional[str] = None
+        self._key: Optional[str] = None
+        self._lock = threading.Lock()
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = shared_state.store("conda_probe")
+        return self._store
+
+    @staticmethod
+    def executable() -> Optional[str]:
+        """conda可执行文件路径，优先使用conda激活脚本设置的 CONDA_EXE"""
+        conda_exe = os.environ.get("CONDA_EXE")
+        if conda_exe and os.path.isfile(conda_exe):
+            return conda_exe
+        return shutil.which("conda")
+
+    @staticmethod
+    def _cache_key(path: str) -> Optional[str]:
+        """缓存键：conda可执行文件及用户 .condarc（影响 envs_dirs）的路径和mtime"""
+        real_path = os.path.realpath(path)
+        try:
+            stat = os.stat(real_path)
+        except OSError:
+            return None
+        key = f"{real_path}:{stat.st_mtime_ns}:{stat.st_size}"
+        condarc = os.environ.get("CONDARC") or os.path.expanduser("~/.condarc")
+        try:
+            key += f":{os.stat(condarc).st_mtime_ns}"
+        except OSError:
+            pass
+        return key
+
+    def info(self) -> Dict:
+        """
+        获取conda信息，首次调用时探测
+
+        Returns:
+            Dict: conda_version、python_version、platform、envs_dirs、root_prefix
+
+        Raises:
+            RuntimeError: conda未安装或探测失败
+        """
+        path = self.executable()
+        if path is None:
+            raise RuntimeError("❌ 未找到conda安装，请确保conda已正确安装并在PATH中")
+        key = self._cache_key(path)
+
+        with self._lock:
+            if key is not None and key == self._key:
+                if self._error:
+                    raise RuntimeError(self._error)
+                return self._info
+
+            cached = self.store.get(key) if key else None
+            if cached is not None:
+                self._info, self._error, self._key = cached, None, key
+                return cached
+
+            try:
+                info = self._probe(path)
+            except RuntimeError as e:
+                # 失败结果只缓存在内存中，重启后重新探测
+                self._info, self._error, self._key = None, str(e), key
+                raise
+
+            self._info, self._error, self._key = info, None, key
+            if key:
+                try:
+                    with self.store.update() as data:
+                        data.clear()
+                        data[key] = info
+                except OSError as e:
+                    print(f"保存conda探测结果失败: {e}")
+            return info
+
+    @staticmethod
+    def _probe(path: str) -> Dict:
+        try:
+            result = subprocess.run(
+                [path, "info", "--json"],
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            info = json.loads(result.stdout)
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            raise RuntimeError(f"获取conda信息失败: {e}")
+        return {
+            "conda_version": info.get("conda_version"),
+            "python_version": info.get("python_version"),
+            "platform": info.get("platform"),
+            "envs_dirs": info.get("envs_dirs", []),
+            "root_prefix": info.get("root_prefix")
+        }
+
+    def require(self):
+        """确认conda可用，不可用时抛出 RuntimeError"""
+        self.info()
+
+    @property
+    def probed(self) -> bool:
+        """是否已有探测结果（成功或失败）"""
+        return self._key is not None
+
+    async def probe_in_background(self):
+        """在线程池中探测并输出结果，供 lifespan 在启动后调用"""
+        try:
+            info = await asyncio.to_thread(self.info)
+            print(f"✅ Conda连接成功: {info['conda_version']}")
+        except RuntimeError as e:
+            print(f"⚠️ Conda不可用，环境管理和指定环境执行将失败: {e}")
+
+
+# 全局conda探测实例
+conda_probe = CondaProbe()
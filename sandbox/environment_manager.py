@@ -12,15 +12,20 @@ from datetime import datetime, timezone
 from models.environment import EnvironmentScript, EnvironmentResponse
 from config.settings import settings
 from .utils import create_secure_temp_dir, cleanup_temp_dir
+from .tracing import tracer
+from .shared_state import FileLock, SharedJSONStore, worker_identity
+from .conda import conda_probe
+
+
+# last_used 的最小写入间隔（秒），避免每次执行都重写注册表
+LAST_USED_WRITE_INTERVAL = 30
 
 
 class EnvironmentManager:
     """环境管理器，负责创建和管理Conda虚拟环境"""
     
     def __init__(self):
-        """初始化Conda环境管理器"""
-        self._check_conda_installation()
-        
+        """初始化Conda环境管理器（conda探测推迟到首次使用，见 sandbox/conda.py）"""
         # 环境信息存储文件
         if os.path.exists("/app/data"):
             # Docker环境中的路径
@@ -37,69 +42,63 @@ class EnvironmentManager:
         os.makedirs(os.path.dirname(self.environments_file), exist_ok=True)
         os.makedirs(self.environments_dir, exist_ok=True)
         
-        # 加载现有环境信息
-        self.environments = self._load_environments()
-        
-        # 获取conda信息
-        self.conda_info = self._get_conda_info()
-        print(f"✅ Conda连接成功: {self.conda_info['conda_version']}")
+        # 环境注册表在多个工作进程间共享，通过文件锁协调写入
+        self.locks_dir = os.path.join(os.path.dirname(self.environments_file), "locks")
+        self._store = SharedJSONStore(
+            self.environments_file,
+            lock_path=os.path.join(self.locks_dir, "environments.lock")
+        )
+        self._recover_stale_builds()
     
-    def _check_conda_installation(self):
-        """检查conda是否安装"""
-        try:
-            result = subprocess.run(
-                ["conda", "--version"], 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            raise RuntimeError("❌ 未找到conda安装，请确保conda已正确安装并在PATH中")
+    @property
+    def conda_info(self) -> Dict:
+        """conda信息，首次访问时探测并缓存"""
+        return conda_probe.info()
     
-    def _get_conda_info(self) -> Dict:
-        """获取conda信息"""
-        try:
-            result = subprocess.run(
-                ["conda", "info", "--json"], 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
-            info = json.loads(result.stdout)
-            return {
-                "conda_version": info.get("conda_version"),
-                "python_version": info.get("python_version"),
-                "platform": info.get("platform"),
-                "envs_dirs": info.get("envs_dirs", []),
-                "root_prefix": info.get("root_prefix")
-            }
-        except Exception as e:
-            raise RuntimeError(f"获取conda信息失败: {e}")
-    
-    def _load_environments(self) -> Dict[str, dict]:
-        """加载环境信息"""
-        try:
-            if os.path.exists(self.environments_file):
-                with open(self.environments_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"加载环境信息失败: {e}")
-        return {}
+    @property
+    def environments(self) -> Dict[str, dict]:
+        """环境注册表（只读），其他工作进程的修改在读取时自动可见"""
+        return self._store.read()
     
-    def _save_environments(self):
-        """保存环境信息"""
+    def _update_environment(self, name: str, **fields):
+        """在文件锁内更新单个环境记录"""
         try:
-            with open(self.environments_file, 'w', encoding='utf-8') as f:
-                json.dump(self.environments, f, ensure_ascii=False, indent=2)
+            with self._store.update() as environments:
+                if name in environments:
+                    environments[name].update(fields)
         except Exception as e:
             print(f"保存环境信息失败: {e}")
     
+    def _build_lock(self, name: str) -> FileLock:
+        """环境构建锁，构建期间一直持有，持有进程退出后自动释放"""
+        return FileLock(os.path.join(self.locks_dir, f"build-{name}.lock"))
+    
+    def _recover_stale_builds(self):
+        """将构建进程已退出（构建锁未被持有）但状态仍为building的环境标记为失败"""
+        stale = [
+            name for name, info in self.environments.items()
+            if info.get("status") == "building" and not self._build_lock(name).is_held_elsewhere()
+        ]
+        for name in stale:
+            print(f"⚠️ 环境 {name} 的构建进程已退出，标记为失败")
+            self._update_environment(name, status="failed", error="构建进程已退出，构建未完成")
+    
     async def create_environment(self, env_script: EnvironmentScript) -> EnvironmentResponse:
         """创建新的Conda环境"""
-        if env_script.name in self.environments:
-            raise ValueError(f"环境 '{env_script.name}' 已存在")
+        # conda未安装时在登记之前失败，首次调用会在线程池中探测
+        await asyncio.to_thread(conda_probe.require)
         
+        # 先获取构建锁再登记，其他进程看到building状态时锁一定已被持有
+        build_lock = self._build_lock(env_script.name)
+        if not build_lock.acquire(blocking=False):
+            raise ValueError(f"环境 '{env_script.name}' 正在构建中")
+        try:
+            return await self._create_environment_locked(env_script)
+        finally:
+            build_lock.release()
+    
+    async def _create_environment_locked(self, env_script: EnvironmentScript) -> EnvironmentResponse:
+        """在持有构建锁的情况下登记并创建环境"""
         # 生成conda环境名称
         conda_env_name = f"sandbox-{env_script.name}"
         
@@ -115,31 +114,35 @@ class EnvironmentManager:
             "last_used": None,
             "setup_script": env_script.setup_script,
             "python_version": env_script.python_version,
-            "env_path": None  # 将在创建成功后填写
+            "env_path": None,  # 将在创建成功后填写
+            "build_owner": worker_identity()
         }
         
-        self.environments[env_script.name] = env_info
-        self._save_environments()
+        with self._store.update() as environments:
+            if env_script.name in environments:
+                raise ValueError(f"环境 '{env_script.name}' 已存在")
+            environments[env_script.name] = env_info
         
         try:
-            # 异步创建Conda环境
-            await self._create_conda_environment(env_script, conda_env_name)
-            
-            # 获取环境路径
-            env_path = await self._get_environment_path(conda_env_name)
+            with tracer.start_span("environment.create", {
+                "environment.name": env_script.name,
+                "environment.python_version": env_script.python_version,
+            }):
+                # 异步创建Conda环境
+                await self._create_conda_environment(env_script, conda_env_name)
+                
+                # 获取环境路径
+                with tracer.start_span("environment.resolve_path"):
+                    env_path = await self._get_environment_path(conda_env_name)
             
             # 更新状态为就绪
-            self.environments[env_script.name]["status"] = "ready"
-            self.environments[env_script.name]["env_path"] = env_path
-            self._save_environments()
+            self._update_environment(env_script.name, status="ready", env_path=env_path)
             
             return EnvironmentResponse(**self.environments[env_script.name])
             
         except Exception as e:
             # 创建失败，更新状态
-            self.environments[env_script.name]["status"] = "failed"
-            self.environments[env_script.name]["error"] = str(e)
-            self._save_environments()
+            self._update_environment(env_script.name, status="failed", error=str(e))
             raise RuntimeError(f"环境创建失败: {str(e)}")
     
     async def _create_conda_environment(self, env_script: EnvironmentScript, conda_env_name: str):
@@ -151,20 +154,28 @@ class EnvironmentManager:
             conda_envs_dir = os.path.join(os.path.dirname(self.environments_file), "conda_envs")
             os.makedirs(conda_envs_dir, exist_ok=True)
             
-            # 配置conda使用自定义环境目录
-            await self._run_conda_command([
-                "conda", "config", "--add", "envs_dirs", conda_envs_dir
-            ])
+            # 配置conda使用自定义环境目录（.condarc由所有工作进程共享，串行修改）
+            with tracer.start_span("environment.conda_config"):
+                config_lock = FileLock(os.path.join(self.locks_dir, "conda-config.lock"))
+                await asyncio.get_running_loop().run_in_executor(None, config_lock.acquire)
+                try:
+                    await self._run_conda_command([
+                        "conda", "config", "--add", "envs_dirs", conda_envs_dir
+                    ])
+                finally:
+                    config_lock.release()
             
             # 步骤1: 创建基础环境，指定环境目录
-            await self._run_conda_command([
-                "conda", "create", "-p", os.path.join(conda_envs_dir, conda_env_name),
-                f"python={env_script.python_version}", 
-                "-y"
-            ])
+            with tracer.start_span("environment.conda_create"):
+                await self._run_conda_command([
+                    "conda", "create", "-p", os.path.join(conda_envs_dir, conda_env_name),
+                    f"python={env_script.python_version}", 
+                    "-y"
+                ])
             
             # 步骤2: 解析并执行安装脚本
-            await self._execute_setup_script(conda_env_name, env_script.setup_script, conda_envs_dir)
+            with tracer.start_span("environment.setup_script"):
+                await self._execute_setup_script(conda_env_name, env_script.setup_script, conda_envs_dir)
             
             print(f"Conda环境创建完成: {conda_env_name}")
             
@@ -329,12 +340,18 @@ exit 0
     
     def get_environment(self, name: str) -> Optional[EnvironmentResponse]:
         """获取指定环境信息"""
-        if name in self.environments:
-            return EnvironmentResponse(**self.environments[name])
+        env_info = self.environments.get(name)
+        if env_info and env_info.get("status") == "building":
+            self._recover_stale_builds()
+            env_info = self.environments.get(name)
+        if env_info:
+            return EnvironmentResponse(**env_info)
         return None
     
     def list_environments(self) -> List[EnvironmentResponse]:
         """列出所有环境"""
+        if any(info.get("status") == "building" for info in self.environments.values()):
+            self._recover_stale_builds()
         return [EnvironmentResponse(**env_info) for env_info in self.environments.values()]
     
     async def delete_environment(self, name: str) -> bool:
@@ -354,8 +371,8 @@ exit 0
                 print(f"删除Conda环境失败: {e}")
             
             # 从记录中移除
-            del self.environments[name]
-            self._save_environments()
+            with self._store.update() as environments:
+                environments.pop(name, None)
             
             return True
             
@@ -364,24 +381,86 @@ exit 0
             return False
     
     def update_last_used(self, name: str):
-        """更新环境最后使用时间"""
-        if name in self.environments:
-            self.environments[name]["last_used"] = datetime.now(timezone.utc).isoformat()
-            self._save_environments()
+        """更新环境最后使用时间，间隔小于 LAST_USED_WRITE_INTERVAL 时跳过写入"""
+        env_info = self.environments.get(name)
+        if not env_info:
+            return
+        now = datetime.now(timezone.utc)
+        last_used = env_info.get("last_used")
+        if last_used and (now - datetime.fromisoformat(last_used)).total_seconds() < LAST_USED_WRITE_INTERVAL:
+            return
+        self._update_environment(name, last_used=now.isoformat())
+    
+    @staticmethod
+    def python_executable(env_info: Dict) -> Optional[str]:
+        """环境中Python可执行文件的路径，环境尚未构建完成时为None"""
+        if not env_info.get("env_path"):
+            return None
+        if sys.platform == "win32":
+            return os.path.join(env_info["env_path"], "python.exe")
+        return os.path.join(env_info["env_path"], "bin", "python")
     
     def get_environment_info(self, name: str) -> Optional[Dict]:
         """获取环境的详细信息"""
         if name in self.environments and self.environments[name]["status"] == "ready":
             env_info = self.environments[name].copy()
             # 添加Python可执行文件路径
-            if "env_path" in env_info and env_info["env_path"]:
-                if sys.platform == "win32":
-                    python_exe = os.path.join(env_info["env_path"], "python.exe")
-                else:
-                    python_exe = os.path.join(env_info["env_path"], "bin", "python")
+            python_exe = self.python_executable(env_info)
+            if python_exe:
                 env_info["python_executable"] = python_exe
             return env_info
         return None
+    
+    def mark_degraded(self, name: str, reason: str) -> bool:
+        """把就绪的环境标记为 degraded（熔断），返回是否由本次调用标记"""
+        with self._store.update() as environments:
+            info = environments.get(name)
+            if not info or info.get("status") != "ready":
+                return False
+            info.update(status="degraded", error=reason, degraded_at=datetime.now(timezone.utc).isoformat())
+        return True
+    
+    def restore_environment(self, name: str) -> bool:
+        """探测成功后把 degraded 环境恢复为就绪，返回是否由本次调用恢复"""
+        with self._store.update() as environments:
+            info = environments.get(name)
+            if not info or info.get("status") != "degraded":
+                return False
+            info.update(status="ready", error=None, degraded_at=None)
+        return True
+    
+    async def rebuild_environment(self, name: str) -> EnvironmentResponse:
+        """按登记的安装脚本重建环境（熔断后自动重建时使用）"""
+        await asyncio.to_thread(conda_probe.require)
+        
+        build_lock = self._build_lock(name)
+        if not build_lock.acquire(blocking=False):
+            raise ValueError(f"环境 '{name}' 正在构建中")
+        try:
+            info = self.environments.get(name)
+            if not info:
+                raise ValueError(f"环境 '{name}' 不存在")
+            env_script = EnvironmentScript(
+                name=name,
+                description=info.get("description") or "",
+                base_image=info.get("base_image") or "python:3.11-slim",
+                setup_script=info["setup_script"],
+                python_version=info.get("python_version") or "3.11"
+            )
+            self._update_environment(name, status="building", error=None, build_owner=worker_identity())
+            try:
+                with tracer.start_span("environment.rebuild", {"environment.name": name}):
+                    if info.get("env_path") and os.path.exists(info["env_path"]):
+                        await self._run_conda_command(["conda", "env", "remove", "-p", info["env_path"], "-y"])
+                    await self._create_conda_environment(env_script, info["conda_env_name"])
+                    env_path = await self._get_environment_path(info["conda_env_name"])
+                self._update_environment(name, status="ready", env_path=env_path, degraded_at=None)
+                return EnvironmentResponse(**self.environments[name])
+            except Exception as e:
+                self._update_environment(name, status="failed", error=str(e))
+                raise RuntimeError(f"环境重建失败: {str(e)}")
+        finally:
+            build_lock.release()
 
 
 # 全局环境管理器实例
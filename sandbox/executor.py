@@ -1,43 +1,55 @@
 import asyncio
+import functools
 import subprocess
 import os
 import base64
 import time
 import sys
+import uuid
 import signal
-from typing import Dict, Optional
+import threading
+from typing import Callable, Dict, List, Optional, Union
 from pathlib import Path
 
-from models.request import ExecuteResponse
+from models.request import ExecuteResponse, ProfileOptions
 from config.settings import settings
 from .utils import create_secure_temp_dir, cleanup_temp_dir, validate_filename
+from .profiler import prepare_profile_run, collect_profile_result
+from .tracing import tracer, propagation_env
+from .output_capture import OutputCapture, output_store, pump_process_output
+from .warm_pool import warm_pool
+from .isolation import isolation
+from .reaper import process_reaper, cpu_seconds, process_cpu_seconds
+from .tenants import charge_cpu
+from .affinity import cpu_allocator, process_qos
+from .conda import conda_probe
+from .metrics import metrics
+from .runtime_history import runtime_history
+from .scheduler import execution_scheduler
+from .circuit_breaker import environment_breaker, is_interpreter_failure
 
 
 class CodeExecutor:
     """Conda代码执行器，负责在Conda虚拟环境中安全执行Python代码"""
     
     def __init__(self):
-        """初始化Conda执行器"""
-        self._check_conda_available()
+        """初始化Conda执行器（conda探测推迟到首次在指定环境中执行时）"""
+        # 正在执行的任务数，集群模式下作为节点负载上报
+        self.active_executions = 0
         print("✅ Conda执行器初始化成功")
     
-    def _check_conda_available(self):
-        """检查conda是否可用"""
-        try:
-            subprocess.run(
-                ["conda", "--version"], 
-                capture_output=True, 
-                check=True
-            )
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            raise RuntimeError("Conda不可用，请确保已正确安装conda")
-    
     async def execute(
         self, 
         code: str, 
         timeout: int = 30, 
-        input_files: Optional[Dict[str, str]] = None,
-        environment: Optional[str] = None
+        input_files: Optional[Dict[str, Union[str, bytes]]] = None,
+        environment: Optional[str] = None,
+        profile: Optional[ProfileOptions] = None,
+        soft_timeout: Optional[float] = None,
+        soft_timeout_signal: str = "SIGINT",
+        output_listener: Optional[Callable[[str, bytes], None]] = None,
+        caller: Optional[str] = None,
+        priority: Optional[str] = None
     ) -> ExecuteResponse:
         """
         在Conda环境中执行Python代码
@@ -45,62 +57,121 @@ class CodeExecutor:
         Args:
             code: 要执行的Python代码
             timeout: 执行超时时间（秒）
-            input_files: 输入文件字典，键为文件名，值为base64编码的内容
+            input_files: 输入文件字典，键为文件名，值为base64编码的内容或原始字节
             environment: 要使用的环境名称，如果为None则使用默认环境
+            profile: 性能分析选项，为None时不进行分析
+            soft_timeout: 软超时（秒），到达后向用户代码发送 soft_timeout_signal
+            soft_timeout_signal: 软超时信号，SIGINT（触发KeyboardInterrupt）或 SIGTERM
+            output_listener: 输出回调 (stream, data)，在工作线程中随输出产生被调用，用于流式返回
+            caller: 调用方标识，用于记录运行时间和预估耗时
+            priority: 执行优先级（high/normal/low），决定沙盒进程的nice与IO优先级
             
         Returns:
             ExecuteResponse: 执行结果
         """
-        start_time = time.time()
         temp_dir = None
+        execution_id = uuid.uuid4().hex
         
-        try:
-            # 创建临时工作目录
-            temp_dir = create_secure_temp_dir()
-            
-            # 准备输入文件
-            if input_files:
-                await self._prepare_input_files(temp_dir, input_files)
-            
-            # 创建代码文件
-            code_file = os.path.join(temp_dir, "main.py")
-            with open(code_file, "w", encoding="utf-8") as f:
-                f.write(code)
-            
-            # 在Conda环境中执行代码
-            result = await self._run_in_conda_env(temp_dir, timeout, environment)
-            
-            # 收集输出文件
-            output_files = await self._collect_output_files(temp_dir)
-            
-            execution_time = time.time() - start_time
-            
-            return ExecuteResponse(
-                success=result["success"],
-                stdout=result["stdout"],
-                stderr=result["stderr"],
-                execution_time=execution_time,
-                files=output_files,
-                error=result.get("error")
-            )
-            
-        except Exception as e:
-            execution_time = time.time() - start_time
-            return ExecuteResponse(
-                success=False,
-                stdout="",
-                stderr="",
-                execution_time=execution_time,
-                files={},
-                error=f"执行错误: {str(e)}"
-            )
-        finally:
-            # 清理临时目录
-            if temp_dir:
-                cleanup_temp_dir(temp_dir)
+        with tracer.start_span("executor.execute", {
+            "sandbox.environment": environment or "default",
+            "sandbox.timeout": timeout,
+            "sandbox.code_length": len(code),
+            "sandbox.input_files": len(input_files or {}),
+            "sandbox.profile": profile.mode.value if profile else "off",
+            "sandbox.execution_id": execution_id,
+        }) as span:
+            # 执行槽已满时按预计耗时排队（短作业优先）
+            prediction = runtime_history.predict(code, environment, caller, timeout)
+            span.set_attribute("sandbox.predicted_seconds", prediction.seconds)
+            with tracer.start_span("executor.queue"):
+                ticket = await execution_scheduler.acquire(prediction.seconds)
+            start_time = time.time()
+            self.active_executions += 1
+            try:
+                with tracer.start_span("executor.prepare"):
+                    # 创建临时工作目录
+                    temp_dir = create_secure_temp_dir()
+                    
+                    # 准备输入文件
+                    if input_files:
+                        await self._prepare_input_files(temp_dir, input_files)
+                    
+                    # 创建代码文件
+                    code_file = os.path.join(temp_dir, "main.py")
+                    with open(code_file, "w", encoding="utf-8") as f:
+                        f.write(code)
+                    
+                    # 性能分析模式下通过包装脚本运行main.py
+                    script_args = prepare_profile_run(temp_dir, profile) if profile else None
+                
+                # 在Conda环境中执行代码
+                with tracer.start_span("executor.run") as run_span:
+                    run_started = time.monotonic()
+                    result = await self._run_in_conda_env(
+                        temp_dir, timeout, environment, script_args,
+                        output_id=execution_id,
+                        soft_timeout=soft_timeout,
+                        soft_timeout_signal=soft_timeout_signal,
+                        output_listener=output_listener,
+                        priority=priority
+                    )
+                    run_span.set_attribute("sandbox.success", result["success"])
+                    runtime_history.record(code, environment, caller, time.monotonic() - run_started)
+                    environment_breaker.record(
+                        environment, result.get("infrastructure_error", False), result.get("stderr") or result.get("error", "")
+                    )
+                
+                with tracer.start_span("executor.collect"):
+                    profile_result = None
+                    if profile:
+                        profile_result, result["stderr"] = collect_profile_result(
+                            temp_dir, profile, result["stderr"]
+                        )
+                    
+                    # 收集输出文件
+                    output_files = await self._collect_output_files(temp_dir)
+                
+                execution_time = time.time() - start_time
+                span.set_attribute("sandbox.success", result["success"])
+                if result.get("error"):
+                    span.set_attribute("sandbox.error", result["error"])
+                
+                return ExecuteResponse(
+                    success=result["success"],
+                    stdout=result["stdout"],
+                    stderr=result["stderr"],
+                    execution_time=execution_time,
+                    files=output_files,
+                    error=result.get("error"),
+                    timed_out=result.get("timed_out", False),
+                    stdout_truncated=result.get("stdout_truncated", False),
+                    stderr_truncated=result.get("stderr_truncated", False),
+                    output_id=result.get("output_id"),
+                    cpu_time=result.get("cpu_time"),
+                    profile=profile_result
+                )
+                
+            except Exception as e:
+                execution_time = time.time() - start_time
+                span.record_error(e)
+                return ExecuteResponse(
+                    success=False,
+                    stdout="",
+                    stderr="",
+                    execution_time=execution_time,
+                    files={},
+                    error=f"执行错误: {str(e)}"
+                )
+            finally:
+                self.active_executions -= 1
+                execution_scheduler.release(ticket)
+                # 清理临时目录
+                if temp_dir:
+                    with tracer.start_span("executor.cleanup"):
+                        cleanup_temp_dir(temp_dir)
     
-    async def _prepare_input_files(self, temp_dir: str, input_files: Dict[str, str]):
-        """准备输入文件"""
+    async def _prepare_input_files(self, temp_dir: str, input_files: Dict[str, Union[str, bytes]]):
+        """准备输入文件，值为base64字符串或（multipart上传的）原始字节"""
         for filename, content_b64 in input_files.items():
             # 验证文件名安全性
             if not validate_filename(filename):
@@ -108,7 +179,10 @@ class CodeExecutor:
             
             try:
                 # 解码base64内容
-                content = base64.b64decode(content_b64)
+                if isinstance(content_b64, bytes):
+                    content = content_b64
+                else:
+                    content = base64.b64decode(content_b64)
                 
                 # 检查文件大小
                 if len(content) > settings.MAX_FILE_SIZE:
@@ -122,14 +196,32 @@ class CodeExecutor:
             except Exception as e:
                 raise ValueError(f"处理文件 {filename} 时出错: {str(e)}")
     
-    async def _run_in_conda_env(self, temp_dir: str, timeout: int, environment: Optional[str] = None) -> Dict:
-        """在Conda环境中运行代码"""
+    async def _run_in_conda_env(
+        self,
+        temp_dir: str,
+        timeout: int,
+        environment: Optional[str] = None,
+        script_args: Optional[List[str]] = None,
+        **run_options
+    ) -> Dict:
+        """
+        在Conda环境中运行代码
+        
+        Args:
+            temp_dir: 工作目录
+            timeout: 超时时间（秒）
+            environment: 环境名称
+            script_args: 替代 ["main.py"] 的解释器参数
+            **run_options: 透传给 _run_python_sync 的选项（output_id、soft_timeout等）
+        """
         try:
             # 确定要使用的Python可执行文件
             python_executable = sys.executable  # 默认使用当前Python
             
             if environment:
                 from .environment_manager import environment_manager
+                # 缓存失效或上次探测失败时会重新运行 conda info，不能阻塞事件循环
+                await asyncio.to_thread(conda_probe.require)
                 env_info = environment_manager.get_environment_info(environment)
                 if env_info and "python_executable" in env_info:
                     python_executable = env_info["python_executable"]
@@ -139,18 +231,39 @@ class CodeExecutor:
                     raise ValueError(f"环境 '{environment}' 不存在或未就绪")
             
             # 构建执行命令
-            cmd = [python_executable, "main.py"]
+            cmd = [python_executable] + (script_args or ["main.py"])
+            
+            # 普通执行可以使用预热解释器，性能分析需要包装脚本，只能冷启动
+            if not script_args:
+                run_options["warm_key"] = environment or "default"
             
-            # 运行代码
+            # 运行代码（线程池中无法读取contextvars，提前取出追踪上下文）
             loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
+            cancel_event = threading.Event()
+            future = loop.run_in_executor(
                 None, 
-                self._run_python_sync, 
-                cmd,
-                temp_dir,
-                timeout
+                functools.partial(
+                    self._run_python_sync,
+                    cmd,
+                    temp_dir,
+                    timeout,
+                    extra_env=propagation_env(),
+                    cancel_event=cancel_event,
+                    **run_options
+                )
             )
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 调用方已放弃（客户端断开连接或到达截止时间）：立即终止进程，
+                # 等执行线程退出后再由 execute() 清理工作目录；已消耗的CPU时间照常计入租户
+                cancel_event.set()
+                await asyncio.wait({future})
+                if not future.cancelled() and future.exception() is None:
+                    await charge_cpu(future.result().get("cpu_time"))
+                raise
             
+            await charge_cpu(result.get("cpu_time"))
             return result
             
         except Exception as e:
@@ -161,13 +274,37 @@ class CodeExecutor:
                 "error": f"环境执行错误: {str(e)}"
             }
     
-    def _run_python_sync(self, cmd: list, work_dir: str, timeout: int) -> Dict:
-        """同步方式运行Python代码"""
+    def _run_python_sync(
+        self,
+        cmd: list,
+        work_dir: str,
+        timeout: int,
+        extra_env: Optional[Dict[str, str]] = None,
+        output_id: Optional[str] = None,
+        soft_timeout: Optional[float] = None,
+        soft_timeout_signal: str = "SIGINT",
+        output_listener: Optional[Callable[[str, bytes], None]] = None,
+        warm_key: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        priority: Optional[str] = None
+    ) -> Dict:
+        """
+        同步方式运行Python代码，warm_key 不为空时优先使用该环境的预热解释器，
+        cancel_event 被设置时立即强制终止进程组；启用CPU亲和性时进程独占分配到的核
+        """
+        cpuset = cpu_allocator.allocate()
+        
+        def place(pid: int):
+            cpu_allocator.pin(pid, cpuset)
+            process_qos.apply(pid, priority)
+        
         try:
             # 设置环境变量
             env = os.environ.copy()
             env["PYTHONUNBUFFERED"] = "1"
             env["PYTHONPATH"] = work_dir
+            if extra_env:
+                env.update(extra_env)
             
             # 在某些系统上设置资源限制
             def preexec_fn():
@@ -206,73 +343,175 @@ class CodeExecutor:
             preexec_fn = None # type: ignore
             
             # 执行命令（暂时不使用preexec_fn进行调试）
+            # 使用二进制管道增量读取输出，避免一次性缓存全部输出
             popen_kwargs = {
                 "cwd": work_dir,
                 "stdout": subprocess.PIPE,
                 "stderr": subprocess.PIPE,
                 "env": env,
-                "text": True,
+                # 独立进程组，超时终止时不会波及服务进程本身
+                "start_new_session": sys.platform != "win32",
             }
             
             # 在非Windows系统上可以使用preexec_fn（暂时禁用用于调试）
             # if sys.platform != "win32" and preexec_fn:
             #     popen_kwargs["preexec_fn"] = preexec_fn
             
-            process = subprocess.Popen(cmd, **popen_kwargs)
+            process = self._start_warm_process(warm_key, cmd, work_dir, env, place) if warm_key else None
+            if process is None and isolation.enabled:
+                process = self._start_isolated_process(cmd, work_dir, env, place)
+            elif process is None:
+                process = process_reaper.popen(cmd, **popen_kwargs)
+                place(process.pid)
+            stdout_capture = OutputCapture("stdout", output_id=output_id, store=output_store, listener=output_listener)
+            stderr_capture = OutputCapture("stderr", output_id=output_id, store=output_store, listener=output_listener)
+            
+            def pump(wait_timeout: float, **kwargs) -> bool:
+                return pump_process_output(process, stdout_capture, stderr_capture, wait_timeout, **kwargs)
             
             try:
-                stdout, stderr = process.communicate(timeout=timeout)
-                
-                if process.returncode == 0:
-                    return {
-                        "success": True,
-                        "stdout": stdout,
-                        "stderr": stderr,
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "stdout": stdout,
-                        "stderr": stderr,
-                        "error": f"代码执行失败，退出码: {process.returncode}"
-                    }
-                    
-            except subprocess.TimeoutExpired:
-                # 超时处理
-                self._terminate_process(process)
-                return {
-                    "success": False,
-                    "stdout": "",
-                    "stderr": "",
-                    "error": f"代码执行超时（{timeout}秒）"
-                }
+                finished = pump(
+                    timeout,
+                    soft_timeout=soft_timeout,
+                    on_soft_timeout=lambda: self._signal_process(process, soft_timeout_signal),
+                    cancel_event=cancel_event
+                )
+                cancelled = not finished and cancel_event is not None and cancel_event.is_set()
+                if not finished:
+                    # 超时处理，终止期间继续读取输出，保留已产生的部分结果；取消时无需等待进程优雅退出
+                    self._terminate_process(process, wait_for_exit=pump, graceful=not cancelled)
+            finally:
+                process.stdout.close()
+                process.stderr.close()
+                # 终止脱离进程组的后台进程、守护进程等遗留进程
+                process_reaper.sweep(process)
+            
+            result = {
+                "success": finished and process.returncode == 0,
+                "stdout": stdout_capture.text(),
+                "stderr": stderr_capture.text(),
+                "timed_out": not finished and not cancelled,
+                "stdout_truncated": stdout_capture.truncated,
+                "stderr_truncated": stderr_capture.truncated,
+                "output_id": output_id if (stdout_capture.spilled or stderr_capture.spilled) else None,
+            }
+            rusage = getattr(process, "rusage", None)
+            if rusage is not None:
+                result["cpu_time"] = max(0.0, cpu_seconds(rusage) + process.leaked_cpu_seconds - process.cpu_baseline)
+            if cancelled:
+                result["error"] = "执行已取消"
+            elif not finished:
+                result["error"] = f"代码执行超时（{timeout}秒）"
+            elif process.returncode != 0 and is_interpreter_failure(result["stderr"]):
+                result["error"] = f"环境解释器无法启动，退出码: {process.returncode}"
+                result["infrastructure_error"] = True
+            elif process.returncode != 0:
+                result["error"] = f"代码执行失败，退出码: {process.returncode}"
+            return result
                 
         except Exception as e:
+            # 启动进程失败（解释器缺失、无法执行等），不是用户代码的错误
             return {
                 "success": False,
                 "stdout": "",
                 "stderr": str(e),
-                "error": f"执行错误: {str(e)}"
+                "error": f"执行错误: {str(e)}",
+                "infrastructure_error": True
             }
+        finally:
+            cpu_allocator.release(cpuset)
+    
+    def _start_warm_process(
+        self, warm_key: str, cmd: list, work_dir: str, env: Dict[str, str], place: Callable[[int], None]
+    ):
+        """从预热池取出解释器，按 place 绑定CPU和优先级后交付任务，没有可用解释器时返回None"""
+        process = warm_pool.acquire(warm_key, cmd[0])
+        if process is None:
+            return None
+        process.cpu_baseline = process_cpu_seconds(process.pid)
+        place(process.pid)
+        try:
+            warm_pool.start_job(process, work_dir, self._job_env(work_dir, env), python_executable=cmd[0])
+        except (BrokenPipeError, OSError):
+            # 预热解释器已意外退出，改为冷启动
+            warm_pool.discard(process)
+            return None
+        return process
     
-    def _terminate_process(self, process):
-        """终止进程及其子进程"""
+    def _start_isolated_process(self, cmd: list, work_dir: str, env: Dict[str, str], place: Callable[[int], None]):
+        """在新的命名空间中启动引导解释器并交付任务（未命中预热池时的隔离执行路径）"""
+        process = warm_pool.spawn(cmd[0], preload=False)
+        args = cmd[1:]
+        try:
+            place(process.pid)
+            warm_pool.start_job(
+                process, work_dir, self._job_env(work_dir, env),
+                argv=None if args == ["main.py"] else args,
+                python_executable=cmd[0]
+            )
+        except BaseException:
+            warm_pool.discard(process)
+            raise
+        return process
+    
+    @staticmethod
+    def _job_env(work_dir: str, env: Dict[str, str]) -> Dict[str, str]:
+        """引导解释器继承服务进程的环境变量，任务中只需携带不同的部分"""
+        job_env = {"PYTHONPATH": work_dir}
+        job_env.update({k: v for k, v in env.items() if os.environ.get(k) != v})
+        return job_env
+    
+    def _signal_process(self, process, signal_name: str):
+        """向进程组发送信号（用于软超时）"""
+        if sys.platform == "win32":
+            # Windows上没有可供用户代码捕获的等效信号
+            return
+        try:
+            os.killpg(process.pid, getattr(signal, signal_name))
+        except (ProcessLookupError, OSError):
+            pass
+    
+    def _terminate_process(self, process, wait_for_exit=None, graceful: bool = True):
+        """
+        终止进程及其子进程
+        
+        Args:
+            process: 要终止的进程
+            wait_for_exit: 可选的等待函数，参数为超时秒数，返回进程是否已退出；
+                用于在等待期间继续读取输出
+            graceful: 是否先发送SIGTERM并等待2秒，为False时直接强制终止
+        """
+        def wait(seconds: float) -> bool:
+            if wait_for_exit:
+                return wait_for_exit(seconds)
+            try:
+                process.wait(timeout=seconds)
+                return True
+            except subprocess.TimeoutExpired:
+                return False
+        
         try:
             if sys.platform == "win32":
                 # Windows
                 process.terminate()
+                wait(2)
             else:
-                # Unix-like systems
+                # Unix-like systems，进程以独立会话启动，进程组ID即为其PID
+                exited = False
                 try:
                     # 尝试优雅地终止进程组
-                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                    process.wait(timeout=2)
-                except (subprocess.TimeoutExpired, ProcessLookupError):
-                    # 强制终止
-                    try:
-                        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                    except ProcessLookupError:
-                        pass
+                    if graceful:
+                        os.killpg(process.pid, signal.SIGTERM)
+                        exited = wait(2)
+                except ProcessLookupError:
+                    exited = True
+                # 进程组中可能仍有其他进程，统一强制终止
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                if not exited:
+                    wait(1)
         except Exception as e:
             print(f"终止进程时出错: {e}")
     
@@ -318,3 +557,8 @@ class CodeExecutor:
 
 # 全局代码执行器实例
 code_executor = CodeExecutor()
+
+metrics.gauge(
+    "sandbox_active_executions", "正在执行的任务数",
+    lambda: {(): code_executor.active_executions}
+)
@@ -0,0 +1,40 @@
+"""
+快速JSON响应模块
+执行结果可能包含数MB的stdout和base64文件，FastAPI默认路径会先校验响应模型、
+经 jsonable_encoder 转换为dict再由标准库json编码，这里直接用pydantic-core序列化模型
+"""
+
+import json
+from typing import Any
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    直接序列化pydantic模型的JSON响应
+
+    - 安装了orjson时：model_dump() 只做浅层转换（字符串不复制），再由orjson编码，大响应最快
+    - 否则pydantic模型使用 model_dump_json()，在Rust中一次完成；其他内容与JSONResponse一致
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            if isinstance(content, BaseModel):
+                content = content.model_dump()
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
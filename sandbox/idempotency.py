@@ -0,0 +1,273 @@
+"""
+幂等键
+客户端（或网关的重试中间件）通过 Idempotency-Key 请求头重试执行请求时，不会重复执行：
+- 同一个键的执行在进行中时，重试的请求挂到该执行上等待结果
+- 执行完成后，结果在 IDEMPOTENCY_TTL 秒内保存在共享状态目录中，重试直接返回保存的响应
+- 同一个键用于内容不同的请求时返回422
+- 启用多租户时键按租户隔离，不同租户使用相同的键互不影响
+带幂等键的执行与发起它的连接解耦，客户端断开后继续运行到结束，以便重试时取回结果。
+记录按键保存为单独的文件，执行期间由执行所在的进程持有该键的文件锁，
+其他工作进程据此判断执行是否仍在进行，持有者崩溃后锁自动释放，由下一次重试重新执行。
+过期记录的锁文件只在持有锁时删除，获取锁后都要确认锁文件没有在此期间被删除
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from config.settings import settings
+from .metrics import metrics
+from .shared_state import FileLock, shared_state, worker_identity
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# 等待其他工作进程中的执行时的轮询间隔（秒）
+POLL_INTERVAL = 0.2
+# 清理过期记录的最小间隔（秒）
+SWEEP_INTERVAL = 60.0
+
+idempotent_replays = metrics.counter(
+    "sandbox_idempotent_replays_total",
+    "带幂等键的重试请求没有重新执行的次数，source: stored（返回保存的结果）/ inflight（等待进行中的执行）"
+)
+idempotency_conflicts = metrics.counter(
+    "sandbox_idempotency_conflicts_total",
+    "同一个幂等键用于内容不同的请求的次数"
+)
+
+
+class _Job:
+    """当前进程中进行中的带幂等键执行"""
+
+    def __init__(self, fingerprint: str, task: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.task = task
+
+
+class IdempotencyStore:
+    """幂等键记录，保存在 SHARED_STATE_DIR/idempotency 中，同一主机上的工作进程共享"""
+
+    def __init__(self):
+        self._jobs: Dict[str, _Job] = {}
+        self._last_sweep = 0.0
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(shared_state.base_dir, "idempotency")
+
+    def _path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.directory, digest + suffix)
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        timeout: float,
+        operation: Callable[[], Awaitable[Response]],
+        scope: Optional[str] = None
+    ) -> Response:
+        """
+        按幂等键执行
+
+        Args:
+            key: Idempotency-Key 请求头
+            fingerprint: 请求内容哈希（coalescing.execution_key）
+            timeout: 执行超时（秒），用于确定进行中记录的有效期
+            operation: 返回最终响应的协程函数
+            scope: 键的作用域（租户名称），不同作用域的相同键互不影响
+
+        Returns:
+            Response: 本次执行、进行中执行或保存的响应
+        """
+        if not key or len(key) > 255 or not key.isprintable():
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} 必须是1-255个可打印字符")
+        scoped = key if scope is None else f"{scope}\0{key}"
+        digest = hashlib.sha256(scoped.encode("utf-8")).hexdigest()
+
+        while True:
+            job = self._jobs.get(digest)
+            if job is not None:
+                self._check_fingerprint(job.fingerprint, fingerprint)
+                idempotent_replays.inc(source="inflight")
+                return self._replay(await asyncio.shield(job.task))
+
+            record = await asyncio.to_thread(self._load, digest)
+            if record is not None:
+                self._check_fingerprint(record["fingerprint"], fingerprint)
+                if record["status"] == "done":
+                    response = await asyncio.to_thread(self._load_response, digest, record)
+                    if response is not None:
+                        idempotent_replays.inc(source="stored")
+                        return response
+
+            lock = FileLock(self._path(digest, ".lock"))
+            if lock.acquire(blocking=False):
+                if lock.is_current():
+                    break
+                # 锁文件在获取前已被清理删除，重新获取
+                lock.release()
+                continue
+            # 其他工作进程正在执行同一个键，等待它完成
+            await asyncio.sleep(POLL_INTERVAL)
+
+        task = asyncio.ensure_future(self._execute(digest, fingerprint, timeout, operation, lock))
+        self._jobs[digest] = _Job(fingerprint, task)
+        # 带幂等键的执行不随请求取消，断开的客户端重试时直接取回结果
+        return await asyncio.shield(task)
+
+    async def _execute(self, digest: str, fingerprint: str, timeout: float, operation, lock: FileLock) -> Response:
+        try:
+            await asyncio.to_thread(self._write_record, digest, {
+                "status": "running",
+                "fingerprint": fingerprint,
+                "expires_at": time.time() + timeout + settings.IDEMPOTENCY_TTL,
+                "worker": worker_identity(),
+            })
+            response = await operation()
+            if 200 <= response.status_code < 300:
+                await asyncio.to_thread(self._save_response, digest, fingerprint, response)
+            else:
+                # 没有得到执行结果（节点不可用、被取消等），允许重试重新执行
+                await asyncio.to_thread(self._discard, digest, lock)
+            return response
+        except BaseException:
+            await asyncio.to_thread(self._discard, digest, lock)
+            raise
+        finally:
+            lock.release()
+            self._jobs.pop(digest, None)
+            self._sweep_if_due()
+
+    @staticmethod
+    def _check_fingerprint(stored: str, fingerprint: str):
+        if stored != fingerprint:
+            idempotency_conflicts.inc()
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} 已用于内容不同的请求，请为新请求使用新的键"
+            )
+
+    @staticmethod
+    def _replay(response: Response) -> Response:
+        """返回响应副本，中间件会就地修改响应头"""
+        headers = dict(response.headers)
+        headers[REPLAYED_HEADER] = "true"
+        return Response(content=response.body, status_code=response.status_code, headers=headers)
+
+    def _load(self, digest: str) -> Optional[Dict]:
+        try:
+            with open(self._path(digest, ".json"), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("expires_at", 0) < time.time():
+            return None
+        return record
+
+    def _load_response(self, digest: str, record: Dict) -> Optional[Response]:
+        try:
+            with open(self._path(digest, ".body"), "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        return Response(
+            content=body,
+            status_code=record["status_code"],
+            media_type=record.get("media_type"),
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    def _save_response(self, digest: str, fingerprint: str, response: Response):
+        self._write_atomic(self._path(digest, ".body"), response.body)
+        self._write_record(digest, {
+            "status": "done",
+            "fingerprint": fingerprint,
+            "status_code": response.status_code,
+            "media_type": response.headers.get("content-type"),
+            "expires_at": time.time() + settings.IDEMPOTENCY_TTL,
+            "worker": worker_identity(),
+        })
+
+    def _write_record(self, digest: str, record: Dict):
+        self._write_atomic(self._path(digest, ".json"), json.dumps(record).encode("utf-8"))
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _remove(self, digest: str):
+        for suffix in (".json", ".body"):
+            try:
+                os.remove(self._path(digest, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _discard(self, digest: str, lock: FileLock):
+        """删除记录和锁文件，调用方必须持有 lock；锁文件已被替换时只删除记录"""
+        self._remove(digest)
+        if lock.is_current():
+            try:
+                os.remove(lock.path)
+            except FileNotFoundError:
+                pass
+
+    def _sweep_if_due(self):
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        asyncio.get_running_loop().run_in_executor(None, self.sweep)
+
+    def sweep(self):
+        """删除过期的记录；锁文件只在本进程持有时删除"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        now = time.time()
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            digest = name[:-len(".json")]
+            record_path = self._path(digest, ".json")
+            try:
+                with open(record_path, "r", encoding="utf-8") as f:
+                    expires_at = json.load(f).get("expires_at", 0)
+            except (OSError, ValueError):
+                continue
+            if expires_at >= now:
+                continue
+            lock = FileLock(self._path(digest, ".lock"))
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if not lock.is_current():
+                    # 另一个工作进程的清理已删除了这个锁文件，path 上可能是别人持有的新文件
+                    continue
+                if self._load(digest) is not None:
+                    # 获取锁之前记录已被新的执行重写
+                    continue
+                self._discard(digest, lock)
+            except OSError:
+                pass
+            finally:
+                lock.release()
+
+
+# 全局幂等键记录实例
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,93 @@
+"""
+运行指标
+以Prometheus文本格式在 /metrics 输出计数器和按需采集的指标，不依赖 prometheus_client。
+指标保存在各工作进程内存中，WORKERS>1 时每次抓取只反映处理该请求的进程
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 标签键值对，按定义顺序排列
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    """单调递增的计数器，可带标签"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(labels.items())
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(labels.items()), 0.0)
+
+    def samples(self) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    - counter(): 定义计数器，由各模块在事件发生时递增
+    - gauge(): 注册采集函数，抓取时调用，返回 {标签: 数值}，用于已有的状态统计（预热池、遗留进程等）
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Tuple[str, str, Callable[[], Dict[Labels, float]]]] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        if name not in self._counters:
+            self._counters[name] = Counter(name, help_text)
+        return self._counters[name]
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], Dict[Labels, float]], kind: str = "gauge"):
+        """kind 为 counter 时表示采集函数返回的是累计值"""
+        self._gauges[name] = (help_text, kind, collect)
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        lines: List[str] = []
+        for counter in self._counters.values():
+            self._render_family(lines, counter.name, counter.help, "counter", counter.samples())
+        for name, (help_text, kind, collect) in self._gauges.items():
+            try:
+                samples = list(collect().items())
+            except Exception as e:
+                print(f"采集指标 {name} 失败: {e}")
+                continue
+            self._render_family(lines, name, help_text, kind, samples)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_family(lines: List[str], name: str, help_text: str, kind: str, samples: Iterable[Tuple[Labels, float]]):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if labels:
+                rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                lines.append(f"{name}{{{rendered}}} {_format(value)}")
+            else:
+                lines.append(f"{name} {_format(value)}")
+
+
+# 全局指标注册表实例
+metrics = MetricsRegistry()
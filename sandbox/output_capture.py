@@ -0,0 +1,270 @@
+"""
+输出捕获模块
+增量读取子进程的stdout/stderr管道，只在内存中保留头部和尾部，
+超出部分写入溢出文件，供客户端通过 /outputs 接口下载完整输出
+"""
+
+import os
+import sys
+import time
+import shutil
+import selectors
+import subprocess
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+from config.settings import settings
+from .utils import sanitize_output
+
+
+READ_CHUNK_SIZE = 64 * 1024
+STREAM_NAMES = ("stdout", "stderr")
+
+
+class OutputStore:
+    """溢出文件存储，按执行ID分目录保存，过期后自动清理"""
+
+    def __init__(self, base_dir: Optional[str] = None, ttl: Optional[int] = None):
+        self.base_dir = base_dir or os.path.join(settings.TEMP_DIR, "outputs")
+        self.ttl = ttl if ttl is not None else settings.OUTPUT_SPILL_TTL
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    def path(self, output_id: str, stream: str) -> str:
+        """溢出文件路径"""
+        return os.path.join(self.base_dir, output_id, f"{stream}.log")
+
+    def open_spill(self, output_id: str, stream: str):
+        """创建溢出文件并返回二进制写句柄"""
+        self.cleanup_expired()
+        directory = os.path.join(self.base_dir, output_id)
+        os.makedirs(directory, exist_ok=True)
+        return open(self.path(output_id, stream), "wb")
+
+    def get(self, output_id: str, stream: str) -> Optional[str]:
+        """获取已存在的溢出文件路径，不存在或ID非法时返回None"""
+        if stream not in STREAM_NAMES or not output_id.isalnum():
+            return None
+        path = self.path(output_id, stream)
+        return path if os.path.exists(path) else None
+
+    def cleanup_expired(self, force: bool = False):
+        """清理过期的溢出文件，默认每分钟最多执行一次"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < 60:
+                return
+            self._last_cleanup = now
+
+        if not os.path.isdir(self.base_dir):
+            return
+        for name in os.listdir(self.base_dir):
+            directory = os.path.join(self.base_dir, name)
+            try:
+                if now - os.path.getmtime(directory) > self.ttl:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except OSError:
+                continue
+
+
+class OutputCapture:
+    """
+    单个输出流的有界捕获
+
+    内存中最多保留 limit 字节：前一半作为头部原样保留，后一半作为尾部环形缓冲。
+    总输出超过 limit 时标记为截断，并（在启用时）把完整输出写入溢出文件
+    """
+
+    def __init__(
+        self,
+        stream: str,
+        limit: Optional[int] = None,
+        output_id: Optional[str] = None,
+        store: Optional[OutputStore] = None,
+        listener: Optional[Callable[[str, bytes], None]] = None
+    ):
+        self.stream = stream
+        self.listener = listener
+        self.limit = limit if limit is not None else settings.MAX_OUTPUT_SIZE
+        self.head_limit = self.limit // 2
+        self.tail_limit = self.limit - self.head_limit
+        self.output_id = output_id
+        self.store = store
+
+        self.total_bytes = 0
+        self.truncated = False
+        self.spilled = False
+        self.spill_truncated = False
+
+        self._head = bytearray()
+        self._tail = deque()
+        self._tail_bytes = 0
+        self._spill_file = None
+        self._spill_bytes = 0
+
+    def feed(self, data: bytes):
+        """写入一段输出"""
+        if not data:
+            return
+        self.total_bytes += len(data)
+        if self.listener is not None:
+            self.listener(self.stream, data)
+
+        if len(self._head) < self.head_limit:
+            room = self.head_limit - len(self._head)
+            self._head += data[:room]
+            data = data[room:]
+            if not data:
+                return
+
+        self._tail.append(data)
+        self._tail_bytes += len(data)
+
+        if not self.truncated and self.total_bytes > self.limit:
+            self.truncated = True
+            self._start_spill()
+        elif self._spill_file is not None:
+            self._write_spill(data)
+
+        # 丢弃超出尾部容量的最早数据
+        while self._tail_bytes > self.tail_limit:
+            excess = self._tail_bytes - self.tail_limit
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                self._tail_bytes -= len(first)
+            else:
+                self._tail[0] = first[excess:]
+                self._tail_bytes -= excess
+
+    def _start_spill(self):
+        """首次超出限制时开始写溢出文件，此时尾部缓冲尚未丢弃任何数据"""
+        if not settings.OUTPUT_SPILL_ENABLED or not self.output_id or self.store is None:
+            return
+        try:
+            self._spill_file = self.store.open_spill(self.output_id, self.stream)
+            self.spilled = True
+            self._write_spill(bytes(self._head))
+            for chunk in self._tail:
+                self._write_spill(chunk)
+        except OSError as e:
+            print(f"写入输出溢出文件失败: {e}")
+            self._spill_file = None
+
+    def _write_spill(self, data: bytes):
+        if self._spill_file is None:
+            return
+        room = settings.MAX_SPILL_SIZE - self._spill_bytes
+        if room <= 0:
+            self.spill_truncated = True
+            self.close()
+            return
+        self._spill_file.write(data[:room])
+        self._spill_bytes += min(len(data), room)
+        if len(data) > room:
+            self.spill_truncated = True
+            self.close()
+
+    def close(self):
+        """关闭溢出文件"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def text(self) -> str:
+        """返回解码后的输出，截断时在头尾之间插入提示"""
+        self.close()
+        head = bytes(self._head).decode("utf-8", errors="replace")
+        if not self.truncated:
+            tail = b"".join(self._tail).decode("utf-8", errors="replace")
+            return sanitize_output(head + tail, max_length=None)
+
+        tail = b"".join(self._tail).decode("utf-8", errors="replace")
+        omitted = self.total_bytes - len(self._head) - self._tail_bytes
+        marker = f"\n... (输出被截断，省略 {omitted} 字节"
+        if self.spilled:
+            marker += "，完整输出可通过 output_id 下载"
+        marker += ") ...\n"
+        return sanitize_output(head + marker + tail, max_length=None)
+
+
+def pump_process_output(
+    process: subprocess.Popen,
+    stdout_capture: OutputCapture,
+    stderr_capture: OutputCapture,
+    timeout: float,
+    drain_grace: float = 0.5,
+    soft_timeout: Optional[float] = None,
+    on_soft_timeout: Optional[Callable[[], None]] = None,
+    cancel_event: Optional[threading.Event] = None
+) -> bool:
+    """
+    增量读取子进程输出直到进程结束或超时
+
+    Args:
+        process: 以二进制管道启动的子进程
+        stdout_capture: stdout捕获器
+        stderr_capture: stderr捕获器
+        timeout: 超时时间（秒）
+        drain_grace: 进程退出后继续读取管道的最长时间，防止后台子进程持有管道导致阻塞
+        soft_timeout: 软超时（秒），到达时调用 on_soft_timeout 一次
+        on_soft_timeout: 软超时回调，通常用于向用户代码发送信号
+        cancel_event: 取消事件，被设置后与超时一样立即返回（最多延迟0.1秒）
+
+    Returns:
+        bool: 进程是否在超时（或取消）前结束
+    """
+    if sys.platform == "win32":
+        # Windows管道不支持select，退化为一次性读取
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        stdout_capture.feed(stdout or b"")
+        stderr_capture.feed(stderr or b"")
+        return True
+
+    started = time.monotonic()
+    deadline = started + timeout
+    soft_deadline = started + soft_timeout if soft_timeout is not None and on_soft_timeout else None
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, stdout_capture)
+    selector.register(process.stderr, selectors.EVENT_READ, stderr_capture)
+    exited_at = None
+
+    try:
+        while selector.get_map():
+            now = time.monotonic()
+            if exited_at is None and process.poll() is not None:
+                exited_at = now
+            if exited_at is not None:
+                if now - exited_at > drain_grace:
+                    break
+                wait = drain_grace
+            else:
+                if now >= deadline or (cancel_event is not None and cancel_event.is_set()):
+                    return False
+                if soft_deadline is not None and now >= soft_deadline:
+                    soft_deadline = None
+                    on_soft_timeout()
+                wait = min(deadline - now, 0.1)
+
+            for key, _ in selector.select(wait):
+                data = os.read(key.fd, READ_CHUNK_SIZE)
+                if data:
+                    key.data.feed(data)
+                else:
+                    selector.unregister(key.fileobj)
+    finally:
+        selector.close()
+
+    try:
+        process.wait(timeout=max(deadline - time.monotonic(), 0))
+    except subprocess.TimeoutExpired:
+        return False
+    return True
+
+
+# 全局溢出文件存储实例
+output_store = OutputStore()
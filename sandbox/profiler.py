@@ -0,0 +1,290 @@
+"""
+性能分析模块
+在不修改用户代码的前提下，通过包装脚本以 cProfile 或采样方式运行 main.py，
+并解析 -X importtime 输出得到模块导入耗时
+"""
+
+import os
+import json
+import base64
+from typing import Dict, List, Tuple
+
+from models.request import (
+    ProfileOptions, ProfileResult, ProfileEntry, ImportTimeEntry
+)
+from config.settings import settings
+
+
+# 分析数据目录（以点开头的目录不会被当作输出文件收集）
+PROFILE_DIR = ".sandbox_profile"
+RUNNER_NAME = "runner.py"
+SUMMARY_NAME = "summary.json"
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+# 在沙盒子进程中运行的包装脚本，需兼容较老的Python版本
+RUNNER_SOURCE = r'''
+import os
+import sys
+import json
+import time
+import runpy
+import threading
+
+MODE, OUT_DIR, TOP_N, SORT_BY, INTERVAL_MS = (
+    sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4], float(sys.argv[5])
+)
+WORK_DIR = os.getcwd()
+RUNNER_FILE = os.path.abspath(__file__)
+RUNPY_FILES = (runpy.__file__, runpy.__file__.rstrip("c"), "<frozen runpy>")
+SKIP_FILES = (RUNNER_FILE,) + RUNPY_FILES
+
+# 让用户代码看起来像是直接以 python main.py 运行
+sys.argv = ["main.py"]
+sys.path[0] = WORK_DIR
+
+
+def _label(code):
+    return "%s:%d(%s)" % (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _write_summary(summary):
+    with open(os.path.join(OUT_DIR, "summary.json"), "w") as f:
+        json.dump(summary, f)
+
+
+def _run_cprofile():
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        runpy.run_path("main.py", run_name="__main__")
+    finally:
+        profiler.disable()
+        total = time.perf_counter() - start
+        profiler.dump_stats(os.path.join(OUT_DIR, "profile.pstats"))
+        stats = pstats.Stats(profiler).stats
+        rows = []
+        for (filename, lineno, name), (cc, nc, tt, ct, _) in stats.items():
+            if filename in SKIP_FILES:
+                continue
+            rows.append({
+                "function": "%s:%d(%s)" % (filename, lineno, name),
+                "calls": nc,
+                "self_time": tt,
+                "cumulative_time": ct,
+            })
+        key = {"tottime": "self_time", "calls": "calls"}.get(SORT_BY, "cumulative_time")
+        rows.sort(key=lambda r: r[key], reverse=True)
+        _write_summary({"total_time": total, "top_functions": rows[:TOP_N]})
+
+
+def _run_sampling():
+    interval = INTERVAL_MS / 1000.0
+    target = threading.get_ident()
+    stacks = {}
+    state = {"samples": 0, "running": True}
+
+    def sample():
+        while state["running"]:
+            frame = sys._current_frames().get(target)
+            stack = []
+            # 只记录runpy之下的用户代码栈
+            while frame is not None and frame.f_code.co_filename not in RUNPY_FILES:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            if frame is not None and stack:
+                key = tuple(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+                state["samples"] += 1
+            time.sleep(interval)
+
+    sampler = threading.Thread(target=sample, name="sandbox-sampler", daemon=True)
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        runpy.run_path("main.py", run_name="__main__")
+    finally:
+        state["running"] = False
+        sampler.join()
+        total = time.perf_counter() - start
+
+        with open(os.path.join(OUT_DIR, "profile.collapsed"), "w") as f:
+            for stack, count in stacks.items():
+                f.write("%s %d\n" % (";".join(stack), count))
+
+        frames, frame_index = [], {}
+        samples, weights = [], []
+        self_counts, total_counts = {}, {}
+        for stack, count in stacks.items():
+            indices = []
+            for name in stack:
+                if name not in frame_index:
+                    frame_index[name] = len(frames)
+                    frames.append({"name": name})
+                indices.append(frame_index[name])
+            samples.append(indices)
+            weights.append(count * interval)
+            self_counts[stack[-1]] = self_counts.get(stack[-1], 0) + count
+            for name in set(stack):
+                total_counts[name] = total_counts.get(name, 0) + count
+
+        with open(os.path.join(OUT_DIR, "profile.speedscope.json"), "w") as f:
+            json.dump({
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames},
+                "profiles": [{
+                    "type": "sampled",
+                    "name": "main.py",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": total,
+                    "samples": samples,
+                    "weights": weights,
+                }],
+                "exporter": "SimplePySandbox",
+            }, f)
+
+        rows = [{
+            "function": name,
+            "calls": None,
+            "self_time": self_counts.get(name, 0) * interval,
+            "cumulative_time": count * interval,
+        } for name, count in total_counts.items()]
+        rows.sort(key=lambda r: r["cumulative_time"], reverse=True)
+        _write_summary({
+            "total_time": total,
+            "samples": state["samples"],
+            "top_functions": rows[:TOP_N],
+        })
+
+
+if MODE == "sampling":
+    _run_sampling()
+else:
+    _run_cprofile()
+'''
+
+
+def prepare_profile_run(work_dir: str, options: ProfileOptions) -> List[str]:
+    """
+    写入包装脚本并返回解释器参数（不含解释器路径）
+
+    Args:
+        work_dir: 沙盒工作目录
+        options: 性能分析选项
+
+    Returns:
+        List[str]: 用于替代 ["main.py"] 的命令行参数
+    """
+    profile_dir = os.path.join(work_dir, PROFILE_DIR)
+    os.makedirs(profile_dir, exist_ok=True)
+    runner_path = os.path.join(profile_dir, RUNNER_NAME)
+    with open(runner_path, "w", encoding="utf-8") as f:
+        f.write(RUNNER_SOURCE)
+
+    args = []
+    if options.import_time:
+        args += ["-X", "importtime"]
+    args += [
+        os.path.join(PROFILE_DIR, RUNNER_NAME),
+        options.mode.value,
+        profile_dir,
+        str(options.top_n),
+        options.sort_by,
+        str(options.sample_interval_ms),
+    ]
+    return args
+
+
+def split_import_times(stderr: str) -> Tuple[str, List[Tuple[int, int, int, str]]]:
+    """
+    从stderr中分离 -X importtime 输出
+
+    Returns:
+        tuple: (去除导入统计后的stderr, [(自身耗时, 累计耗时, 层级, 模块名)])
+    """
+    kept_lines = []
+    records = []
+    for line in stderr.splitlines(keepends=True):
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            kept_lines.append(line)
+            continue
+        parts = line[len(IMPORT_TIME_PREFIX):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # 表头行: "self [us] | cumulative | imported package"
+            continue
+        raw_name = parts[2].rstrip("\n")
+        stripped = raw_name.lstrip(" ")
+        depth = (len(raw_name) - len(stripped) - 1) // 2
+        records.append((self_us, cumulative_us, depth, stripped))
+    return "".join(kept_lines), records
+
+
+def collect_profile_result(
+    work_dir: str,
+    options: ProfileOptions,
+    stderr: str
+) -> Tuple[ProfileResult, str]:
+    """
+    收集性能分析结果
+
+    Args:
+        work_dir: 沙盒工作目录
+        options: 性能分析选项
+        stderr: 子进程的标准错误输出
+
+    Returns:
+        tuple: (分析结果, 去除导入统计后的stderr)
+    """
+    cleaned_stderr, records = split_import_times(stderr) if options.import_time else (stderr, [])
+
+    import_times = [
+        ImportTimeEntry(module=name, self_us=self_us, cumulative_us=cumulative_us)
+        for self_us, cumulative_us, _, name in sorted(records, key=lambda r: r[1], reverse=True)
+    ][:options.top_n]
+    import_total_us = sum(r[1] for r in records if r[2] == 0) if records else None
+
+    profile_dir = os.path.join(work_dir, PROFILE_DIR)
+    summary_path = os.path.join(profile_dir, SUMMARY_NAME)
+    if not os.path.exists(summary_path):
+        return ProfileResult(
+            mode=options.mode,
+            total_time=0.0,
+            import_times=import_times,
+            import_total_us=import_total_us,
+            error="未生成性能分析数据（进程可能被终止或超时）"
+        ), cleaned_stderr
+
+    with open(summary_path, "r", encoding="utf-8") as f:
+        summary = json.load(f)
+
+    return ProfileResult(
+        mode=options.mode,
+        total_time=summary.get("total_time", 0.0),
+        samples=summary.get("samples"),
+        top_functions=[ProfileEntry(**row) for row in summary.get("top_functions", [])],
+        import_times=import_times,
+        import_total_us=import_total_us,
+        artifacts=_read_artifacts(profile_dir),
+    ), cleaned_stderr
+
+
+def _read_artifacts(profile_dir: str) -> Dict[str, str]:
+    """读取可下载的分析文件并编码为base64"""
+    artifacts = {}
+    for name in ("profile.pstats", "profile.collapsed", "profile.speedscope.json"):
+        path = os.path.join(profile_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) > settings.MAX_FILE_SIZE:
+            continue
+        with open(path, "rb") as f:
+            artifacts[name] = base64.b64encode(f.read()).decode("utf-8")
+    return artifacts
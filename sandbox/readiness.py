@@ -0,0 +1,173 @@
+"""
+启动预热与就绪状态
+/health 只表示进程存活；/ready 在启动预热（工作目录、隔离后端、conda探测、常用环境的预热解释器、
+自检执行）完成后才返回200，负载均衡器据此避免把流量发给尚未预热的实例
+"""
+
+import os
+import sys
+import time
+import asyncio
+from typing import Dict, List, Tuple
+
+from models.request import ReadinessCheck
+from config.settings import settings
+from .conda import conda_probe
+from .isolation import isolation
+from .warm_pool import warm_pool
+from .utils import create_secure_temp_dir, cleanup_temp_dir
+
+# 自检代码及期望输出
+SELF_TEST_CODE = "print('sandbox-ready')"
+SELF_TEST_OUTPUT = "sandbox-ready"
+# 失败后不影响就绪的检查项（默认环境仍然可用）
+NON_FATAL_CHECKS = ("conda", "environments", "warm_pool")
+
+
+class Readiness:
+    """
+    就绪状态
+
+    状态依次为 starting → warming → ready；必需的检查（工作目录、隔离后端、自检执行）失败时为 failed。
+    conda不可用、个别环境损坏或预热超时只记录在检查结果中，不阻止就绪
+    """
+
+    def __init__(self):
+        self.status = "starting"
+        self.checks: Dict[str, ReadinessCheck] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def _record(self, name: str, ok: bool, detail: str, started: float):
+        self.checks[name] = ReadinessCheck(ok=ok, detail=detail, duration=time.perf_counter() - started)
+        icon = "✅" if ok else ("⚠️" if name in NON_FATAL_CHECKS else "❌")
+        print(f"{icon} 预热检查 {name}: {detail or 'ok'}")
+
+    async def warm_up(self, executor, env_manager):
+        """依次执行各项预热，完成后标记为就绪"""
+        self.status = "warming"
+        started_at = time.perf_counter()
+
+        await self._check_workspace()
+        await self._check_isolation()
+        await self._check_conda()
+        targets = self._check_environments(env_manager)
+        await self._check_warm_pool(targets)
+        await self._check_self_test(executor)
+
+        failed = [name for name, check in self.checks.items() if not check.ok and name not in NON_FATAL_CHECKS]
+        self.status = "failed" if failed else "ready"
+        elapsed = time.perf_counter() - started_at
+        if failed:
+            print(f"❌ 预热失败（{', '.join(failed)}），/ready 将返回503")
+        else:
+            print(f"✅ 预热完成，用时 {elapsed:.2f}s，开始接收流量")
+
+    def skip(self):
+        """未启用预热时直接标记为就绪"""
+        self.status = "ready"
+
+    async def _check_workspace(self):
+        """创建临时目录、输出目录和共享状态目录，并验证可以创建/清理执行目录"""
+        started = time.perf_counter()
+        try:
+            from .output_capture import output_store
+            from .shared_state import shared_state
+            for directory in (settings.TEMP_DIR, output_store.base_dir, shared_state.base_dir):
+                os.makedirs(directory, exist_ok=True)
+            cleanup_temp_dir(await asyncio.to_thread(create_secure_temp_dir))
+            self._record("workspace", True, settings.TEMP_DIR, started)
+        except OSError as e:
+            self._record("workspace", False, f"创建工作目录失败: {e}", started)
+
+    async def _check_isolation(self):
+        """配置了隔离后端时必须可用，否则所有执行都会失败"""
+        started = time.perf_counter()
+        if not isolation.enabled:
+            self._record("isolation", True, f"未启用（ISOLATION_BACKEND={settings.ISOLATION_BACKEND}）", started)
+            return
+        error = await asyncio.to_thread(isolation.check)
+        self._record("isolation", not error, error or "namespace", started)
+
+    async def _check_conda(self):
+        started = time.perf_counter()
+        try:
+            info = await asyncio.to_thread(conda_probe.info)
+            self._record("conda", True, f"conda {info['conda_version']}", started)
+        except RuntimeError as e:
+            self._record("conda", False, str(e), started)
+
+    def _check_environments(self, env_manager) -> List[Tuple[str, str]]:
+        """
+        按 last_used 选出最近使用的前 WARMUP_ENVIRONMENTS 个就绪环境，校验解释器存在
+
+        Returns:
+            List[Tuple[str, str]]: 需要预热的 (环境键, Python解释器路径)，包含默认环境
+        """
+        started = time.perf_counter()
+        targets = [("default", sys.executable)]
+        ranked = sorted(
+            (env for env in env_manager.list_environments() if env.status == "ready"),
+            key=lambda env: env.last_used or "",
+            reverse=True
+        )[:settings.WARMUP_ENVIRONMENTS]
+
+        broken = []
+        for env in ranked:
+            info = env_manager.get_environment_info(env.name) or {}
+            python_executable = info.get("python_executable")
+            if python_executable and os.path.exists(python_executable):
+                targets.append((env.name, python_executable))
+            else:
+                broken.append(env.name)
+
+        names = [name for name, _ in targets[1:]]
+        if broken:
+            self._record("environments", False, f"环境解释器不存在: {', '.join(broken)}", started)
+        else:
+            self._record("environments", True, ", ".join(names) or "无已就绪环境", started)
+        return targets
+
+    async def _check_warm_pool(self, targets: List[Tuple[str, str]]):
+        """为各环境启动预热解释器，并等待到达目标数量"""
+        started = time.perf_counter()
+        if not warm_pool.enabled:
+            self._record("warm_pool", True, "未启用（WARM_POOL_SIZE=0）", started)
+            return
+
+        # 超过 WARM_POOL_MAX_ENVS 的环境会被立即回收，不再等待
+        targets = targets[:settings.WARM_POOL_MAX_ENVS]
+        for key, python_executable in targets:
+            warm_pool.ensure(key, python_executable)
+
+        deadline = time.monotonic() + settings.WARMUP_TIMEOUT
+        pending = [key for key, _ in targets]
+        while pending and time.monotonic() < deadline:
+            stats = warm_pool.stats()
+            pending = [key for key in pending if stats.get(key, {}).get("warm", 0) < settings.WARM_POOL_SIZE]
+            if pending:
+                await asyncio.sleep(0.05)
+
+        if pending:
+            self._record("warm_pool", False, f"预热超时: {', '.join(pending)}", started)
+        else:
+            self._record("warm_pool", True, f"{len(targets)} 个环境已预热", started)
+
+    async def _check_self_test(self, executor):
+        """在默认环境中执行一段代码，覆盖完整执行路径"""
+        started = time.perf_counter()
+        try:
+            result = await executor.execute(code=SELF_TEST_CODE, timeout=30)
+        except Exception as e:
+            self._record("self_test", False, f"自检执行异常: {e}", started)
+            return
+        if result.success and result.stdout.strip() == SELF_TEST_OUTPUT:
+            self._record("self_test", True, f"{result.execution_time:.3f}s", started)
+        else:
+            self._record("self_test", False, f"自检执行失败: {result.error or result.stderr[-200:]}", started)
+
+
+# 全局就绪状态实例
+readiness = Readiness()
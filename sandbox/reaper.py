@@ -0,0 +1,335 @@
+"""
+遗留进程回收
+用户代码可能通过两次fork、setsid或后台守护进程脱离执行的进程组，main.py 退出后仍然占用CPU和内存：
+- 服务进程设为 child subreaper，脱离父进程的后代会被挂到服务进程下而不是init，退出后由这里回收
+- 每次执行的根进程以独立会话启动，并在初始环境变量中带有唯一标记，fork 和 exec 出的所有后代都会继承
+- 执行结束后只扫描服务进程自己的进程树（/proc/self/task/*/children），强制终止该执行遗留的所有进程，
+  以及带有已结束执行的标记的进程；既清空了环境变量又脱离了会话的进程无法确认归属，不会终止（需要时启用命名空间隔离）
+- 根进程通过 wait4 回收，退出后可以得到整个执行实际消耗的CPU时间
+"""
+
+import os
+import sys
+import uuid
+import ctypes
+import signal
+import threading
+import subprocess
+from typing import Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+from .metrics import metrics
+
+# 执行标记的环境变量名
+TAG_ENV = "SANDBOX_PROCESS_TAG"
+# 一次清理最多扫描的轮数，防止fork炸弹在终止过程中不断产生新进程
+SWEEP_ROUNDS = 5
+PR_SET_CHILD_SUBREAPER = 36
+
+
+class TrackedPopen(subprocess.Popen):
+    """
+    通过 wait4 回收的子进程
+
+    退出后 rusage 为该进程及其已回收的后代的资源使用；Popen 的 poll() 和 wait() 分别经过
+    _internal_poll 和 _try_wait，这里只替换其中的 waitpid
+    """
+
+    rusage = None
+
+    def _wait4(self, pid: int, options: int) -> Tuple[int, int]:
+        pid, status, rusage = os.wait4(pid, options)
+        if pid == self.pid:
+            self.rusage = rusage
+        return pid, status
+
+    def _internal_poll(self, _deadstate=None, **kwargs):
+        return super()._internal_poll(_deadstate=_deadstate, _waitpid=self._wait4)
+
+    def _try_wait(self, wait_flags):
+        try:
+            return self._wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+
+
+def _stat(pid: int) -> Optional[Tuple[bool, int]]:
+    """(是否为僵尸进程, 会话ID)，进程已不存在时返回None"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        # fields: state ppid pgrp session ...
+        return fields[0] == b"Z", int(fields[3])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _children(pid: int) -> List[int]:
+    """进程的直接子进程（所有线程的 /proc/<pid>/task/<tid>/children）"""
+    children = []
+    try:
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+    for tid in tids:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children", "r") as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return children
+
+
+def _descendants(pid: int) -> List[int]:
+    """进程的所有后代（不含进程本身）"""
+    descendants = []
+    pending = _children(pid)
+    while pending:
+        current = pending.pop()
+        if current in descendants:
+            continue
+        descendants.append(current)
+        pending.extend(_children(current))
+    return descendants
+
+
+def _process_tag(pid: int) -> Optional[str]:
+    """进程初始环境变量中的执行标记，没有标记或无法读取时返回None"""
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            environ = f.read()
+    except OSError:
+        return None
+    for entry in environ.split(b"\0"):
+        name, _, value = entry.partition(b"=")
+        if name == TAG_ENV.encode():
+            return value.decode("ascii", "replace")
+    return None
+
+
+def cpu_seconds(rusage) -> float:
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """进程自身目前已消耗的CPU时间（/proc/<pid>/stat 的 utime+stime），无法读取时返回0"""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        # fields: state ppid ... utime(11) stime(12)
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+class ProcessReaper:
+    """
+    遗留进程回收器
+
+    - popen(): 以带执行标记的环境启动执行的根进程（冷启动、预热解释器均经过这里，调用方需传入 start_new_session=True）
+    - sweep(): 根进程结束后终止同一执行的其余进程（同一会话或带相同标记），返回泄漏的进程数
+    - 其他已结束执行遗留的带标记进程和孤儿僵尸进程在每次清理时顺带终止和回收
+    服务自身启动的辅助进程（conda、环境探测、安装脚本）与服务进程在同一会话中，不受影响
+    """
+
+    def __init__(self):
+        self.subreaper = False
+        self.sweeps = 0
+        self.leaked_processes = 0
+        self.orphans_reaped = 0
+        self.strays_killed = 0
+        # 由 popen() 启动、尚未结束的根进程及其执行标记，回收孤儿时不能抢先wait它们
+        self._managed: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PROCESS_REAPER_ENABLED and sys.platform.startswith("linux")
+
+    def enable_subreaper(self):
+        """把当前进程设为 child subreaper（每个工作进程启动时调用一次）"""
+        if not self.enabled or self.subreaper:
+            return
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.prctl(PR_SET_CHILD_SUBREAPER, ctypes.c_ulong(1), 0, 0, 0) == 0:
+            self.subreaper = True
+            print("✅ 已启用遗留进程回收（child subreaper）")
+        else:
+            print(f"⚠️ 设置 child subreaper 失败: {os.strerror(ctypes.get_errno())}，仍会按标记清理遗留进程")
+
+    def popen(self, cmd: List[str], env: Dict[str, str], **kwargs) -> subprocess.Popen:
+        """启动根进程，进程对象的 sandbox_tag 属性为本次执行的标记"""
+        tag = uuid.uuid4().hex
+        env = dict(env)
+        env[TAG_ENV] = tag
+        popen = TrackedPopen if hasattr(os, "wait4") else subprocess.Popen
+        # 启动和登记在同一把锁内完成，并发的清理不会把尚未登记的根进程当作遗留进程
+        with self._lock:
+            process = popen(cmd, env=env, **kwargs)
+            self._managed[process.pid] = tag
+        process.sandbox_tag = tag
+        process.leaked_cpu_seconds = 0.0
+        # 交付任务前已消耗的CPU时间（预热解释器导入模块等），不计入执行
+        process.cpu_baseline = 0.0
+        return process
+
+    def release(self, process: subprocess.Popen):
+        """根进程已被wait，不再需要排除在孤儿回收之外"""
+        with self._lock:
+            self._managed.pop(process.pid, None)
+
+    def sweep(self, process: subprocess.Popen) -> int:
+        """
+        终止根进程结束后仍在运行的同一执行的进程
+
+        Args:
+            process: 由 popen() 启动的根进程
+
+        Returns:
+            int: 泄漏（被强制终止）的进程数，不包括根进程本身
+        """
+        tag = getattr(process, "sandbox_tag", None)
+        if not tag or not self.enabled:
+            self.release(process)
+            return 0
+
+        leaked: Set[int] = set()
+        strays: Set[int] = set()
+        orphans: List[int] = []
+        for _ in range(SWEEP_ROUNDS):
+            if self.subreaper:
+                ours, stray, orphans = self._scan_children(process.pid, tag)
+            else:
+                ours, stray, orphans = [pid for pid in self._scan(tag) if pid != process.pid], [], []
+            if not ours and not stray:
+                break
+            leaked.update(ours)
+            strays.update(stray)
+            for pid in ours + stray:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            # 被挂到服务进程下的孤儿在这里回收，本次执行的进程的CPU时间计入本次执行；
+            # 其余的由各自的父进程回收，或在父进程被终止后挂到服务进程下，由下一轮回收
+            for pid in ours:
+                rusage = self._wait4(pid)
+                if rusage is not None:
+                    process.leaked_cpu_seconds += cpu_seconds(rusage)
+            for pid in stray:
+                self._wait4(pid)
+
+        # 根进程在异常路径上可能仍未结束
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        self.release(process)
+        reaped = sum(1 for pid in orphans if self._wait(pid, blocking=False))
+
+        with self._lock:
+            self.sweeps += 1
+            self.leaked_processes += len(leaked) + len(strays)
+            self.strays_killed += len(strays)
+            self.orphans_reaped += reaped
+        if leaked:
+            print(f"🧹 已终止执行遗留的 {len(leaked)} 个进程")
+        if strays:
+            print(f"🧹 已终止其他已结束执行遗留的 {len(strays)} 个进程")
+        return len(leaked)
+
+    def _scan_children(self, root: int, tag: str) -> Tuple[List[int], List[int], List[int]]:
+        """
+        扫描服务进程的子进程（脱离父进程的后代都会被挂到服务进程下）及其后代
+
+        Args:
+            root: 本次执行的根进程，以独立会话启动，会话ID即其pid
+            tag: 本次执行的标记
+
+        Returns:
+            Tuple[List[int], List[int], List[int]]: (本次执行的进程, 已结束的其他执行遗留的进程, 可以回收的孤儿僵尸进程)
+        """
+        own_sid = os.getsid(0)
+        ours, strays, orphans = [], [], []
+        # 扫描期间持有锁，popen() 不会在扫描过程中启动尚未登记的根进程
+        with self._lock:
+            live_tags = set(self._managed.values())
+            for pid in _children(os.getpid()):
+                if pid == root:
+                    ours.extend(_descendants(pid))
+                    continue
+                if pid in self._managed:
+                    # 其他进行中的执行或空闲的预热解释器
+                    continue
+                stat = _stat(pid)
+                # 服务自身以同一会话启动的子进程（conda等）由调用方wait
+                if stat is None or stat[1] == own_sid:
+                    continue
+                zombie, session = stat
+                if zombie:
+                    if session == root:
+                        ours.append(pid)
+                    elif session not in self._managed:
+                        orphans.append(pid)
+                    continue
+                process_tag = _process_tag(pid)
+                if session == root or process_tag == tag:
+                    group = ours
+                elif process_tag is not None and process_tag not in live_tags:
+                    # 其他执行已经结束（例如该执行的清理先于进程脱离完成），按标记可以确认是遗留进程
+                    group = strays
+                else:
+                    # 进行中的执行的进程，或无法确认归属的进程，不终止
+                    continue
+                group.append(pid)
+                group.extend(_descendants(pid))
+        return ours, strays, orphans
+
+    def _scan(self, tag: str) -> List[int]:
+        """未启用 child subreaper 时脱离的进程会被挂到init下，只能扫描整个 /proc 查找带标记的进程"""
+        tagged = []
+        for name in os.listdir("/proc"):
+            if name.isdigit() and _process_tag(int(name)) == tag:
+                tagged.append(int(name))
+        return tagged
+
+    @staticmethod
+    def _wait4(pid: int):
+        """阻塞回收子进程，返回其资源使用；不是当前进程的子进程时返回None"""
+        try:
+            return os.wait4(pid, 0)[2]
+        except ChildProcessError:
+            return None
+
+    @staticmethod
+    def _wait(pid: int, blocking: bool) -> bool:
+        try:
+            return os.waitpid(pid, 0 if blocking else os.WNOHANG)[0] == pid
+        except ChildProcessError:
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "subreaper": self.subreaper,
+                "sweeps": self.sweeps,
+                "leaked_processes": self.leaked_processes,
+                "orphans_reaped": self.orphans_reaped,
+                "strays_killed": self.strays_killed,
+            }
+
+
+# 全局遗留进程回收器实例
+process_reaper = ProcessReaper()
+
+metrics.gauge(
+    "sandbox_leaked_processes_total", "执行结束后仍在运行、被强制终止的进程总数",
+    lambda: {(): process_reaper.leaked_processes}, kind="counter"
+)
+metrics.gauge(
+    "sandbox_orphans_reaped_total", "回收的孤儿僵尸进程总数",
+    lambda: {(): process_reaper.orphans_reaped}, kind="counter"
+)
+metrics.gauge(
+    "sandbox_stray_processes_killed_total", "带有已结束执行的标记、在之后的清理中被终止的进程总数",
+    lambda: {(): process_reaper.strays_killed}, kind="counter"
+)
@@ -0,0 +1,112 @@
+"""
+运行时间历史
+按代码哈希+环境记录执行耗时（指数滑动平均），没有完全匹配的记录时依次退回到调用方和全局的平均耗时，
+用于调度器的短作业优先排序和 /execute/estimate 的预估。
+记录只保存在当前工作进程内存中，条目数超过 RUNTIME_HISTORY_SIZE 时淘汰最久未用的
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from config.settings import settings
+
+# 调用方标识请求头，没有完全匹配的运行记录时按调用方的平均耗时预估
+CALLER_HEADER = "X-Caller-ID"
+# 指数滑动平均的权重，越大越偏向最近的耗时
+HISTORY_ALPHA = 0.3
+# 没有任何运行记录时的预计耗时（秒）
+DEFAULT_ESTIMATE = 1.0
+
+
+class Prediction(NamedTuple):
+    """预计耗时"""
+    seconds: float
+    # exact（相同代码与环境）/ caller（同一调用方）/ global（全部执行）/ default（没有记录）
+    source: str
+    samples: int
+
+
+class _Rolling:
+    """指数滑动平均"""
+
+    __slots__ = ("mean", "samples")
+
+    def __init__(self, value: float):
+        self.mean = value
+        self.samples = 1
+
+    def add(self, value: float):
+        self.mean += HISTORY_ALPHA * (value - self.mean)
+        self.samples += 1
+
+
+class RuntimeHistory:
+    """按代码哈希、调用方和全局三级记录的运行时间"""
+
+    def __init__(self):
+        self._exact: "OrderedDict[str, _Rolling]" = OrderedDict()
+        self._callers: "OrderedDict[str, _Rolling]" = OrderedDict()
+        self._global: Optional[_Rolling] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def code_key(code: str, environment: Optional[str]) -> str:
+        digest = hashlib.blake2b(code.encode("utf-8"), digest_size=16).hexdigest()
+        return f"{environment or 'default'}:{digest}"
+
+    def record(self, code: str, environment: Optional[str], caller: Optional[str], duration: float):
+        """记录一次完成（包括超时）的执行的耗时"""
+        key = self.code_key(code, environment)
+        with self._lock:
+            self._add(self._exact, key, duration)
+            if caller:
+                self._add(self._callers, caller, duration)
+            if self._global is None:
+                self._global = _Rolling(duration)
+            else:
+                self._global.add(duration)
+
+    @staticmethod
+    def _add(table: "OrderedDict[str, _Rolling]", key: str, duration: float):
+        entry = table.get(key)
+        if entry is None:
+            table[key] = _Rolling(duration)
+            if len(table) > settings.RUNTIME_HISTORY_SIZE:
+                table.popitem(last=False)
+        else:
+            entry.add(duration)
+            table.move_to_end(key)
+
+    def predict(self, code: str, environment: Optional[str], caller: Optional[str], timeout: float) -> Prediction:
+        """
+        预计执行耗时
+
+        Args:
+            code: 要执行的代码
+            environment: 环境名称
+            caller: 调用方标识（CALLER_HEADER）
+            timeout: 执行超时，预计耗时不超过它
+
+        Returns:
+            Prediction: 预计耗时及其来源
+        """
+        key = self.code_key(code, environment)
+        with self._lock:
+            entry, source = self._exact.get(key), "exact"
+            if entry is None and caller:
+                entry, source = self._callers.get(caller), "caller"
+            if entry is None:
+                entry, source = self._global, "global"
+            if entry is None:
+                return Prediction(min(DEFAULT_ESTIMATE, timeout), "default", 0)
+            return Prediction(min(entry.mean, timeout), source, entry.samples)
+
+    def stats(self):
+        with self._lock:
+            return {"codes": len(self._exact), "callers": len(self._callers)}
+
+
+# 全局运行时间历史实例
+runtime_history = RuntimeHistory()
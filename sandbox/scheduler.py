@@ -0,0 +1,136 @@
+"""
+执行调度
+同时执行的任务数达到 EXECUTION_SLOTS 后，新的执行在事件循环中排队，执行槽空出时按预计耗时
+（runtime_history）选出下一个任务，短作业不再排在长作业后面。
+排序键为 预计耗时 - SCHEDULER_AGING × 已等待时间，等待越久越靠前，长作业不会被一直插队
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Dict, List, Tuple
+
+from config.settings import settings
+from .metrics import metrics
+
+queued_executions = metrics.counter(
+    "sandbox_queued_executions_total",
+    "因执行槽已满而排队的执行数"
+)
+queue_wait_seconds = metrics.counter(
+    "sandbox_queue_wait_seconds_total",
+    "执行在调度队列中等待的总时间（秒）"
+)
+
+
+class ExecutionScheduler:
+    """
+    短作业优先（带老化）的执行槽
+
+    - acquire(): 等待执行槽，返回的句柄交给 release()
+    - limit: 执行槽数量，0表示不限制，可在运行中调整（set_limit）
+    所有方法都在事件循环线程中调用
+    """
+
+    def __init__(self):
+        self.limit = settings.EXECUTION_SLOTS
+        self._running: Dict[int, Tuple[float, float]] = {}
+        # (排序键, 序号, 预计耗时, 等待的future)
+        self._queue: List[Tuple[float, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for entry in self._queue if not entry[3].done())
+
+    def _has_capacity(self) -> bool:
+        return self.limit <= 0 or len(self._running) < self.limit
+
+    def _sort_key(self, predicted: float, enqueued: float) -> float:
+        # 预计耗时 - 老化系数 × (now - enqueued)，所有排队任务的 now 相同，可以预先计算
+        return predicted + settings.SCHEDULER_AGING * enqueued
+
+    async def acquire(self, predicted: float) -> int:
+        """
+        等待执行槽
+
+        Args:
+            predicted: 预计耗时（秒）
+
+        Returns:
+            int: 执行槽句柄
+        """
+        ticket = next(self._sequence)
+        if self._has_capacity() and not self._queue:
+            self._running[ticket] = (time.monotonic(), predicted)
+            return ticket
+
+        enqueued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (self._sort_key(predicted, enqueued), ticket, predicted, future))
+        # 队列中可能只剩已取消的任务
+        self._dispatch()
+        if not future.done():
+            queued_executions.inc()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分到执行槽但调用方同时被取消
+                self.release(ticket)
+            raise
+        finally:
+            queue_wait_seconds.inc(time.monotonic() - enqueued)
+        return ticket
+
+    def release(self, ticket: int):
+        """归还执行槽并唤醒排在最前面的任务"""
+        self._running.pop(ticket, None)
+        self._dispatch()
+
+    def set_limit(self, limit: int):
+        """调整执行槽数量，增加时立即唤醒排队的任务"""
+        self.limit = limit
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._queue and self._has_capacity():
+            _, ticket, predicted, future = heapq.heappop(self._queue)
+            if future.done():
+                # 排队期间已被取消
+                continue
+            self._running[ticket] = (time.monotonic(), predicted)
+            future.set_result(None)
+
+    def estimate_wait(self, predicted: float) -> float:
+        """
+        预计排队时间（秒）：排在前面的任务的预计耗时之和平均到各执行槽，
+        再加上最先结束的运行中任务的剩余时间
+        """
+        if self._has_capacity() and not self._queue:
+            return 0.0
+        now = time.monotonic()
+        key = self._sort_key(predicted, now)
+        ahead = sum(entry[2] for entry in self._queue if entry[0] <= key and not entry[3].done())
+        remaining = min(
+            (max(0.0, expected - (now - started)) for started, expected in self._running.values()),
+            default=0.0
+        )
+        return remaining + ahead / max(self.limit, 1)
+
+    def stats(self) -> Dict[str, int]:
+        return {"limit": self.limit, "running": self.running, "queued": self.queued}
+
+
+# 全局执行调度实例
+execution_scheduler = ExecutionScheduler()
+
+metrics.gauge(
+    "sandbox_queue_depth", "在调度队列中等待执行槽的执行数",
+    lambda: {(): execution_scheduler.queued}
+)
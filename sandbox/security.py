@@ -1,11 +1,56 @@
 """
 安全策略模块
-定义代码执行的安全限制和验证规则
+定义代码执行的安全限制和验证规则，以及执行前的静态分析（带LRU缓存）
 """
 
 import ast
 import re
-from typing import List, Set
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+
+
+# 代码字符串中的危险模式，合并为一个预编译的正则，一次扫描完成
+DANGEROUS_STRING_PATTERNS = [
+    r'__builtins__',
+    r'__import__',
+    r'__globals__',
+    r'__locals__',
+    r'eval\s*\(',
+    r'exec\s*\(',
+    r'compile\s*\(',
+    r'open\s*\(',
+    r'file\s*\(',
+    r'input\s*\(',
+    r'raw_input\s*\(',
+    r'[\'"]eval[\'"]',  # 匹配 'eval' 或 "eval" 字符串
+    r'[\'"]exec[\'"]',  # 匹配 'exec' 或 "exec" 字符串
+    r'[\'"]__import__[\'"]',  # 匹配 '__import__' 字符串
+]
+_DANGEROUS_STRING_RE = re.compile("|".join(f"(?:{p})" for p in DANGEROUS_STRING_PATTERNS), re.IGNORECASE)
+# 每个危险模式都包含其中一个关键字，代码（小写后）不含任何关键字时无需运行正则
+_DANGEROUS_STRING_KEYWORDS = (
+    '__builtins__', '__import__', '__globals__', '__locals__',
+    'eval', 'exec', 'compile', 'open', 'file', 'input',
+)
+
+# 源码中没有 import 关键字时不可能有导入语句
+_IMPORT_KEYWORD_RE = re.compile(r'\bimport\b')
+
+# 允许导入的标准库子模块
+SAFE_STDLIB_PATTERNS = [
+    r'^collections\.',
+    r'^urllib\.parse$',
+    r'^email\.utils$',
+    r'^html\.',
+    r'^xml\.etree\.ElementTree$',
+]
+_SAFE_STDLIB_RE = re.compile("|".join(f"(?:{p})" for p in SAFE_STDLIB_PATTERNS))
 
 
 class SecurityPolicy:
@@ -51,9 +96,11 @@ class SecurityPolicy:
             # 解析AST
             tree = ast.parse(code)
             
-            # 检查AST节点
-            for node in ast.walk(tree):
-                if not cls._is_safe_node(node):
+            # 检查AST节点（只检查需要关注的节点类型，其余节点直接跳过）
+            checks = cls._node_checks()
+            for node in cls._nodes_to_check(code, tree):
+                check = checks.get(type(node))
+                if check is not None and not check(node):
                     return False, f"检测到不安全的操作: {type(node).__name__}"
             
             # 检查字符串中的危险模式
@@ -67,30 +114,58 @@ class SecurityPolicy:
         except Exception as e:
             return False, f"代码验证失败: {str(e)}"
     
+    @classmethod
+    def _nodes_to_check(cls, code: str, tree: ast.Module):
+        """
+        需要检查的AST节点
+
+        危险的调用、属性和下标都要求源码中出现对应的标识符（Python对标识符做NFKC归一化，
+        因此在归一化后的源码中查找）；不含这些标识符时只有导入语句可能不安全。
+        导入语句可能嵌套在任意复合语句中（包括通过反斜杠续行写在同一逻辑行），因此总是遍历整棵树
+        """
+        normalized = code if code.isascii() else unicodedata.normalize("NFKC", code)
+        if cls._walk_trigger_re().search(normalized):
+            return ast.walk(tree)
+        if not _IMPORT_KEYWORD_RE.search(normalized):
+            return ()
+        return (node for node in ast.walk(tree) if isinstance(node, (ast.Import, ast.ImportFrom)))
+    
+    _walk_trigger = None
+    
+    @classmethod
+    def _walk_trigger_re(cls) -> "re.Pattern[str]":
+        """匹配危险内置函数、危险属性和 __builtins__ 的标识符"""
+        if cls._walk_trigger is None:
+            names = cls.DANGEROUS_BUILTINS | cls.DANGEROUS_ATTRIBUTES | {'__builtins__'}
+            cls._walk_trigger = re.compile(r'\b(?:' + '|'.join(sorted(names, key=len, reverse=True)) + r')\b')
+        return cls._walk_trigger
+    
+    @classmethod
+    def _node_checks(cls) -> Dict[type, Callable[[ast.AST], bool]]:
+        """按节点类型分派的检查函数，一次遍历完成所有节点检查"""
+        return {
+            ast.Call: cls._is_safe_call,
+            ast.Import: cls._is_safe_import,
+            ast.ImportFrom: cls._is_safe_import,
+            ast.Attribute: cls._is_safe_attribute,
+            ast.Subscript: cls._is_safe_subscript,
+        }
+    
+    @classmethod
+    def _is_safe_call(cls, node: ast.Call) -> bool:
+        """检查函数调用"""
+        return not (isinstance(node.func, ast.Name) and node.func.id in cls.DANGEROUS_BUILTINS)
+    
+    @classmethod
+    def _is_safe_subscript(cls, node: ast.Subscript) -> bool:
+        """检查下标访问（可能访问__builtins__等）"""
+        return not (isinstance(node.value, ast.Name) and node.value.id == '__builtins__')
+    
     @classmethod
     def _is_safe_node(cls, node: ast.AST) -> bool:
         """检查AST节点是否安全"""
-        
-        # 检查函数调用
-        if isinstance(node, ast.Call):
-            if isinstance(node.func, ast.Name):
-                if node.func.id in cls.DANGEROUS_BUILTINS:
-                    return False
-        
-        # 检查导入语句
-        if isinstance(node, (ast.Import, ast.ImportFrom)):
-            return cls._is_safe_import(node)
-        
-        # 检查属性访问
-        if isinstance(node, ast.Attribute):
-            return cls._is_safe_attribute(node)
-        
-        # 检查下标访问（可能访问__builtins__等）
-        if isinstance(node, ast.Subscript):
-            if isinstance(node.value, ast.Name) and node.value.id == '__builtins__':
-                return False
-        
-        return True
+        check = cls._node_checks().get(type(node))
+        return check is None or check(node)
     
     @classmethod
     def _is_safe_import(cls, node: ast.Import | ast.ImportFrom) -> bool:
@@ -117,59 +192,102 @@ class SecurityPolicy:
     @classmethod
     def _is_safe_stdlib_module(cls, module_name: str) -> bool:
         """检查是否为安全的标准库模块"""
-        safe_stdlib_patterns = [
-            r'^collections\.',
-            r'^urllib\.parse$',
-            r'^email\.utils$',
-            r'^html\.',
-            r'^xml\.etree\.ElementTree$',
-        ]
-        
-        for pattern in safe_stdlib_patterns:
-            if re.match(pattern, module_name):
-                return True
-        
-        return False
+        return _SAFE_STDLIB_RE.match(module_name) is not None
+    
+    # 危险的属性
+    DANGEROUS_ATTRIBUTES = {
+        '__builtins__', '__globals__', '__locals__',
+        '__dict__', '__class__', '__bases__', '__subclasses__',
+        '__import__', '__file__', '__name__'
+    }
     
     @classmethod
     def _is_safe_attribute(cls, node: ast.Attribute) -> bool:
         """检查属性访问是否安全"""
-        dangerous_attrs = {
-            '__builtins__', '__globals__', '__locals__',
-            '__dict__', '__class__', '__bases__', '__subclasses__',
-            '__import__', '__file__', '__name__'
-        }
-        
-        if node.attr in dangerous_attrs:
-            return False
-        
-        return True
+        return node.attr not in cls.DANGEROUS_ATTRIBUTES
     
     @classmethod
     def _check_string_patterns(cls, code: str) -> bool:
         """检查代码字符串中的危险模式"""
-        dangerous_patterns = [
-            r'__builtins__',
-            r'__import__',
-            r'__globals__',
-            r'__locals__',
-            r'eval\s*\(',
-            r'exec\s*\(',
-            r'compile\s*\(',
-            r'open\s*\(',
-            r'file\s*\(',
-            r'input\s*\(',
-            r'raw_input\s*\(',
-            r'[\'"]eval[\'"]',  # 匹配 'eval' 或 "eval" 字符串
-            r'[\'"]exec[\'"]',  # 匹配 'exec' 或 "exec" 字符串
-            r'[\'"]__import__[\'"]',  # 匹配 '__import__' 字符串
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                return False
-        
-        return True
+        # 非ASCII字符在忽略大小写匹配时可能与ASCII字母等价（如 ſ 与 s），此时直接使用正则
+        if code.isascii():
+            lowered = code.lower()
+            if not any(keyword in lowered for keyword in _DANGEROUS_STRING_KEYWORDS):
+                return True
+        return _DANGEROUS_STRING_RE.search(code) is None
+
+
+class StaticAnalyzer:
+    """
+    执行前静态分析
+
+    以代码的SHA-256为键缓存 SecurityPolicy.validate_code 的结果（LRU），
+    智能体反复提交的相同代码只分析一次；未命中缓存的大段代码在线程池中分析，不阻塞事件循环
+    """
+
+    # 超过该长度且未命中缓存的代码在线程池中分析
+    OFFLOAD_THRESHOLD = 8 * 1024
+
+    def __init__(self, cache_size: Optional[int] = None):
+        self.cache_size = cache_size if cache_size is not None else settings.STATIC_ANALYSIS_CACHE_SIZE
+        self._cache: "OrderedDict[bytes, Tuple[bool, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(code: str) -> bytes:
+        return hashlib.sha256(code.encode("utf-8", "surrogatepass")).digest()
+
+    def _lookup(self, key: bytes) -> Optional[Tuple[bool, str]]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return result
+
+    def _store(self, key: bytes, result: Tuple[bool, str]):
+        with self._lock:
+            self.misses += 1
+            if self.cache_size <= 0:
+                return
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def analyze(self, code: str) -> Tuple[bool, str]:
+        """
+        分析代码
+
+        Returns:
+            Tuple[bool, str]: (是否通过, 错误信息)
+        """
+        key = self._key(code)
+        result = self._lookup(key)
+        if result is None:
+            result = SecurityPolicy.validate_code(code)
+            self._store(key, result)
+        return result
+
+    async def analyze_async(self, code: str) -> Tuple[bool, str]:
+        """异步分析，未命中缓存的大段代码放到线程池中"""
+        if len(code) < self.OFFLOAD_THRESHOLD:
+            return self.analyze(code)
+        result = self._lookup(self._key(code))
+        if result is not None:
+            return result
+        return await asyncio.to_thread(self.analyze, code)
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
 
 
 def create_safe_globals() -> dict:
@@ -206,3 +324,7 @@ def create_safe_globals() -> dict:
         '__name__': '__main__',
         '__doc__': None,
     }
+
+
+# 全局静态分析实例
+static_analyzer = StaticAnalyzer()
@@ -0,0 +1,207 @@
+"""
+多进程共享状态模块
+多个API工作进程（uvicorn --workers / gunicorn）运行在同一台主机上时，
+通过文件锁协调对共享JSON文件的读写，保证环境注册表、任务状态等数据在各进程间一致
+"""
+
+import os
+import json
+import socket
+import threading
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from config.settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，退化为进程内锁，仅支持单工作进程
+    fcntl = None
+
+
+class FileLock:
+    """
+    基于 flock 的跨进程排他锁
+
+    锁随文件描述符关闭或进程退出自动释放，因此持有者崩溃不会留下死锁；
+    同一进程内的不同线程各自打开文件，彼此之间同样互斥
+    """
+
+    _local_locks: Dict[str, threading.Lock] = {}
+    _local_guard = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._local: Optional[threading.Lock] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """获取锁，blocking为False且锁已被占用时返回False"""
+        if fcntl is None:
+            with FileLock._local_guard:
+                self._local = FileLock._local_locks.setdefault(self.path, threading.Lock())
+            return self._local.acquire(blocking)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        elif self._local is not None:
+            self._local.release()
+            self._local = None
+
+    @property
+    def locked(self) -> bool:
+        """当前对象是否持有锁"""
+        return self._fd is not None or self._local is not None
+
+    def is_current(self) -> bool:
+        """持有的锁文件是否仍是 path 上的文件（删除锁文件的一方在删除前后都可能有人打开了旧文件）"""
+        if self._fd is None:
+            return self.locked
+        try:
+            return os.path.samestat(os.fstat(self._fd), os.stat(self.path))
+        except FileNotFoundError:
+            return False
+
+    def is_held_elsewhere(self) -> bool:
+        """锁是否被其他持有者占用（用于判断构建进程是否仍存活）"""
+        if self.locked:
+            return False
+        if not self.acquire(blocking=False):
+            return True
+        self.release()
+        return False
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SharedJSONStore:
+    """
+    共享JSON字典存储
+
+    读取时按文件mtime/size判断是否需要重新加载，其他进程的写入会在下次读取时可见；
+    修改通过 update() 在文件锁内完成“读取最新内容 → 修改 → 原子替换”
+    """
+
+    def __init__(self, path: str, lock_path: Optional[str] = None):
+        self.path = path
+        self.lock_path = lock_path or path + ".lock"
+        self._cache: Dict[str, Any] = {}
+        self._signature = None
+        self._mutex = threading.RLock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _reload_if_changed(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        data = {}
+        if signature is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"加载共享状态失败 {self.path}: {e}")
+                data = self._cache
+        self._cache = data
+        self._signature = signature
+
+    def read(self) -> Dict[str, Any]:
+        """返回当前数据（只读视图，修改请使用 update()）"""
+        with self._mutex:
+            self._reload_if_changed()
+            return self._cache
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.read().get(key, default)
+
+    @contextmanager
+    def update(self) -> Iterator[Dict[str, Any]]:
+        """
+        在文件锁内修改数据
+
+        with store.update() as data:
+            data["key"] = value
+        """
+        with self._mutex, FileLock(self.lock_path):
+            self._reload_if_changed()
+            data = json.loads(json.dumps(self._cache))
+            yield data
+            self._write(data)
+
+    def _write(self, data: Dict[str, Any]):
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            # mkstemp创建的文件权限为0600，与直接写入时保持一致
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._cache = data
+        self._signature = self._file_signature()
+
+
+class SharedState:
+    """共享状态目录，按名称提供JSON存储和命名锁"""
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or settings.SHARED_STATE_DIR or os.path.join(settings.TEMP_DIR, "state")
+        self._stores: Dict[str, SharedJSONStore] = {}
+        self._guard = threading.Lock()
+
+    def store(self, name: str) -> SharedJSONStore:
+        """获取名为 name 的共享JSON存储"""
+        with self._guard:
+            if name not in self._stores:
+                self._stores[name] = SharedJSONStore(os.path.join(self.base_dir, f"{name}.json"))
+            return self._stores[name]
+
+    def lock(self, name: str) -> FileLock:
+        """获取名为 name 的跨进程锁（未加锁）"""
+        return FileLock(os.path.join(self.base_dir, "locks", f"{name}.lock"))
+
+
+def worker_identity() -> Dict[str, Any]:
+    """当前工作进程标识，写入任务记录便于排查"""
+    return {"pid": os.getpid(), "hostname": socket.gethostname()}
+
+
+# 全局共享状态实例
+shared_state = SharedState()
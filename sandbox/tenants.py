@@ -0,0 +1,312 @@
+"""
+多租户配额
+多个团队共用一个部署时，按API密钥识别租户并分别限制：
+- 请求速率：令牌桶，每秒补充 requests_per_second 个令牌，最多积累 burst 个
+- 并发：同时进行的执行数不超过 max_concurrent
+- CPU预算：每 window_seconds 秒内用户代码实际消耗的CPU时间（子进程 rusage）不超过 cpu_seconds
+租户配置从 TENANTS_FILE 读取，文件修改后自动重新加载；未配置时不做任何限制。
+用量保存在共享状态中，同一主机上的所有工作进程共同计数（读写共享状态需要文件锁，在线程池中进行）；
+超出限制的请求在启动子进程之前被拒绝（429），并带有 Retry-After 与 RateLimit-* 响应头
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+import itertools
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from pydantic import ValidationError
+
+from config.settings import settings
+from models.tenant import TenantConfig, TenantUsage
+from .metrics import metrics
+from .shared_state import shared_state
+
+API_KEY_HEADER = "X-API-Key"
+
+# 当前执行的CPU计量回调，执行器在子进程退出后（包括被取消时）调用
+cpu_meter: ContextVar[Optional[Callable[[float], Awaitable[None]]]] = ContextVar("tenant_cpu_meter", default=None)
+
+tenant_requests = metrics.counter(
+    "sandbox_tenant_requests_total",
+    "各租户被接受的执行请求数"
+)
+tenant_rejections = metrics.counter(
+    "sandbox_tenant_rejections_total",
+    "各租户因超出限制被拒绝（429）的请求数"
+)
+tenant_cpu_seconds = metrics.counter(
+    "sandbox_tenant_cpu_seconds_total",
+    "各租户的用户代码实际消耗的CPU时间（秒）"
+)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+async def charge_cpu(cpu_time: Optional[float]):
+    """把子进程实际消耗的CPU时间计入当前执行所属的租户"""
+    meter = cpu_meter.get()
+    if meter is not None and cpu_time:
+        await meter(cpu_time)
+
+
+def forwarded_cpu_time(response: Response) -> Optional[float]:
+    """协调节点从工作节点返回的执行结果中取出 cpu_time"""
+    try:
+        return json.loads(response.body).get("cpu_time")
+    except (AttributeError, ValueError):
+        return None
+
+
+class TenantLease:
+    """
+    一次执行占用的并发名额，方法都是协程，共享状态的读写在线程池中进行
+
+    - charge(): 记入执行实际消耗的CPU时间
+    - release(): 执行结束后归还名额，可以重复调用
+    - headers: 准入时的 RateLimit-* 响应头
+    """
+
+    def __init__(self, manager: "TenantManager", tenant: str, lease_id: str, headers: Dict[str, str]):
+        self.manager = manager
+        self.tenant = tenant
+        self.lease_id = lease_id
+        self.headers = headers
+        self._released = False
+
+    async def charge(self, cpu_time: Optional[float]):
+        if cpu_time:
+            await asyncio.to_thread(self.manager.charge, self.tenant, cpu_time)
+
+    async def release(self):
+        if not self._released:
+            self._released = True
+            # 调用方被取消时线程中的归还照常完成
+            await asyncio.to_thread(self.manager.release, self.tenant, self.lease_id)
+
+
+class TenantManager:
+    """
+    租户识别与配额检查
+
+    - authenticate(): 从 X-API-Key 或 Authorization: Bearer 识别租户
+    - admit(): 执行前调用，依次检查CPU预算、并发和请求速率，通过后返回 TenantLease
+    - usage(): 租户当前的配额与用量
+    admit()/usage() 会阻塞在共享状态的文件锁上，由接口通过 asyncio.to_thread 调用
+    """
+
+    def __init__(self):
+        self._tenants: Dict[str, TenantConfig] = {}
+        self._keys: Dict[str, str] = {}
+        self._signature = None
+        self._sequence = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.TENANTS_FILE)
+
+    @property
+    def _store(self):
+        return shared_state.store("tenants")
+
+    def _load(self) -> Dict[str, TenantConfig]:
+        """按文件mtime重新加载租户配置，加载失败时保留上一次的配置"""
+        try:
+            stat = os.stat(settings.TENANTS_FILE)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            if self._signature is not False:
+                print(f"⚠️ 无法读取租户配置 {settings.TENANTS_FILE}: {e}")
+                self._signature = False
+            return self._tenants
+        if signature == self._signature:
+            return self._tenants
+        self._signature = signature
+        try:
+            with open(settings.TENANTS_FILE, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            tenants = {name: TenantConfig.model_validate(config) for name, config in raw.items()}
+        except (OSError, ValueError, AttributeError, ValidationError) as e:
+            print(f"❌ 租户配置无效，继续使用上一次的配置: {e}")
+            return self._tenants
+        keys = {}
+        for name, config in tenants.items():
+            digest = config.api_key_sha256 or hashlib.sha256(config.api_key.encode("utf-8")).hexdigest()
+            keys[digest.lower()] = name
+        self._tenants, self._keys = tenants, keys
+        print(f"✅ 已加载 {len(tenants)} 个租户配置")
+        return self._tenants
+
+    def authenticate(self, request: Request) -> Optional[Tuple[str, TenantConfig]]:
+        """
+        识别请求所属的租户
+
+        Returns:
+            (租户名称, 配置)，未启用租户时返回None
+
+        Raises:
+            HTTPException: 缺少或无效的API密钥（401）
+        """
+        if not self.enabled:
+            return None
+        tenants = self._load()
+        api_key = request.headers.get(API_KEY_HEADER)
+        if not api_key:
+            scheme, _, token = request.headers.get("authorization", "").partition(" ")
+            if scheme.lower() == "bearer":
+                api_key = token.strip()
+        if not api_key:
+            raise HTTPException(
+                status_code=401,
+                detail=f"缺少API密钥，请通过 {API_KEY_HEADER} 或 Authorization: Bearer 请求头提供",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        name = self._keys.get(hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+        if name is None or name not in tenants:
+            raise HTTPException(status_code=401, detail="API密钥无效", headers={"WWW-Authenticate": "Bearer"})
+        return name, tenants[name]
+
+    @staticmethod
+    def _burst(config: TenantConfig) -> int:
+        return config.burst or max(1, math.ceil(config.requests_per_second))
+
+    def _refresh(self, state: Dict, config: TenantConfig, now: float) -> Dict:
+        """补充令牌、开始新的CPU时间窗口并清理已退出工作进程留下的并发名额"""
+        burst = self._burst(config)
+        tokens = state.get("tokens", burst)
+        if config.requests_per_second > 0:
+            elapsed = max(0.0, now - state.get("refilled_at", now))
+            tokens = min(burst, tokens + elapsed * config.requests_per_second)
+        state["tokens"] = tokens
+        state["refilled_at"] = now
+        if now - state.get("window_start", 0) >= config.window_seconds:
+            state.update(window_start=now, cpu_seconds=0.0, requests=0, rejected=0)
+        leases = state.setdefault("leases", {})
+        for lease_id, lease in list(leases.items()):
+            if not _pid_alive(lease["pid"]):
+                del leases[lease_id]
+        return state
+
+    def _rate_headers(self, state: Dict, config: TenantConfig) -> Dict[str, str]:
+        """令牌桶的 RateLimit-* 响应头，Reset 为令牌补满所需的秒数"""
+        if config.requests_per_second <= 0:
+            return {}
+        burst = self._burst(config)
+        tokens = state["tokens"]
+        return {
+            "RateLimit-Limit": str(burst),
+            "RateLimit-Remaining": str(int(tokens)),
+            "RateLimit-Reset": str(math.ceil((burst - tokens) / config.requests_per_second)),
+        }
+
+    def _reject(self, state: Dict, tenant: str, reason: str, detail: str, retry_after: float, limit: float):
+        state["rejected"] = state.get("rejected", 0) + 1
+        tenant_rejections.inc(tenant=tenant, reason=reason)
+        retry_after = max(1, math.ceil(retry_after))
+        return HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={
+                "Retry-After": str(retry_after),
+                "RateLimit-Limit": f"{limit:g}",
+                "RateLimit-Remaining": "0",
+                "RateLimit-Reset": str(retry_after),
+            }
+        )
+
+    def admit(self, request: Request) -> Optional[TenantLease]:
+        """
+        执行前的配额检查，通过时扣除一个令牌并占用一个并发名额
+
+        Returns:
+            TenantLease，未启用租户时返回None
+
+        Raises:
+            HTTPException: 密钥无效（401）或超出限制（429）
+        """
+        identity = self.authenticate(request)
+        if identity is None:
+            return None
+        tenant, config = identity
+        now = time.time()
+        rejection = None
+        with self._store.update() as data:
+            state = self._refresh(data.setdefault(tenant, {}), config, now)
+            window_reset = state["window_start"] + config.window_seconds - now
+            if config.cpu_seconds > 0 and state["cpu_seconds"] >= config.cpu_seconds:
+                rejection = self._reject(
+                    state, tenant, "cpu",
+                    f"租户 {tenant} 本时间窗口的CPU时间预算（{config.cpu_seconds:g}秒）已用完",
+                    window_reset, config.cpu_seconds
+                )
+            elif config.max_concurrent > 0 and len(state["leases"]) >= config.max_concurrent:
+                rejection = self._reject(
+                    state, tenant, "concurrency",
+                    f"租户 {tenant} 同时进行的执行数已达上限（{config.max_concurrent}）",
+                    1, config.max_concurrent
+                )
+            elif config.requests_per_second > 0 and state["tokens"] < 1:
+                rejection = self._reject(
+                    state, tenant, "rate",
+                    f"租户 {tenant} 请求过于频繁（每秒 {config.requests_per_second:g} 个）",
+                    (1 - state["tokens"]) / config.requests_per_second, self._burst(config)
+                )
+            else:
+                if config.requests_per_second > 0:
+                    state["tokens"] -= 1
+                state["requests"] = state.get("requests", 0) + 1
+                lease_id = f"{os.getpid()}-{next(self._sequence)}"
+                state["leases"][lease_id] = {"pid": os.getpid(), "started": now}
+                headers = self._rate_headers(state, config)
+        if rejection is not None:
+            raise rejection
+        tenant_requests.inc(tenant=tenant)
+        return TenantLease(self, tenant, lease_id, headers)
+
+    def release(self, tenant: str, lease_id: str):
+        with self._store.update() as data:
+            data.get(tenant, {}).get("leases", {}).pop(lease_id, None)
+
+    def charge(self, tenant: str, cpu_time: float):
+        """把一次执行消耗的CPU时间计入租户当前的时间窗口"""
+        tenant_cpu_seconds.inc(cpu_time, tenant=tenant)
+        with self._store.update() as data:
+            state = data.setdefault(tenant, {})
+            state["cpu_seconds"] = state.get("cpu_seconds", 0.0) + cpu_time
+
+    def usage(self, tenant: str, config: TenantConfig) -> TenantUsage:
+        now = time.time()
+        with self._store.update() as data:
+            state = self._refresh(data.setdefault(tenant, {}), config, now)
+        return TenantUsage(
+            tenant=tenant,
+            requests_per_second=config.requests_per_second,
+            burst=self._burst(config),
+            tokens=state["tokens"] if config.requests_per_second > 0 else None,
+            max_concurrent=config.max_concurrent,
+            active=len(state["leases"]),
+            cpu_seconds_limit=config.cpu_seconds,
+            cpu_seconds_used=state["cpu_seconds"],
+            window_seconds=config.window_seconds,
+            window_reset_seconds=max(0.0, state["window_start"] + config.window_seconds - now),
+            requests=state.get("requests", 0),
+            rejected=state.get("rejected", 0),
+        )
+
+
+# 全局租户配额实例
+tenant_manager = TenantManager()
@@ -0,0 +1,313 @@
+"""
+链路追踪模块
+提供与OpenTelemetry数据模型兼容的轻量级span，贯穿 API请求 → 执行器 → 沙盒子进程，
+可导出到JSONL文件或OTLP/HTTP(JSON)收集器，便于离线分析长尾延迟
+"""
+
+import os
+import json
+import time
+import queue
+import secrets
+import threading
+import contextvars
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+
+
+# 传递给沙盒子进程的环境变量
+REQUEST_ID_ENV = "SANDBOX_REQUEST_ID"
+TRACEPARENT_ENV = "TRACEPARENT"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_current_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_request_id", default=None)
+
+
+def generate_request_id() -> str:
+    """生成请求ID"""
+    return secrets.token_hex(8)
+
+
+class Span:
+    """单个追踪区间"""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.status = "UNSET"
+        self.status_message: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent 头"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_time_ns,
+            "end_time_unix_nano": self.end_time_ns,
+            "duration_ms": ((self.end_time_ns or self.start_time_ns) - self.start_time_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message,
+            "service_name": settings.TRACE_SERVICE_NAME,
+        }
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """解析W3C traceparent，返回 (trace_id, parent_span_id)"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+class BatchSpanExporter(ABC):
+    """在后台线程中批量导出span，请求路径只做一次入队，导出端不可用时丢弃；子类实现 _write()"""
+
+    def __init__(self, name: str, batch_size: int = 256, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _worker(self):
+        batch: List[Span] = []
+        running = True
+        while running:
+            try:
+                span = self._queue.get(timeout=self.flush_interval)
+                if span is None:
+                    running = False
+                else:
+                    batch.append(span)
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or not running or self._queue.empty()):
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"导出追踪数据失败: {e}")
+                batch = []
+        self._close()
+
+    @abstractmethod
+    def _write(self, batch: List[Span]):
+        """写出一批span，在后台线程中调用"""
+
+    def _close(self):
+        pass
+
+
+class JsonlSpanExporter(BatchSpanExporter):
+    """将span逐行写入JSONL文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__("jsonl-exporter")
+
+    def _write(self, batch: List[Span]):
+        lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class OTLPHttpSpanExporter(BatchSpanExporter):
+    """以OTLP/HTTP JSON格式批量发送span到本地收集器"""
+
+    def __init__(self, endpoint: str, batch_size: int = 256, flush_interval: float = 1.0):
+        import httpx
+
+        self.endpoint = endpoint
+        self._client = httpx.Client(timeout=5.0)
+        super().__init__("otlp-exporter", batch_size, flush_interval)
+
+    def _write(self, batch: List[Span]):
+        self._client.post(self.endpoint, json=self._encode(batch))
+
+    def _close(self):
+        self._client.close()
+
+    @staticmethod
+    def _encode(spans: List[Span]) -> Dict[str, Any]:
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        status_codes = {"UNSET": 0, "OK": 1, "ERROR": 2}
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [attribute("service.name", settings.TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "simplepysandbox"},
+                    "spans": [{
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_span_id or "",
+                        "name": span.name,
+                        "kind": 2 if span.parent_span_id is None else 1,
+                        "startTimeUnixNano": str(span.start_time_ns),
+                        "endTimeUnixNano": str(span.end_time_ns or span.start_time_ns),
+                        "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+                        "status": {
+                            "code": status_codes.get(span.status, 0),
+                            "message": span.status_message or "",
+                        },
+                    } for span in spans],
+                }],
+            }]
+        }
+
+
+class Tracer:
+    """追踪器，负责创建span并交给导出器"""
+
+    def __init__(self):
+        self._exporter = None
+        self._configured = False
+
+    @property
+    def exporter(self):
+        if not self._configured:
+            self._configured = True
+            if settings.TRACE_EXPORTER == "jsonl":
+                self._exporter = JsonlSpanExporter(settings.TRACE_JSONL_PATH)
+            elif settings.TRACE_EXPORTER == "otlp":
+                self._exporter = OTLPHttpSpanExporter(settings.TRACE_OTLP_ENDPOINT)
+        return self._exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        traceparent: Optional[str] = None
+    ):
+        """
+        创建span并设为当前span
+
+        Args:
+            name: span名称
+            attributes: 初始属性
+            traceparent: 上游传入的W3C traceparent，仅在没有当前span时生效
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_span_id = parent.trace_id, parent.span_id
+        else:
+            remote = parse_traceparent(traceparent)
+            trace_id, parent_span_id = remote if remote else (secrets.token_hex(16), None)
+
+        span = Span(name, trace_id, parent_span_id, attributes)
+        request_id = _current_request_id.get()
+        if request_id:
+            span.set_attribute("request.id", request_id)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_ns = time.time_ns()
+            if self.exporter is not None:
+                try:
+                    self.exporter.export(span)
+                except Exception as e:
+                    print(f"导出追踪数据失败: {e}")
+
+    def shutdown(self):
+        if self._exporter is not None:
+            self._exporter.shutdown()
+
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    """设置当前请求ID"""
+    return _current_request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token):
+    _current_request_id.reset(token)
+
+
+def get_request_id() -> Optional[str]:
+    return _current_request_id.get()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def propagation_env() -> Dict[str, str]:
+    """
+    需要注入沙盒子进程的追踪环境变量
+
+    在事件循环线程中调用，线程池中的同步代码无法读取contextvars
+    """
+    env = {}
+    request_id = _current_request_id.get()
+    if request_id:
+        env[REQUEST_ID_ENV] = request_id
+    span = _current_span.get()
+    if span is not None:
+        env[TRACEPARENT_ENV] = span.traceparent
+    return env
+
+
+# 全局追踪器实例
+tracer = Tracer()
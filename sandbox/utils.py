@@ -74,13 +74,13 @@ def validate_filename(filename: str) -> bool:
     return True
 
 
-def sanitize_output(text: str, max_length: int = 100000) -> str:
+def sanitize_output(text: str, max_length: Optional[int] = 100000) -> str:
     """
     清理输出文本
     
     Args:
         text: 要清理的文本
-        max_length: 最大长度
+        max_length: 最大长度，为None时不截断（由调用方自行限制）
         
     Returns:
         str: 清理后的文本
@@ -89,7 +89,7 @@ def sanitize_output(text: str, max_length: int = 100000) -> str:
         return ""
     
     # 限制长度
-    if len(text) > max_length:
+    if max_length is not None and len(text) > max_length:
         text = text[:max_length] + "\n... (输出被截断)"
     
     # 移除或替换危险字符
@@ -0,0 +1,325 @@
+"""
+预热解释器池
+为常用环境预先启动若干Python解释器并导入常用模块，请求到来时直接把工作目录交给
+空闲解释器执行 main.py，省去解释器启动和大型依赖（如 pythonocc、pandas）的导入时间。
+每个解释器只执行一次任务，执行结束即退出，隔离性与冷启动一致。
+启用命名空间隔离时，解释器在独立的命名空间中预先启动，收到任务后再完成挂载和降权
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config.settings import settings
+from .isolation import ISOLATION_SOURCE, isolation
+from .reaper import process_reaper
+from .affinity import cpu_allocator
+
+
+# 预热解释器的引导脚本：静默导入预加载模块，然后阻塞等待一行JSON任务
+# 任务格式: {"cwd": 工作目录, "env": 环境变量, "isolation": 隔离参数(可选), "argv": 解释器参数(可选)}
+BOOTSTRAP_SOURCE = r'''
+import os, sys, json
+''' + ISOLATION_SOURCE + r'''
+
+def _preload(modules):
+    # 预加载期间屏蔽输出，避免导入时的警告混入后续任务的输出
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    saved = (os.dup(1), os.dup(2))
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    try:
+        for name in modules:
+            try:
+                __import__(name)
+            except BaseException:
+                pass
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (devnull,) + saved:
+            os.close(fd)
+
+_preload([m for m in os.environ.pop("SANDBOX_WARM_PRELOAD", "").split(",") if m])
+
+_line = sys.stdin.readline()
+if not _line:
+    sys.exit(0)
+_job = json.loads(_line)
+sys.stdin = open(os.devnull, "r")
+
+if _job.get("isolation"):
+    try:
+        _isolate(_job["isolation"])
+    except OSError as _e:
+        print("沙盒隔离失败: %s" % _e, file=sys.stderr)
+        sys.exit(1)
+os.chdir(_job["cwd"])
+os.environ.update(_job["env"])
+if _job.get("argv"):
+    # 需要解释器参数的任务（如性能分析的 -X importtime）在隔离完成后重新执行解释器
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable] + _job["argv"])
+sys.argv = ["main.py"]
+sys.path[0] = _job["cwd"]
+del _line, _preload
+
+import runpy, traceback
+_main = os.path.join(_job["cwd"], "main.py")
+try:
+    runpy.run_path(_main, run_name="__main__")
+except SystemExit:
+    raise
+except BaseException as _e:
+    # 与直接运行 python main.py 一致，只打印用户代码部分的调用栈
+    _tb = _e.__traceback__
+    while _tb is not None and _tb.tb_frame.f_code.co_filename != _main:
+        _tb = _tb.tb_next
+    traceback.print_exception(type(_e), _e, _tb or _e.__traceback__)
+    sys.exit(1)
+'''
+
+# 计算命中率与近期执行次数的窗口
+HIT_HISTORY_SIZE = 50
+RECENT_WINDOW = 600
+
+
+class _EnvPool:
+    """单个环境的预热状态"""
+
+    def __init__(self, python_executable: str):
+        self.python_executable = python_executable
+        self.idle: Deque[subprocess.Popen] = deque()
+        self.target = 0
+        self.refilling = False
+        self.last_used = time.time()
+        self.outcomes: Deque[bool] = deque(maxlen=HIT_HISTORY_SIZE)
+        self.executions: Deque[float] = deque()
+
+
+class WarmInterpreterPool:
+    """
+    预热解释器池
+
+    - acquire(): 取出一个空闲解释器，没有时返回None由调用方冷启动；同时记录命中情况，
+      并按 WARM_POOL_SIZE 在后台补充，被使用过的环境会自动保持预热
+    - ensure(): 主动预热某个环境（启动预热、集群调度时使用）
+    - 预热的环境数不超过 WARM_POOL_MAX_ENVS，超过 WARM_POOL_IDLE_TTL 未使用的环境会被回收
+    """
+
+    def __init__(self):
+        self._pools: Dict[str, _EnvPool] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.WARM_POOL_SIZE > 0 and sys.platform != "win32"
+
+    def _pool(self, key: str, python_executable: str) -> _EnvPool:
+        pool = self._pools.get(key)
+        if pool is None or pool.python_executable != python_executable:
+            if pool is not None:
+                self._drain(pool)
+            pool = self._pools[key] = _EnvPool(python_executable)
+        return pool
+
+    def acquire(self, key: str, python_executable: str) -> Optional[subprocess.Popen]:
+        """
+        获取一个空闲的预热解释器
+
+        Args:
+            key: 环境标识（环境名，默认环境为 "default"）
+            python_executable: 该环境的Python解释器路径
+
+        Returns:
+            Optional[subprocess.Popen]: 预热解释器，没有可用的时返回None
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            pool = self._pool(key, python_executable)
+            pool.last_used = now
+            pool.executions.append(now)
+            self._trim_executions(pool, now)
+
+            process = None
+            while pool.idle:
+                candidate = pool.idle.popleft()
+                if candidate.poll() is None:
+                    process = candidate
+                    break
+                self.discard(candidate)
+            pool.outcomes.append(process is not None)
+
+            pool.target = settings.WARM_POOL_SIZE
+            self._evict_locked(now)
+            self._schedule_refill_locked(key, pool)
+        return process
+
+    def ensure(self, key: str, python_executable: str, size: Optional[int] = None):
+        """预热指定环境，在后台启动解释器直到达到目标数量"""
+        if not self.enabled:
+            return
+        with self._lock:
+            pool = self._pool(key, python_executable)
+            pool.target = max(pool.target, size or settings.WARM_POOL_SIZE)
+            pool.last_used = time.time()
+            self._evict_locked(pool.last_used)
+            self._schedule_refill_locked(key, pool)
+
+    @staticmethod
+    def start_job(
+        process: subprocess.Popen,
+        work_dir: str,
+        env: Dict[str, str],
+        argv: Optional[List[str]] = None,
+        python_executable: Optional[str] = None
+    ):
+        """
+        把任务交给引导解释器
+
+        Args:
+            process: 预热解释器或刚启动的引导解释器
+            work_dir: 工作目录
+            env: 需要覆盖的环境变量
+            argv: 替代 ["main.py"] 的解释器参数
+            python_executable: 启用隔离时用于确定需要只读挂载的环境前缀
+        """
+        job = {"cwd": work_dir, "env": env}
+        if argv:
+            job["argv"] = argv
+        if isolation.enabled:
+            job["isolation"] = isolation.spec(work_dir, python_executable or sys.executable)
+        process.stdin.write(json.dumps(job).encode("utf-8") + b"\n")
+        process.stdin.close()
+
+    def remove(self, key: str):
+        """停止预热某个环境并终止其空闲解释器（环境熔断时使用）"""
+        with self._lock:
+            pool = self._pools.pop(key, None)
+            if pool is not None:
+                pool.target = 0
+                self._drain(pool)
+
+    @staticmethod
+    def _trim_executions(pool: _EnvPool, now: float):
+        """只保留最近 RECENT_WINDOW 秒内的执行时间"""
+        while pool.executions and now - pool.executions[0] > RECENT_WINDOW:
+            pool.executions.popleft()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各环境的空闲预热解释器数、近期命中率和近期执行次数"""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for key, pool in self._pools.items():
+                self._trim_executions(pool, now)
+                result[key] = {
+                    "warm": sum(1 for p in pool.idle if p.poll() is None),
+                    "hit_rate": sum(pool.outcomes) / len(pool.outcomes) if pool.outcomes else 0.0,
+                    "recent": len(pool.executions),
+                }
+        return result
+
+    def shutdown(self):
+        """终止所有空闲解释器"""
+        with self._lock:
+            for pool in self._pools.values():
+                pool.target = 0
+                self._drain(pool)
+
+    @staticmethod
+    def spawn(python_executable: str, preload: bool = True) -> subprocess.Popen:
+        """启动一个等待任务的引导解释器（启用隔离时位于独立的命名空间中），带有执行标记"""
+        env = os.environ.copy()
+        env["PYTHONUNBUFFERED"] = "1"
+        env["SANDBOX_WARM_PRELOAD"] = settings.WARM_POOL_PRELOAD if preload else ""
+        cwd = settings.TEMP_DIR
+        os.makedirs(cwd, exist_ok=True)
+        prefix = isolation.command_prefix() if isolation.enabled else []
+        process = process_reaper.popen(
+            prefix + [python_executable, "-c", BOOTSTRAP_SOURCE],
+            env,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        # 预加载模块期间同样不占用保留给API的核
+        cpu_allocator.pin(process.pid, None)
+        return process
+
+    def _schedule_refill_locked(self, key: str, pool: _EnvPool):
+        if pool.refilling or len(pool.idle) >= pool.target:
+            return
+        pool.refilling = True
+        threading.Thread(target=self._refill, args=(key, pool), name=f"warm-pool-{key}", daemon=True).start()
+
+    def _refill(self, key: str, pool: _EnvPool):
+        try:
+            while True:
+                with self._lock:
+                    if self._pools.get(key) is not pool or len(pool.idle) >= pool.target:
+                        return
+                try:
+                    process = self.spawn(pool.python_executable)
+                except (OSError, RuntimeError) as e:
+                    print(f"启动预热解释器失败 ({key}): {e}")
+                    return
+                with self._lock:
+                    if self._pools.get(key) is pool and len(pool.idle) < pool.target:
+                        pool.idle.append(process)
+                        continue
+                self.discard(process)
+                return
+        finally:
+            pool.refilling = False
+
+    def _evict_locked(self, now: float):
+        """回收长时间未使用的环境，并把预热环境数限制在 WARM_POOL_MAX_ENVS 以内"""
+        warmed = [(key, pool) for key, pool in self._pools.items() if pool.target > 0]
+        for key, pool in warmed:
+            if now - pool.last_used > settings.WARM_POOL_IDLE_TTL:
+                pool.target = 0
+                self._drain(pool)
+        warmed = sorted(
+            ((key, pool) for key, pool in self._pools.items() if pool.target > 0),
+            key=lambda item: item[1].last_used,
+            reverse=True
+        )
+        for key, pool in warmed[settings.WARM_POOL_MAX_ENVS:]:
+            pool.target = 0
+            self._drain(pool)
+
+    def _drain(self, pool: _EnvPool):
+        while pool.idle:
+            self.discard(pool.idle.popleft())
+
+    @staticmethod
+    def discard(process: subprocess.Popen):
+        """终止解释器并关闭其管道"""
+        try:
+            process.kill()
+            process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        process_reaper.release(process)
+        for stream in (process.stdin, process.stdout, process.stderr):
+            try:
+                if stream and not stream.closed:
+                    stream.close()
+            except OSError:
+                pass
+
+
+# 全局预热解释器池实例
+warm_pool = WarmInterpreterPool()
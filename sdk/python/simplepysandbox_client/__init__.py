@@ -0,0 +1,28 @@
+"""
+SimplePySandbox Python客户端
+
+提供同步 SandboxClient 与异步 AsyncSandboxClient，支持连接复用、HTTP/2、
+大文件multipart上传、流式输出、批量并发执行以及429/503自动重试
+"""
+
+from ._common import (
+    ExecutionResult,
+    RetryPolicy,
+    SandboxError,
+    SandboxHTTPError,
+    StreamEvent,
+)
+from .async_client import AsyncSandboxClient
+from .client import SandboxClient
+
+__version__ = "0.1.0"
+
+__all__ = [
+    "AsyncSandboxClient",
+    "ExecutionResult",
+    "RetryPolicy",
+    "SandboxClient",
+    "SandboxError",
+    "SandboxHTTPError",
+    "StreamEvent",
+]
@@ -0,0 +1,221 @@
+"""
+同步与异步客户端共用的数据结构、请求构造与重试策略
+"""
+
+import base64
+import gzip
+import json
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+import httpx
+
+
+# 文件内容可以是字节、文本或本地文件路径
+FileContent = Union[bytes, str, Path]
+
+# 输入文件总大小超过该值时自动改用multipart上传
+MULTIPART_THRESHOLD = 256 * 1024
+
+# 开启请求压缩时，JSON请求体超过该值才进行gzip压缩
+COMPRESS_THRESHOLD = 1024
+
+RETRY_STATUS_CODES = (429, 503)
+
+
+class SandboxError(Exception):
+    """客户端错误基类"""
+
+
+class SandboxHTTPError(SandboxError):
+    """服务端返回非2xx状态码"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class ExecutionResult:
+    """代码执行结果"""
+    success: bool
+    stdout: str
+    stderr: str
+    execution_time: float
+    files: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExecutionResult":
+        return cls(
+            success=data.get("success", False),
+            stdout=data.get("stdout", ""),
+            stderr=data.get("stderr", ""),
+            execution_time=data.get("execution_time", 0.0),
+            files=data.get("files") or {},
+            error=data.get("error"),
+            raw=data,
+        )
+
+    def file_bytes(self, name: str) -> bytes:
+        """解码输出文件"""
+        return base64.b64decode(self.files[name])
+
+    def __getattr__(self, name: str) -> Any:
+        # 服务端新增的字段（如 timed_out、profile）直接从原始数据读取
+        raw = self.__dict__.get("raw", {})
+        if name in raw:
+            return raw[name]
+        raise AttributeError(name)
+
+
+@dataclass
+class StreamEvent:
+    """流式执行事件"""
+    type: str  # stdout / stderr / result
+    data: str = ""
+    result: Optional[ExecutionResult] = None
+
+
+@dataclass
+class RetryPolicy:
+    """
+    重试策略
+
+    仅在服务端明确表示暂时不可用（429/503）或连接未建立时重试，
+    这两种情况下请求都不会被执行，重试不会导致重复执行
+    """
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """计算第 attempt 次重试前的等待时间，优先遵循Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        backoff = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        # 全抖动，避免大量客户端同时重试
+        return random.uniform(0, backoff)
+
+    def should_retry(self, attempt: int, response: Optional[httpx.Response] = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+
+def read_file_content(content: FileContent) -> bytes:
+    """读取文件内容为字节"""
+    if isinstance(content, Path):
+        return content.read_bytes()
+    if isinstance(content, str):
+        return content.encode("utf-8")
+    return content
+
+
+def build_request(
+    code: str,
+    timeout: int,
+    files: Optional[Mapping[str, FileContent]],
+    environment: Optional[str],
+    multipart: Optional[bool],
+    options: Dict[str, Any],
+    compress: bool = False
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    构造执行请求
+
+    Returns:
+        tuple: (请求路径, httpx请求参数)
+    """
+    blobs = {name: read_file_content(content) for name, content in (files or {}).items()}
+    if multipart is None:
+        multipart = sum(len(b) for b in blobs.values()) > MULTIPART_THRESHOLD and not options
+
+    if multipart and blobs:
+        if options:
+            raise SandboxError(f"multipart上传不支持选项: {', '.join(options)}")
+        data = {"code": code, "timeout": str(timeout)}
+        if environment:
+            data["environment"] = environment
+        upload = [("files", (name, blob, "application/octet-stream")) for name, blob in blobs.items()]
+        return "/execute/upload", {"data": data, "files": upload}
+
+    payload: Dict[str, Any] = {"code": code, "timeout": timeout}
+    if blobs:
+        payload["files"] = {name: base64.b64encode(blob).decode("utf-8") for name, blob in blobs.items()}
+    if environment:
+        payload["environment"] = environment
+    payload.update(options)
+    return "/execute", encode_json(payload, compress)
+
+
+def encode_json(payload: Dict[str, Any], compress: bool) -> Dict[str, Any]:
+    """编码JSON请求体，开启压缩且体积较大时使用gzip"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if compress and len(body) > COMPRESS_THRESHOLD:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return {"content": body, "headers": headers}
+
+
+def build_stream_request(
+    code: str,
+    timeout: int,
+    files: Optional[Mapping[str, FileContent]],
+    environment: Optional[str],
+    options: Dict[str, Any],
+    compress: bool = False
+) -> Dict[str, Any]:
+    """构造流式执行请求参数"""
+    _, kwargs = build_request(code, timeout, files, environment, False, options, compress)
+    return kwargs
+
+
+def parse_event(line: str) -> Optional[StreamEvent]:
+    """解析一行NDJSON事件"""
+    if not line.strip():
+        return None
+    event = json.loads(line)
+    if event.get("type") == "result":
+        return StreamEvent(type="result", result=ExecutionResult.from_dict(event["result"]))
+    return StreamEvent(type=event.get("type", ""), data=event.get("data", ""))
+
+
+def raise_for_status(response: httpx.Response):
+    """非2xx时抛出 SandboxHTTPError"""
+    if response.is_success:
+        return
+    try:
+        detail = response.json().get("detail", response.text)
+    except ValueError:
+        detail = response.text
+    raise SandboxHTTPError(response.status_code, detail)
+
+
+def normalize_job(job: Union[str, Mapping[str, Any]]) -> Dict[str, Any]:
+    """map() 的任务既可以是代码字符串，也可以是 execute() 的参数字典"""
+    if isinstance(job, str):
+        return {"code": job}
+    return dict(job)
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def make_limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
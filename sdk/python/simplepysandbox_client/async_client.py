@@ -0,0 +1,179 @@
+"""
+异步客户端
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Union
+
+import httpx
+
+from ._common import (
+    ExecutionResult, FileContent, RetryPolicy, StreamEvent,
+    build_request, build_stream_request, http2_available, make_limits,
+    normalize_job, parse_event, raise_for_status
+)
+
+
+class AsyncSandboxClient:
+    """
+    SimplePySandbox 异步客户端
+
+    适合在单个事件循环中以高并发提交大量代码片段；安装 h2 后默认启用HTTP/2。
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        max_connections: int = 64,
+        http2: Optional[bool] = None,
+        retry: Optional[RetryPolicy] = None,
+        timeout_margin: float = 30.0,
+        compress_requests: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            base_url: 服务地址
+            max_connections: 连接池大小
+            http2: 是否启用HTTP/2，默认在安装了 h2 时启用
+            retry: 重试策略
+            timeout_margin: HTTP读取超时 = 代码执行超时 + timeout_margin
+            compress_requests: 是否gzip压缩较大的JSON请求体（如base64输入文件）
+            headers: 附加到每个请求的请求头（如API Key）
+            transport: 自定义传输层（如 httpx.ASGITransport，用于进程内测试）
+        """
+        self.retry = retry or RetryPolicy()
+        self.timeout_margin = timeout_margin
+        self.compress_requests = compress_requests
+        self.max_connections = max_connections
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            http2=http2_available() if http2 is None else http2,
+            limits=make_limits(max_connections),
+            headers=headers,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncSandboxClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """发送请求，在429/503或连接失败时按策略重试"""
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, path, timeout=timeout, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if not self.retry.should_retry(attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+
+            if self.retry.should_retry(attempt, response):
+                await asyncio.sleep(self.retry.delay(attempt, response))
+                attempt += 1
+                continue
+
+            raise_for_status(response)
+            return response
+
+    async def health(self) -> Dict[str, Any]:
+        return (await self._request("GET", "/health")).json()
+
+    async def execute(
+        self,
+        code: str,
+        timeout: int = 30,
+        files: Optional[Mapping[str, FileContent]] = None,
+        environment: Optional[str] = None,
+        multipart: Optional[bool] = None,
+        **options
+    ) -> ExecutionResult:
+        """
+        执行代码
+
+        Args:
+            code: Python代码
+            timeout: 执行超时（秒）
+            files: 输入文件，值可以是bytes、str或Path
+            environment: 执行环境
+            multipart: 是否以multipart上传文件，默认在文件总大小较大时自动启用
+            **options: 其他请求字段，如 profile、soft_timeout
+
+        Returns:
+            ExecutionResult: 执行结果
+        """
+        path, kwargs = build_request(
+            code, timeout, files, environment, multipart, options, self.compress_requests
+        )
+        response = await self._request("POST", path, timeout=timeout + self.timeout_margin, **kwargs)
+        return ExecutionResult.from_dict(response.json())
+
+    async def execute_stream(
+        self,
+        code: str,
+        timeout: int = 30,
+        files: Optional[Mapping[str, FileContent]] = None,
+        environment: Optional[str] = None,
+        **options
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        执行代码并实时获取输出
+
+        Yields:
+            StreamEvent: stdout/stderr 事件，最后一个为 result 事件
+        """
+        request_kwargs = build_stream_request(code, timeout, files, environment, options, self.compress_requests)
+        async with self._client.stream(
+            "POST", "/execute/stream", timeout=timeout + self.timeout_margin, **request_kwargs
+        ) as response:
+            if not response.is_success:
+                await response.aread()
+                raise_for_status(response)
+            async for line in response.aiter_lines():
+                event = parse_event(line)
+                if event is not None:
+                    yield event
+
+    async def map(
+        self,
+        jobs: Iterable[Union[str, Mapping[str, Any]]],
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False
+    ) -> List[Union[ExecutionResult, BaseException]]:
+        """
+        以有界并发执行多个任务，结果顺序与输入一致
+
+        Args:
+            jobs: 代码字符串或 execute() 参数字典
+            concurrency: 最大并发数，默认等于连接池大小
+            return_exceptions: 为True时把异常放入结果列表，而不是直接抛出
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.max_connections)
+
+        async def run(job: Dict[str, Any]):
+            async with semaphore:
+                return await self.execute(**job)
+
+        return await asyncio.gather(
+            *(run(normalize_job(job)) for job in jobs),
+            return_exceptions=return_exceptions
+        )
+
+    async def list_environments(self) -> Dict[str, Any]:
+        return (await self._request("GET", "/environments")).json()
+
+    async def get_environment(self, name: str) -> Dict[str, Any]:
+        return (await self._request("GET", f"/environments/{name}")).json()
+
+    async def download_output(self, output_id: str, stream: str = "stdout") -> bytes:
+        """下载被截断的完整输出"""
+        return (await self._request("GET", f"/outputs/{output_id}/{stream}")).content